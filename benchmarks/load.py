@@ -0,0 +1,140 @@
+"""
+Load generator for the JSON service (src/service.py): throughput and latency percentiles against localhost.
+
+    python benchmarks/load.py [--spawn] [--port 8000] [--concurrency 32] [--requests 2000] [--samples 2000]
+                              [--repeat-fraction 0.0] [--output load.json]
+
+Each of --concurrency clients keeps one HTTP/1.1 connection open and sends POST /simulate requests back to back
+until --requests have been sent in total. Scenarios are drawn at random (house price, rent, deposit and the
+interest rate mean); a --repeat-fraction of them repeat one of a small set of scenarios, to measure the
+response cache. With --spawn the service is started in a subprocess with --window-ms and --max-batch and stopped
+at the end; otherwise one must already be listening on --host/--port. The service's /stats (batch sizes, cache
+hits) are printed with the results.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+def make_scenario(rng):
+    house_price = int(rng.integers(150, 1000)) * 1000
+    return {'house_price': house_price,
+            'monthly_rent': int(house_price * rng.uniform(0.03, 0.055) / 12),
+            'deposit': int(house_price * rng.uniform(0.1, 0.6)),
+            'mortgage_interest_annual_mean': round(float(rng.uniform(0.03, 0.07)), 4)}
+
+async def request(reader, writer, host, method, path, payload = None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write((f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                  f'Content-Length: {len(body)}\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def client(host, port, payloads, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while payloads:
+            payload = payloads.pop()
+            tic = time.perf_counter()
+            status, response = await request(reader, writer, host, 'POST', '/simulate', payload)
+            latencies.append(time.perf_counter() - tic)
+            if status != 200:
+                errors.append(response.get('error', status))
+    finally:
+        writer.close()
+
+async def get(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await request(reader, writer, host, 'GET', path))[1]
+    finally:
+        writer.close()
+
+async def wait_until_up(host, port, timeout = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await get(host, port, '/health')
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+async def run_load(host, port, concurrency, n_requests, n_samples, repeat_fraction, seed):
+    rng = np.random.default_rng(seed)
+    repeated = [make_scenario(rng) for _ in range(8)]
+    payloads = [{'scenario': repeated[rng.integers(len(repeated))] if rng.random() < repeat_fraction else make_scenario(rng),
+                 'n_samples': n_samples}
+                for _ in range(n_requests)]
+    latencies, errors = [], []
+    tic = time.perf_counter()
+    await asyncio.gather(*[client(host, port, payloads, latencies, errors) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - tic
+    latencies = np.array(latencies) * 1000
+    return {'requests': n_requests, 'concurrency': concurrency, 'n_samples': n_samples, 'repeat_fraction': repeat_fraction,
+            'errors': len(errors), 'first_error': errors[0] if errors else None,
+            'seconds': elapsed, 'throughput': n_requests / elapsed,
+            'latency_ms': {f'p{q}': float(np.percentile(latencies, q)) for q in (50, 90, 95, 99)} | {'max': float(latencies.max())},
+            'server': await get(host, port, '/stats')}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--spawn', action='store_true', help='Start the service for the run.')
+    parser.add_argument('--window-ms', type=float, default=5.0, help='Passed to a spawned service.')
+    parser.add_argument('--max-batch', type=int, default=64, help='Passed to a spawned service.')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--samples', type=int, default=2000, help='n_samples of every request.')
+    parser.add_argument('--repeat-fraction', type=float, default=0.0, help='Share of requests repeating an earlier scenario.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.join(SRC, 'service.py'), '--host', args.host, '--port', str(args.port),
+                                   '--window-ms', str(args.window_ms), '--max-batch', str(args.max_batch)],
+                                  stdout=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_until_up(args.host, args.port))
+        results = asyncio.run(run_load(args.host, args.port, args.concurrency, args.requests, args.samples,
+                                       args.repeat_fraction, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latency = results['latency_ms']
+    print(f"{results['requests']} requests, {results['concurrency']} clients, {results['n_samples']} samples each: "
+          f"{results['throughput']:.1f} req/s, {results['errors']} errors")
+    print(f"latency (ms): p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  p95 {latency['p95']:.1f}  "
+          f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    server_stats = results['server']
+    print(f"server: {server_stats['batches']} batches, mean batch size {server_stats['mean_batch_size']:.1f}, "
+          f"{server_stats['cache_hits']} cache hits, {server_stats['inflight_hits']} in-flight hits")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if results['errors']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
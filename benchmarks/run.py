@@ -0,0 +1,229 @@
+"""
+Timing benchmarks of the model, sampling, statistics and rendering hot paths, and of a full app rerun.
+
+    python benchmarks/run.py [--cases model percentiles ...] [--max-size 1000000] [--output results.json]
+                             [--compare baseline.json] [--threshold 0.2]
+
+Every case is timed at sample counts from 10^2 to 10^7 (capped by --max-size and by the case itself), repeating
+until --min-time seconds have been spent or --max-repeats is reached, and the min, median and mean are reported.
+With --compare, cases whose median is more than --threshold slower than in the baseline file are flagged as
+regressions and the exit code is 1. Everything runs offline: streamlit calls outside `streamlit run` only log
+warnings (to stderr, add 2>/dev/null to hide them), and the app case uses streamlit's AppTest harness, which needs
+streamlit 1.28 or later; with an older streamlit that case is skipped.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from core import Buy_or_Rent_Model
+from core.sampling import PARAM_NAMES, draw_samples, sample_param_distribution
+from core.stats import calculate_percentiles, summarize_npv
+
+SIZES = [10**k for k in range(2, 8)]
+SEED = 0
+
+def make_model():
+    # the app defaults
+    model = Buy_or_Rent_Model()
+    model.HOUSE_PRICE = 300000
+    model.DEPOSIT_MULT = 0.4
+    model.RENTAL_YIELD = 0.043
+    model.ANNUAL_SALARY = 20000
+    return model
+
+def make_pools(pool_size = 500):
+    rng = np.random.default_rng(SEED)
+    return {'mortgage_interest_annual': sample_param_distribution(0.055, 0.012, pool_size, rng=rng),
+            'property_price_growth_annual': sample_param_distribution(0.03, 0.01, pool_size, rng=rng),
+            'rent_increase': sample_param_distribution(0.02, 0.01, pool_size, rng=rng),
+            'investment_return_annual': sample_param_distribution(0.06, 0.02, pool_size, rng=rng),
+            'years_until_sell': sample_param_distribution(15, 5, pool_size, as_int=True, rng=rng)}
+
+def npv_samples(n):
+    return make_model().run_batch(**draw_samples(n, make_pools(), np.random.default_rng(SEED)))['buying_npv']
+
+# Each case maps a sample count to a zero-argument function to time; the setup is not timed.
+
+def case_model(n):
+    model = make_model()
+    samples = draw_samples(n, make_pools(), np.random.default_rng(SEED))
+    return lambda: model.run_batch(**samples)
+
+def case_model_dedup(n):
+    # zero-sd rates and an integer horizon, evaluated once per distinct combination (compare with model_repeated)
+    from core.factors import FactorTable, run_dedup
+    model = make_model()
+    samples = {name: np.full(n, value) for name, value in zip(PARAM_NAMES, [0.02, 0.03, 0.055, 0.06])}
+    samples['years_until_sell'] = np.random.default_rng(SEED).integers(5, 30, n)
+    table = FactorTable()
+    return lambda: run_dedup(model, samples, table = table)
+
+def case_model_repeated(n):
+    # the same samples as model_dedup, through the plain batch evaluation
+    model = make_model()
+    samples = {name: np.full(n, value) for name, value in zip(PARAM_NAMES, [0.02, 0.03, 0.055, 0.06])}
+    samples['years_until_sell'] = np.random.default_rng(SEED).integers(5, 30, n)
+    return lambda: model.run_batch(**samples)
+
+def case_model_scalar(n):
+    # run_calculations on one scenario, n times: the cost of the Python overhead per call
+    model = make_model()
+    def run():
+        for _ in range(n):
+            model.run_calculations()
+    return run
+
+def case_sampling(n):
+    pools = make_pools()
+    return lambda: draw_samples(n, pools, np.random.default_rng(SEED))
+
+def case_distribution_sampling(n):
+    # drawing straight from the distributions into preallocated arrays, instead of resampling pools
+    from core.scenario import make_distributions, resolve_scenario
+    distributions = make_distributions(resolve_scenario({}))
+    out = {name: np.empty(n, dtype=distributions[name].dtype) for name in PARAM_NAMES}
+    return lambda: draw_samples(n, distributions, np.random.default_rng(SEED), out=out)
+
+def case_param_distribution(n):
+    # the sidebar plot of a distribution, which does not depend on n
+    from utils.general import get_param_distribution
+    return lambda: get_param_distribution(0.03, 0.01, title='Property Price Growth')
+
+def case_percentiles(n):
+    npv = npv_samples(n)
+    return lambda: calculate_percentiles(npv, 120000)
+
+def case_summary(n):
+    npv = npv_samples(n)
+    return lambda: summarize_npv(npv, 120000)
+
+def case_kde_plot(n):
+    import streamlit as st
+    from main import plot_kde_from_list
+    npv = npv_samples(n)
+    return lambda: plot_kde_from_list([npv], st, legends=['Buying is better', 'Renting is better'], main_colors=['blue'], secondary_color='orange')
+
+def case_simulation(n):
+    from main import generate_combinations_and_calculate_npv
+    pools = make_pools()
+    model = make_model()
+    # no seed, so nothing is served from cache
+    return lambda: generate_combinations_and_calculate_npv(n, model, **{f'{name}_list': pools[name] for name in PARAM_NAMES})
+
+def case_app(n):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(SRC, 'app.py'), default_timeout=600)
+    app.run()
+    slider = next(slider for slider in app.sidebar.slider if slider.label == 'Number of Simulation Samples:')
+    slider.set_value(n)
+    app.run()
+    # a rerun with unchanged inputs, what every widget interaction elsewhere on the page costs
+    return lambda: app.run()
+
+# name -> (function, largest sample count it is run at)
+CASES = {'model': (case_model, 10**7),
+         'model_dedup': (case_model_dedup, 10**7),
+         'model_repeated': (case_model_repeated, 10**7),
+         'model_scalar': (case_model_scalar, 10**4),
+         'sampling': (case_sampling, 10**7),
+         'distribution_sampling': (case_distribution_sampling, 10**7),
+         'param_distribution': (case_param_distribution, 10**2),
+         'percentiles': (case_percentiles, 10**7),
+         'summary': (case_summary, 10**7),
+         'kde_plot': (case_kde_plot, 10**7),
+         'simulation': (case_simulation, 10**7),
+         'app_rerun': (case_app, 10**6)}
+
+def time_case(function, min_time, max_repeats):
+    # one untimed call first, so lazy imports and first-touch allocations are not counted
+    function()
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < max_repeats and (len(timings) < 3 or time.perf_counter() - start < min_time):
+        tic = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - tic)
+    return timings
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SRC, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+def compare(results, baseline, threshold):
+    """
+    Cases at least `threshold` (a fraction) slower than in the baseline, by median time.
+    """
+    baseline_medians = {(row['case'], row['n']): row['median'] for row in baseline['results']}
+    regressions = []
+    for row in results:
+        before = baseline_medians.get((row['case'], row['n']))
+        if before is not None and row['median'] > before * (1 + threshold):
+            regressions.append({'case': row['case'], 'n': row['n'], 'baseline': before, 'median': row['median'],
+                                'slowdown': row['median'] / before - 1})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--max-size', type=int, default=max(SIZES))
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds to spend repeating each measurement.')
+    parser.add_argument('--max-repeats', type=int, default=50)
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', help='JSON file of an earlier run to check for regressions.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown (as a fraction) reported as a regression.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+
+    results = []
+    print(f"{'case':<20}{'n':>10}{'repeats':>9}{'min (s)':>12}{'median (s)':>12}")
+    for name in args.cases:
+        function, case_max_size = CASES[name]
+        for n in args.sizes:
+            if n > min(case_max_size, args.max_size):
+                continue
+            try:
+                timings = time_case(function(n), args.min_time, args.max_repeats)
+            except ImportError as error:
+                print(f'{name:<20}{n:>10}  skipped: {error}')
+                break
+            row = {'case': name, 'n': n, 'repeats': len(timings), 'min': min(timings),
+                   'median': float(np.median(timings)), 'mean': float(np.mean(timings))}
+            results.append(row)
+            print(f"{name:<20}{n:>10}{row['repeats']:>9}{row['min']:>12.4f}{row['median']:>12.4f}")
+
+    output = {'metadata': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']} n={regression['n']}: {regression['baseline']:.4f}s -> "
+                  f"{regression['median']:.4f}s (+{regression['slowdown']:.0%})")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Error versus sample count for each sampler of the uncertain parameters.
+
+    python benchmarks/samplers.py [--repeats 20] [--output samplers.json]
+
+For every sampler and sample count the simulation is repeated with different seeds and the root mean square
+error of the NPV percentiles and of P(NPV > 0) is measured against a reference run with many more samples.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from core import Buy_or_Rent_Model
+from core.sampling import sample_parameters
+
+# the app defaults
+SPECS = {'mortgage_interest_annual': (0.055, 0.012, False),
+         'property_price_growth_annual': (0.03, 0.01, False),
+         'rent_increase': (0.02, 0.01, False),
+         'investment_return_annual': (0.06, 0.02, False),
+         'years_until_sell': (15, 5, True)}
+SAMPLERS = [('random', False), ('random', True), ('lhs', False), ('lhs', True), ('sobol', False), ('halton', False)]
+PERCENTILES = [10, 50, 90]
+
+def make_model():
+    model = Buy_or_Rent_Model()
+    model.HOUSE_PRICE = 300000
+    model.DEPOSIT_MULT = 0.4
+    model.RENTAL_YIELD = 0.043
+    model.ANNUAL_SALARY = 20000
+    return model
+
+def npv_statistics(n_samples, method, antithetic, seed):
+    samples = sample_parameters(n_samples, SPECS, method, antithetic, np.random.default_rng(seed))
+    npv = make_model().run_batch(**samples)['buying_npv']
+    return np.append(np.percentile(npv, PERCENTILES), np.mean(npv > 0))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--reference-samples', type=int, default=2**23)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2**k for k in range(8, 17, 2)])
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    reference = npv_statistics(args.reference_samples, 'sobol', False, 0)
+    rows = []
+    print(f"{'sampler':<20}{'n':>8}" + ''.join(f'{f"P{p} RMSE":>14}' for p in PERCENTILES) + f"{'P(NPV>0) RMSE':>16}")
+    for method, antithetic in SAMPLERS:
+        name = method + (' + antithetic' if antithetic else '')
+        for n_samples in args.sizes:
+            estimates = np.array([npv_statistics(n_samples, method, antithetic, seed) for seed in range(1, args.repeats + 1)])
+            rmse = np.sqrt(np.mean((estimates - reference)**2, axis=0))
+            rows.append({'sampler': name, 'n_samples': n_samples,
+                         'percentile_rmse': dict(zip(map(str, PERCENTILES), rmse[:-1].tolist())),
+                         'prob_buy_better_rmse': rmse[-1]})
+            print(f'{name:<20}{n_samples:>8}' + ''.join(f'{value:>14,.0f}' for value in rmse[:-1]) + f'{rmse[-1]:>16.4f}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'reference_samples': args.reference_samples, 'repeats': args.repeats, 'results': rows}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,19 @@
 import streamlit as st
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from main import Buy_or_Rent_Model, generate_combinations_and_calculate_npv, graph_kde_plots
+from core.scenario import resolve_scenario, build_model
+from core.tax import DEFAULT_TAX_YEAR, TAX_YEARS
+from core.cache import get_default_cache
+from core.graph import IncrementalModel
+from core.profiling import start_profiling, span
+from core.optimize import OBJECTIVES
+from main import generate_combinations_and_calculate_npv, graph_kde_plots, display_sensitivity_indices, display_breakeven, display_financing_optimizer, display_export
 from utils.general import get_param_distribution
 # from utils.ga import add_analytics_tag
 
 # # Google Analytics for usage tracking, no personal data is collected
 # add_analytics_tag()
+# timing spans of this rerun, shown in the sidebar and logged as JSON when BUY_OR_RENT_PROFILE is set
+profiler = start_profiling()
 # Streamlit app title
 st.title('Open Source UK Buy or Rent Simulation Model')
 st.write("---")
@@ -16,10 +22,12 @@ st.write("Not sure whether it is financially better to buy a property or rent an
 st.markdown("***This app is currently in Beta. It assumes that you are in England, UK. Different countries may have different tax rules. No data is collected by this app. The source code can be found at: https://github.com/edisonymy/buy_or_rent***")
 st.write("---")
 
-n_samples = 500
-n_bins = 30
-
-np.random.seed(123)
+seed = 123
+# shared across reruns and sessions of this server process, see core.cache for the disk tier
+cache = get_default_cache()
+# samples and intermediate results of this session's last simulation, so an edit only recomputes what it affects
+if 'incremental_model' not in st.session_state:
+    st.session_state['incremental_model'] = IncrementalModel()
 
 # User-enterable parameters for data generation
 st.subheader('Your Assumptions')
@@ -49,76 +57,156 @@ st.sidebar.subheader('Additional Parameters:')
 stamp_duty_bol = st.sidebar.checkbox('I pay Stamp Duty.', value = False, help="Stamp Duty (UK): A tax paid by the buyer when purchasing property in the United Kingdom. The amount of Stamp Duty depends on the property's purchase price and may include additional rates for second homes and buy-to-let properties.") 
 cgt_bol = st.sidebar.checkbox('I pay capital gains tax on the property.', value = False, help = "Capital Gains Tax (CGT): A tax levied on the profit (capital gain) made from the sale or disposal of assets such as property, investments, or valuable possessions. The amount of CGT owed is typically calculated based on the difference between the purchase price and the selling price of the asset. Different rates may apply to individuals and businesses, and there are often exemptions and allowances that can reduce the taxable amount.")
 cgt_investment_bol = st.sidebar.checkbox('I pay capital gains tax on the investment.', value = False, help = "Capital Gains Tax (CGT): A tax levied on the profit (capital gain) made from the sale or disposal of assets such as property, investments, or valuable possessions. The amount of CGT owed is typically calculated based on the difference between the purchase price and the selling price of the asset. Different rates may apply to individuals and businesses, and there are often exemptions and allowances that can reduce the taxable amount.")
+tax_year = st.sidebar.selectbox('Tax year:', TAX_YEARS, index = TAX_YEARS.index(DEFAULT_TAX_YEAR), help="Stamp Duty and Capital Gains Tax rates, bands and allowances in force at the start of this tax year.")
+buyer_types = {'Standard': 'standard', 'First-time buyer': 'first_time_buyer', 'Additional property': 'additional'}
+buyer_type = buyer_types[st.sidebar.selectbox('Buyer type (for Stamp Duty):', list(buyer_types), help="First-time buyers get relief on homes up to a price limit; second homes and buy-to-let properties pay a surcharge on every band.")]
 ongoing_cost = st.sidebar.number_input("Annual combined maintenance and service charge:", value=int(house_price*0.006), step = 100, help="The total annual cost associated with maintaining and servicing a property, including expenses such as property management fees, maintenance fees, and other related charges.")
 buying_cost = st.sidebar.number_input("Buying cost (excluding stamp duty):", value=3000, step = 100, help="This includes laywer's fee, mortgage lender fees, surveyor's fee, valuation fees and other fees you expect to pay at the time of purchase.")
 annual_income = st.sidebar.number_input("Annual Salary", value=20000, step = 100, help="This should be set to the expected salary at time of sale, required to calculate capital gains tax.")
 selling_cost_no_cgt = st.sidebar.number_input("Selling cost (excluding Capital Gains Tax):", value=int(house_price*0.02), step = 100, help= "Total expense incurred when selling a property. This typically include real estate agent commissions, legal fees, advertising expenses, and any necessary repairs or renovations to prepare the property for sale.")
 inflation = st.sidebar.number_input('Inflation:', min_value=0.0, max_value=1.0, value=0.02, step = 0.001, format="%.3f", help="Used for inflation adjustment only. It does not affect the model.")
+st.sidebar.subheader('Mortgage:')
+mortgage_models = {'Annual, one rate for the whole term': 'annual', 'Monthly, with fixed-rate deals and overpayments': 'monthly'}
+mortgage_model = mortgage_models[st.sidebar.selectbox('Repayment model:', list(mortgage_models), help="The annual model treats the mortgage as one yearly annuity at the simulated rate. The monthly model repays it month by month: a first fixed-rate deal at today's rate, then a new deal at the simulated rate every few years, optional overpayments, and the outstanding balance repaid when the property is sold.")]
+mortgage_fixed_years, mortgage_initial_rate, remortgage_fee, monthly_overpayment = 0, None, 0, 0
+if mortgage_model == 'monthly':
+    mortgage_fixed_years = st.sidebar.slider('Fixed-rate deal length (years):', min_value=0, max_value=10, value=5, help="You remortgage at the end of every deal. 0 for a single rate over the whole term.")
+    if mortgage_fixed_years > 0:
+        mortgage_initial_rate = st.sidebar.number_input('Rate of the first deal:', min_value=0.0, max_value=0.2, value=0.045, step=0.001, format="%.3f", help="Today's fixed-rate offer. Later deals are at the simulated mortgage interest rate set below.")
+        remortgage_fee = st.sidebar.number_input('Fee per remortgage:', min_value=0, value=999, step=100)
+    monthly_overpayment = st.sidebar.number_input('Monthly overpayment:', min_value=0, value=0, step=50, help="Paid on top of the monthly payment until the mortgage is cleared. Payments are recalculated, lower, at each remortgage.")
 # uncertain parameters
 st.sidebar.subheader('Advanced Model Parameters:')
 st.sidebar.write("It's hard to predict the future, so this section allows the simulations to reflect your uncertainty. The more uncertain you are about a paramter, the higher the standard deviation (sd) you should assume.")
+distribution_shapes = {'Normal': 'normal', 'Truncated normal (no negative values)': 'truncated_normal', 'Lognormal (positive, skewed to the right)': 'lognormal', 'Triangular (bounded)': 'triangular'}
+distribution_shape = distribution_shapes[st.sidebar.selectbox('Shape of the distributions:', list(distribution_shapes), help="All the parameters below are drawn from distributions of this shape with the chosen mean and sd.")]
 mortgage_interest_annual_mean = st.sidebar.slider('Mortgage Interest Rate Mean:', min_value=0.01, max_value=0.1, value=0.055, step = 0.001, format="%.3f")
 mortgage_interest_annual_std = st.sidebar.slider('Mortgage Interest Rate sd:', min_value=0.0, max_value=0.1, value=0.012, step = 0.001, format="%.3f")
 text = 'Check out historical mortgage rates here: https://tradingeconomics.com/united-kingdom/mortgage-rate'
 st.sidebar.markdown(f"<span style='font-size: 11px;'>{text}</span>", unsafe_allow_html=True)
-mortgage_interest_annual_list = get_param_distribution(mortgage_interest_annual_mean, mortgage_interest_annual_std, n_samples, n_bins, title ='Assumed Distribution for Average Mortgage Interest Rate')
+mortgage_interest_annual_distribution = get_param_distribution(mortgage_interest_annual_mean, mortgage_interest_annual_std, distribution_shape, title ='Assumed Distribution for Average Mortgage Interest Rate', cache = cache)
 st.sidebar.write("---")
 property_price_growth_annual_mean = st.sidebar.slider('Property Price Growth Mean:', min_value=0.01, max_value=0.1, value=0.03, step = 0.001, format="%.3f")
 property_price_growth_annual_std = st.sidebar.slider('Property Price Growth sd:', min_value=0.0, max_value=0.05, value=0.01, step = 0.001, format="%.3f")
 text = 'Check out historical property price growth here: https://www.ons.gov.uk/economy/inflationandpriceindices/bulletins/housepriceindex/june2023'
 st.sidebar.markdown(f"<span style='font-size: 11px;'>{text}</span>", unsafe_allow_html=True)
-property_price_growth_annual_list = get_param_distribution(property_price_growth_annual_mean, property_price_growth_annual_std, n_samples, n_bins, title ='Assumed Distribution for Annual Property Value Growth')
+property_price_growth_annual_distribution = get_param_distribution(property_price_growth_annual_mean, property_price_growth_annual_std, distribution_shape, title ='Assumed Distribution for Annual Property Value Growth', cache = cache)
 st.sidebar.write("---")
 rent_increase_mean = st.sidebar.slider('Rent Increase Mean:', min_value=0.01, max_value=0.1, value=0.02, step = 0.001, format="%.3f")
 rent_increase_std = st.sidebar.slider('Rent Increase sd:', min_value=0.0, max_value=0.05, value=0.01, step = 0.001, format="%.3f")
 text = 'Checkout historical rent increases here: https://www.ons.gov.uk/economy/inflationandpriceindices/bulletins/indexofprivatehousingrentalprices/july2023'
 st.sidebar.markdown(f"<span style='font-size: 11px;'>{text}</span>", unsafe_allow_html=True)
-rent_increase_list = get_param_distribution(rent_increase_mean, rent_increase_std, n_samples, n_bins, title ='Assumed Distribution for Average Annual Rent Increase')
+rent_increase_distribution = get_param_distribution(rent_increase_mean, rent_increase_std, distribution_shape, title ='Assumed Distribution for Average Annual Rent Increase', cache = cache)
 st.sidebar.write("---")
 investment_return_annual_mean = st.sidebar.slider('Investment Return Mean:', min_value=0.01, max_value=0.2, value=0.06, step = 0.001, format="%.3f")
 investment_return_annual_std = st.sidebar.slider('Investment Return sd:', min_value=0.0, max_value=0.05, value=0.02, step = 0.001, format="%.3f")
 text = 'Check out historical stock market returns here: https://www.investopedia.com/ask/answers/042415/what-average-annual-return-sp-500.asp'
 st.sidebar.markdown(f"<span style='font-size: 11px;'>{text}</span>", unsafe_allow_html=True)
-investment_return_annual_list = get_param_distribution(investment_return_annual_mean, investment_return_annual_std, n_samples, n_bins, title ='Assumed Distribution for Average Investment Rate of Return')
+investment_return_annual_distribution = get_param_distribution(investment_return_annual_mean, investment_return_annual_std, distribution_shape, title ='Assumed Distribution for Average Investment Rate of Return', cache = cache)
 st.sidebar.write("---")
 years_until_sell_mean = st.sidebar.slider('Years Until Sell Mean:', min_value=0, max_value=100, value=15)
 years_until_sell_std = st.sidebar.slider('Years Until Sell sd:', min_value=0, max_value=10, value=5)
-years_until_sell_list = get_param_distribution(years_until_sell_mean, years_until_sell_std, n_samples, n_bins, as_int=True, title ='Assumed Distribution for Years Until Property Is Sold')
+years_until_sell_distribution = get_param_distribution(years_until_sell_mean, years_until_sell_std, distribution_shape, as_int=True, title ='Assumed Distribution for Years Until Property Is Sold', cache = cache)
 st.sidebar.write("---")
 # n_samples = st.sidebar.slider('Number of Samples:', min_value=100, max_value=50000, value=10000)
 # n_bins = st.sidebar.slider('Number of Bins:', min_value=10, max_value=100, value=30)
 st.sidebar.subheader('Simulation Settings:')
-n_samples_simulation = st.sidebar.slider('Number of Simulation Samples:', min_value=100, max_value=10000, value=500)
+engines = {'One rate per simulation': False, 'Rate paths (a new rate every year)': True}
+paths_bool = engines[st.sidebar.selectbox('Simulation engine:', list(engines), help="By default each simulation draws one rate of each kind and keeps it until the sale. With rate paths the mortgage rate, property price growth, rent increase and investment return are drawn again every year around the means set above (normally distributed, with the sd as the year-to-year spread), and the mortgage is re-priced every year. Sensitivity, break-even and optimizer panels still use one rate per simulation.")]
+if paths_bool:
+    persistence = st.sidebar.slider('Rate persistence:', min_value=0.0, max_value=1.0, value=0.8, step=0.05, help="How much of this year's deviation from the mean carries over to next year. 0 draws every year independently, 1 keeps one rate per simulation.")
+    processes = {'mortgage_interest_annual': (mortgage_interest_annual_mean, mortgage_interest_annual_std, persistence),
+                 'property_price_growth_annual': (property_price_growth_annual_mean, property_price_growth_annual_std, persistence),
+                 'rent_increase': (rent_increase_mean, rent_increase_std, persistence),
+                 'investment_return_annual': (investment_return_annual_mean, investment_return_annual_std, persistence)}
+else:
+    processes = None
+adaptive_bool = st.sidebar.toggle('Adaptive number of samples', value=False, disabled=paths_bool, help="Keep drawing samples until the probability that buying is better is known to the chosen precision, or the time limit is reached.") and not paths_bool
+if adaptive_bool:
+    adaptive_precision = st.sidebar.slider('Target precision (± percentage points):', min_value=0.1, max_value=5.0, value=0.5, step=0.1)
+    adaptive_time_budget = st.sidebar.slider('Time limit (seconds):', min_value=1, max_value=30, value=5)
+    adaptive = {'prob_tol': adaptive_precision/100, 'time_budget': adaptive_time_budget}
+    n_samples_simulation = None
+else:
+    adaptive = None
+    # every rate path keeps one value per year, so fewer of them fit in memory
+    n_samples_simulation = st.sidebar.slider('Number of Simulation Samples:', min_value=100, max_value=100000 if paths_bool else 1000000, value=500)
+param_distributions = {'mortgage_interest_annual': mortgage_interest_annual_distribution,
+                       'property_price_growth_annual': property_price_growth_annual_distribution,
+                       'rent_increase': rent_increase_distribution,
+                       'investment_return_annual': investment_return_annual_distribution,
+                       'years_until_sell': years_until_sell_distribution}
+sampling_methods = {'Random': None, 'Latin hypercube': 'lhs', 'Sobol sequence': 'sobol', 'Halton sequence': 'halton'}
+sampling_method = st.sidebar.selectbox('Sampling method:', list(sampling_methods), index=0, disabled=adaptive_bool or paths_bool, help="Latin hypercube and quasi-random (Sobol, Halton) samples cover the parameter distributions more evenly than random samples, so fewer samples are needed for the same accuracy.")
+antithetic = st.sidebar.checkbox('Antithetic variates', value=False, disabled=adaptive_bool or paths_bool, help="Pair every sample with its mirror image around the mean of each parameter, which cancels out some of the sampling noise.")
+if adaptive_bool or paths_bool or (sampling_methods[sampling_method] is None and not antithetic):
+    sampling = None
+else:
+    sampling = {'method': sampling_methods[sampling_method] or 'random',
+                'antithetic': antithetic,
+                'specs': param_distributions}
+
+# Initialize the model, with the same mapping from the inputs as the batch runner (see core.scenario)
+scenario = resolve_scenario({'house_price': house_price,
+                             'monthly_rent': monthly_rent,
+                             'deposit': deposit,
+                             'mortgage_length': mortgage_length,
+                             'mortgage_model': mortgage_model,
+                             'mortgage_fixed_years': mortgage_fixed_years,
+                             'mortgage_initial_rate': mortgage_initial_rate,
+                             'remortgage_fee': remortgage_fee,
+                             'monthly_overpayment': monthly_overpayment,
+                             'stamp_duty_bol': stamp_duty_bol,
+                             'cgt_bol': cgt_bol,
+                             'cgt_investment_bol': cgt_investment_bol,
+                             'tax_year': tax_year,
+                             'buyer_type': buyer_type,
+                             'ongoing_cost': ongoing_cost,
+                             'buying_cost': buying_cost,
+                             'annual_income': annual_income,
+                             'selling_cost': selling_cost_no_cgt,
+                             'inflation': inflation,
+                             'distribution': distribution_shape})
+model = build_model(scenario)
 
-# Initialize the model
-model = Buy_or_Rent_Model()
-model.HOUSE_PRICE = house_price
-model.DEPOSIT_MULT = deposit_mult
-model.RENTAL_YIELD = rental_yield
-model.MORTGAGE_LENGTH = mortgage_length
-model.ANNUAL_SALARY = annual_income
-model.ONGOING_COST_MULT = ongoing_cost/house_price
-model.BUYING_COST_FLAT = buying_cost
-model.STAMP_DUTY_BOL = stamp_duty_bol
-model.CGT_BOL = cgt_bol
-model.CGT_INVESTMENT_BOL = cgt_investment_bol
-model.inflation = inflation
+adjust_for_inflation_bool = st.toggle('Adjust for inflation (2% a year)')
+# use_present_value = st.toggle('Use present value instead of future value')
 
 # Generate combinations and calculate NPV
-percentiles_df, results_df = generate_combinations_and_calculate_npv(
-    n_samples_simulation,
-    model,
-    mortgage_interest_annual_list=mortgage_interest_annual_list,
-    property_price_growth_annual_list=property_price_growth_annual_list,
-    rent_increase_list=rent_increase_list,
-    investment_return_annual_list=investment_return_annual_list,
-    years_until_sell_list=years_until_sell_list
-)
+with span('results'):
+    percentiles_df, results_df = generate_combinations_and_calculate_npv(
+        n_samples_simulation,
+        model,
+        mortgage_interest_annual_list=mortgage_interest_annual_distribution,
+        property_price_growth_annual_list=property_price_growth_annual_distribution,
+        rent_increase_list=rent_increase_distribution,
+        investment_return_annual_list=investment_return_annual_distribution,
+        years_until_sell_list=years_until_sell_distribution,
+        adjust_for_inflation_bool=adjust_for_inflation_bool,
+        seed=seed,
+        cache=cache,
+        adaptive=adaptive,
+        sampling=sampling,
+        incremental=st.session_state['incremental_model'],
+        processes=processes
+    )
 
 # Display the results DataFrame
 # st.subheader('Correlations Between Parameters and Buying NPV')
-with st.expander('Correlations Between Parameters and Buying NPV', expanded=False):
-    st.write(results_df.corr().iloc[0,1:])
+with st.expander('Sensitivity Analysis: Which Assumptions Matter Most', expanded=False), span('sensitivity'):
+    display_sensitivity_indices(model, param_distributions, adjust_for_inflation_bool=adjust_for_inflation_bool, seed=seed, cache=cache)
+with st.expander('Break-even Analysis: How Much Headroom Is There', expanded=False), span('breakeven'):
+    display_breakeven(model, results_df, adjust_for_inflation_bool=adjust_for_inflation_bool, cache=cache)
+with st.expander('Deposit and Mortgage Length: Which Choice Works Best', expanded=False), span('optimizer'):
+    objective = st.selectbox('Rank choices by:', list(OBJECTIVES), format_func=OBJECTIVES.get)
+    search_prices = st.checkbox('Also try cheaper properties', value=False, help="Search property prices from the minimum below up to the price above, with the rent, maintenance and selling costs scaled to the price.")
+    house_prices = None
+    if search_prices:
+        min_house_price = st.number_input('Lowest property price to try:', min_value=5000, max_value=house_price, value=int(0.8*house_price), step=5000)
+        house_prices = np.linspace(min_house_price, house_price, 5)
+    display_financing_optimizer(model, results_df, objective=objective, house_prices=house_prices, adjust_for_inflation_bool=adjust_for_inflation_bool, cache=cache)
+with st.expander('Export Samples', expanded=False):
+    display_export(results_df, scenario, seed=seed, adjust_for_inflation_bool=adjust_for_inflation_bool)
 
 st.write('---')
 st.write("If you found this useful and want to support me, consider buying me a coffee here:")
@@ -138,3 +226,11 @@ st.components.v1.html(buy_me_a_coffee_html)
 # if plot_button:
 #     FEATURES = ['mortgage_interest_annual', 'property_price_growth_annual', 'rent_increase', 'investment_return_annual', 'years_until_sell']
 #     graph_kde_plots(results_df,FEATURES)
+
+with st.sidebar.expander('Cache statistics', expanded=False):
+    st.write(cache.stats())
+
+if profiler.enabled:
+    with st.sidebar.expander('Profiling', expanded=False):
+        st.write(f"Rerun time: {profiler.elapsed:.3f}s")
+        st.dataframe(profiler.summary(), use_container_width=True)
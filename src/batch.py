@@ -0,0 +1,140 @@
+"""
+Score many scenarios without the app.
+
+    python src/batch.py scenarios.csv --output results.csv [--samples 10000] [--workers 4] [--seed 123]
+
+The input is a CSV or JSONL file with one scenario per row, using the input names of core.scenario
+(house_price, monthly_rent, deposit, stamp_duty_bol, ..., mortgage_interest_annual_mean, ...); missing columns or
+empty cells take the app defaults, and an optional 'id' column is copied to the output. Each scenario is run
+through the same Monte Carlo as the app, in a pool of worker processes, and a summary row is written as soon as
+it is done, so rows come out in completion order (use the 'row' column to restore the input order). The input is
+read lazily and only a bounded number of scenarios is in flight, so memory stays flat however long the input.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from core.factors import FactorTable
+from core.scenario import SUMMARY_PERCENTILES, build_model, make_distributions, resolve_scenario, summarize_scenario
+from core.simulation import run_simulation
+
+OUTPUT_FIELDS = (['row', 'id', 'verdict', 'prob_buy_better', 'prob_buying_fv_higher', 'npv_mean', 'npv_mean_pct']
+                 + [f'npv_p{percentile}' for percentile in SUMMARY_PERCENTILES]
+                 + ['typical_buying_fv', 'typical_renting_fv', 'error'])
+
+# per worker process: the annuity and discount factors do not depend on the house price or the deposit, so scenarios
+# that differ only in those reuse them
+FACTORS = FactorTable()
+
+def parse_value(text):
+    # CSV cells are strings: '' is missing, true/false are flags, numbers are numbers, and anything else is kept
+    # as text for the scenario to fail on with a readable error
+    text = text.strip()
+    if text == '':
+        return None
+    if text.lower() in ('true', 'false'):
+        return text.lower() == 'true'
+    for number in (int, float):
+        try:
+            return number(text)
+        except ValueError:
+            pass
+    return text
+
+def read_scenarios(path):
+    """
+    Yield the scenarios of a CSV or JSONL file (by extension) one at a time.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(f):
+                yield {key: (value if key == 'id' else parse_value(value)) for key, value in row.items()}
+
+def score_scenario(row, scenario, n_samples, seed):
+    """
+    Run the Monte Carlo for one scenario and summarize it the way the app does.
+    """
+    summary = {'row': row, 'id': scenario.get('id')}
+    try:
+        scenario = resolve_scenario(scenario)
+        model = build_model(scenario)
+        distributions = make_distributions(scenario)
+        results = run_simulation(n_samples, model, distributions, adjust_for_inflation_bool = scenario['adjust_for_inflation_bool'], rng = np.random.default_rng(seed), factors = FACTORS)
+    except Exception as error:
+        summary['error'] = f'{type(error).__name__}: {error}'
+        return summary
+    # run_simulation leaves the model at the median parameters, the "typical" scenario behind the app's verdict
+    summary.update(summarize_scenario(results, model.buying_fv, model.renting_fv, model.DEPOSIT))
+    return summary
+
+def run_batch(scenarios, n_samples, seed, n_workers = None, max_pending = None):
+    """
+    Score scenarios in a process pool, yielding summary rows as they complete.
+
+    Args:
+    scenarios (iterable): Scenario dicts, consumed lazily.
+    n_samples (int): Monte Carlo samples per scenario.
+    seed (int): Seed of the samples, the same for every scenario (common random numbers).
+    n_workers (int, optional): Worker processes, defaults to the CPU count. With 1 everything runs in this process.
+    max_pending (int, optional): Scenarios submitted but not yet written, defaults to 4 per worker.
+
+    Yields:
+    dict: One summary row per scenario, with the fields in OUTPUT_FIELDS.
+    """
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1:
+        for row, scenario in enumerate(scenarios):
+            yield score_scenario(row, scenario, n_samples, seed)
+        return
+    max_pending = max_pending or 4 * n_workers
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = set()
+        for row, scenario in enumerate(scenarios):
+            pending.add(executor.submit(score_scenario, row, scenario, n_samples, seed))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='CSV or JSONL file of scenarios.')
+    parser.add_argument('--output', help='CSV or JSONL file (by extension) for the results, JSONL on stdout by default.')
+    parser.add_argument('--samples', type=int, default=10000, help='Monte Carlo samples per scenario.')
+    parser.add_argument('--seed', type=int, default=123, help='The app uses 123.')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.output and args.output.endswith('.csv'):
+            writer = csv.DictWriter(output, fieldnames=OUTPUT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda summary: output.write(json.dumps(summary) + '\n')
+        n_errors = 0
+        for summary in run_batch(read_scenarios(args.input), args.samples, args.seed, args.workers):
+            n_errors += 'error' in summary
+            write(summary)
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+    if n_errors:
+        print(f'{n_errors} scenarios failed, see the error column', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+Headless simulation core of the buy or rent model.
+
+Nothing in this package imports streamlit, matplotlib, seaborn or scipy, and pandas is only imported inside
+the functions that return DataFrames, so the model can run in batch jobs, worker processes and tests.
+Importing the package should stay within IMPORT_TIME_BUDGET seconds (numpy is most of it);
+check with `python -m core.coldstart`.
+"""
+from core.model import Buy_or_Rent_Model
+from core.sampling import PARAM_NAMES, sample_param_distribution, draw_samples
+from core.simulation import run_simulation
+from core.stats import calculate_percentiles, summarize_npv, skew, StreamingStats
+
+IMPORT_TIME_BUDGET = 0.3
@@ -0,0 +1,103 @@
+"""
+Adaptive Monte Carlo: draw batches until the reported statistics are precise enough or time runs out.
+
+run_adaptive is a generator that yields a progress snapshot after every batch, so a UI can show the verdict as
+soon as the first batch is in and refine it while the run continues.
+"""
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from core.sampling import draw_samples
+from core.simulation import run_at_median
+from core.stats import RunningMoments
+
+PERCENTILES = [10, 25, 50, 75, 90]
+
+def percentile_intervals(sorted_values, percentiles, z):
+    """
+    Percentiles with distribution-free confidence intervals from the binomial distribution of order statistics.
+
+    Returns:
+    dict: percentile -> (estimate, lower, upper).
+    """
+    n = sorted_values.size
+    intervals = {}
+    for percentile in percentiles:
+        p = percentile / 100
+        half_width = z * np.sqrt(n * p * (1 - p))
+        lower = int(np.clip(np.floor(n * p - half_width), 0, n - 1))
+        upper = int(np.clip(np.ceil(n * p + half_width), 0, n - 1))
+        intervals[percentile] = (np.percentile(sorted_values, percentile), sorted_values[lower], sorted_values[upper])
+    return intervals
+
+def run_adaptive(model, pools, batch_size = 20000, prob_tol = 0.005, mean_tol = None, percentile_tol = None,
+                 time_budget = 5.0, max_samples = 10**7, confidence = 0.95, adjust_for_inflation_bool = False, rng = None):
+    """
+    Run the simulation in batches until the target precision or the time budget is reached.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters.
+    pools (dict): Maps each name in core.sampling.PARAM_NAMES to its pool of values.
+    batch_size (int): Samples in the first batch. Later batches are half the samples drawn so far, if that is more.
+    prob_tol (float): Target half-width of the confidence interval of P(buying NPV > 0).
+    mean_tol (float, optional): Target half-width (in £) of the confidence interval of the mean NPV.
+    percentile_tol (float, optional): Target half-width (in £) of the intervals of the NPV percentiles.
+    time_budget (float): Seconds after which the run stops even if it has not converged.
+    max_samples (int): Hard cap on the number of samples.
+    confidence (float): Confidence level of all intervals.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    rng (numpy.random.Generator, optional): Random generator, defaults to the global numpy random state.
+
+    Yields:
+    dict: After every batch: 'n_samples', 'elapsed', 'mean' and 'mean_ci', 'prob_buy_better' and 'prob_ci',
+    'percentiles' (percentile -> (estimate, lower, upper)), 'converged' and 'done'. The last snapshot
+    ('done' is True) also has 'results', the same dict run_simulation returns, and leaves the model
+    evaluated at the median parameters.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    start = time.perf_counter()
+    moments = RunningMoments()
+    n_positive = 0
+    batches = []
+    npv = np.empty(0)
+    while True:
+        # later batches grow with the run so the re-sorting and progress updates stay a small share of the work
+        samples = draw_samples(min(max(batch_size, moments.count // 2), max_samples - moments.count), pools, rng)
+        batch = model.run_batch(**samples, adjust_for_inflation_bool = adjust_for_inflation_bool)
+        batch.update(samples)
+        batches.append(batch)
+        moments.update(batch['buying_npv'])
+        n_positive += np.count_nonzero(batch['buying_npv'] > 0)
+        # both parts are already sorted runs, which the stable sort merges in linear time
+        npv = np.sort(np.concatenate([npv, np.sort(batch['buying_npv'])]), kind='stable')
+
+        n = moments.count
+        prob = n_positive / n
+        # Wilson score interval, which behaves when the probability is close to 0 or 1
+        centre = (prob + z**2 / (2 * n)) / (1 + z**2 / n)
+        prob_half_width = z * np.sqrt(prob * (1 - prob) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+        mean_half_width = z * moments.sem
+        percentiles = percentile_intervals(npv, PERCENTILES, z)
+        percentile_half_width = max((upper - lower) / 2 for _, lower, upper in percentiles.values())
+        converged = (prob_half_width <= prob_tol
+                     and (mean_tol is None or mean_half_width <= mean_tol)
+                     and (percentile_tol is None or percentile_half_width <= percentile_tol))
+        elapsed = time.perf_counter() - start
+        done = converged or elapsed >= time_budget or n >= max_samples
+        progress = {'n_samples': n,
+                    'elapsed': elapsed,
+                    'mean': moments.mean,
+                    'mean_ci': (moments.mean - mean_half_width, moments.mean + mean_half_width),
+                    'prob_buy_better': prob,
+                    'prob_ci': (centre - prob_half_width, centre + prob_half_width),
+                    'percentiles': percentiles,
+                    'converged': converged,
+                    'done': done}
+        if done:
+            progress['results'] = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+            run_at_median(model, pools, adjust_for_inflation_bool)
+            yield progress
+            return
+        yield progress
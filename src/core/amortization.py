@@ -0,0 +1,200 @@
+"""
+Monthly repayment mortgage with fixed-rate deals, remortgaging and overpayments, for all simulations at once.
+
+The closed form in Buy_or_Rent_Model.mortgage_calculations treats the mortgage as one annual annuity at a single
+rate over the whole term. Here the balance is rolled forward month by month instead, with every array holding
+one value per simulation: interest accrues at the rate of the current deal, the payment is the level monthly
+payment that clears the balance by the end of the term (recomputed at every remortgage, so overpayments lower
+later payments), overpayments come on top, and when the property is sold the outstanding balance is repaid from
+the sale. The first deal can have its own rate (today's fixed-rate offer); every later deal is at the simulated
+mortgage rate, with a fee per remortgage.
+
+Within a deal the rate and the payment are constant, so the balance follows a geometric recurrence with a closed
+form: method='deals' (the default) jumps from one remortgage to the next, finding where overpayments clear the
+balance or the sale falls inside the deal, in a few vectorized operations per deal over all the simulations.
+method='months' rolls the balance forward one vectorized step per month, the plain recurrence, and is kept as
+the reference. Both keep memory at a few arrays of the simulation count whatever the term; with 5-year deals
+'deals' is about three times faster (10^5 simulations over 420 months: ~0.07s against ~0.25s).
+"""
+import numpy as np
+
+MORTGAGE_MODELS = ['annual', 'monthly']
+
+def monthly_payment(balance, monthly_rate, n_months):
+    """
+    Level payment that repays balance over n_months at monthly_rate (element-wise, 0% rates allowed).
+    """
+    n_months = np.maximum(n_months, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = balance * monthly_rate / -np.expm1(-n_months * np.log1p(monthly_rate))
+    return np.where(monthly_rate == 0, balance / n_months, payment)
+
+def amortize(principal, mortgage_rate, term_years, years_until_sell, discount_rate, fixed_years = 0, initial_rate = np.nan,
+             remortgage_fee = 0, monthly_overpayment = 0, method = 'deals', chunk_size = 2**14):
+    """
+    Roll a repayment mortgage forward month by month until the end of the term or the sale, element-wise over
+    broadcastable arguments (one value per simulation).
+
+    Args:
+    principal (float or numpy.ndarray): Amount borrowed.
+    mortgage_rate (float or numpy.ndarray): Annual rate of every deal after the first (of every deal if
+        initial_rate is NaN), compounded monthly.
+    term_years (int or numpy.ndarray): Term of the mortgage.
+    years_until_sell (int or numpy.ndarray): When the property is sold and the balance repaid.
+    discount_rate (float or numpy.ndarray): Annual rate at which the payments are discounted.
+    fixed_years (float or numpy.ndarray): Length of each fixed-rate deal; the mortgage is remortgaged at the end
+        of each. 0 for a single deal over the whole term.
+    initial_rate (float or numpy.ndarray): Annual rate of the first deal, NaN for mortgage_rate.
+    remortgage_fee (float or numpy.ndarray): Fee paid at each remortgage.
+    monthly_overpayment (float or numpy.ndarray): Paid on top of the monthly payment, until the balance is cleared.
+    method (str): 'deals' (closed form within each fixed-rate deal) or 'months' (one step per month). They
+        agree up to floating point rounding.
+    chunk_size (int): Simulations rolled forward together; chunks whose arrays fit in cache are faster.
+
+    Returns:
+    dict: 'pv_payments', the payments, fees and balance repaid at the sale discounted to today at discount_rate;
+    'balance_at_sale'; 'interest_paid' and 'fees_paid' until the sale; and 'first_payment', the initial monthly
+    payment.
+    """
+    if method not in ('deals', 'months'):
+        raise ValueError(f"Unknown method {method!r}, expected 'deals' or 'months'")
+    roll_forward = _roll_forward_deals if method == 'deals' else _roll_forward_months
+    args = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in
+                                 (principal, mortgage_rate, term_years, years_until_sell, discount_rate, fixed_years,
+                                  initial_rate, remortgage_fee, monthly_overpayment)])
+    shape = args[0].shape
+    args = [arg.ravel() for arg in args]
+    n = args[0].size
+    results = {key: np.empty(n) for key in ['pv_payments', 'balance_at_sale', 'interest_paid', 'fees_paid', 'first_payment']}
+    for start in range(0, n, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        for key, values in roll_forward(*[arg[chunk] for arg in args]).items():
+            results[key][chunk] = values
+    return {key: values.reshape(shape)[()] for key, values in results.items()}
+
+def _roll_forward_deals(principal, mortgage_rate, term_years, years_until_sell, discount_rate, fixed_years, initial_rate,
+                        remortgage_fee, monthly_overpayment):
+    term_months = np.rint(term_years * 12)
+    end_month = np.minimum(term_months, np.maximum(np.rint(years_until_sell * 12), 0))
+    # a deal of 0 years is one deal over the whole term
+    deal_months = np.maximum(np.where(fixed_years > 0, np.rint(fixed_years * 12), term_months), 1)
+    rates = [np.where(np.isnan(initial_rate), mortgage_rate, initial_rate) / 12, mortgage_rate / 12]
+    log_growths = [np.log1p(rate) for rate in rates]
+    log_discount = -np.log1p(discount_rate) / 12
+    monthly_discount = np.exp(log_discount)
+    # the sum of monthly_discount^j for j = 1..n is annuity_scale * (1 - monthly_discount^n), with expm1 for
+    # accuracy at discount rates near 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity_scale = monthly_discount / -np.expm1(log_discount)
+
+    balance = principal.copy()
+    pv_payments = np.zeros(balance.shape)
+    interest_paid = np.zeros(balance.shape)
+    fees_paid = np.zeros(balance.shape)
+    first_payment = None
+    n_deals = int(np.max(np.ceil(end_month / deal_months), initial=0))
+    for deal in range(max(n_deals, 1)):
+        start = deal * deal_months
+        rate, log_growth = (rates[0], log_growths[0]) if deal == 0 else (rates[1], log_growths[1])
+        deal_discount = np.exp(start * log_discount)
+        # the level payment that clears the balance by the end of the term
+        with np.errstate(divide='ignore', invalid='ignore'):
+            payment = np.where(rate == 0, balance / np.maximum(term_months - start, 1),
+                               balance * rate / -np.expm1(-np.maximum(term_months - start, 1) * log_growth))
+        if first_payment is None:
+            first_payment = payment
+        # months paid in this deal before it ends or the property is sold
+        months = np.clip(np.minimum(deal_months, end_month - start), 0, None)
+        if deal > 0:
+            # a mortgage cleared by overpayments, or already sold, is not remortgaged
+            fee = np.where((months > 0) & (balance > 0), remortgage_fee, 0)
+            fees_paid += fee
+            # fees are paid at the start of the month, payments at the end
+            pv_payments += fee * deal_discount
+        paid_monthly = payment + monthly_overpayment
+        # the month the balance is cleared: the first k with balance * g^k <= paid_monthly * (g^k - 1) / rate
+        with np.errstate(divide='ignore', invalid='ignore'):
+            clearing_month = np.where(rate > 0, np.ceil(-np.log1p(-balance * rate / paid_monthly) / log_growth),
+                                      np.ceil(balance / paid_monthly))
+        clearing_month = np.where(balance > 0, np.nan_to_num(clearing_month, nan=0, posinf=0), 0)
+        months = np.minimum(months, clearing_month)
+        # the balance before the last payment of the deal, in closed form, and that last (possibly partial) payment
+        full_months = np.maximum(months - 1, 0)
+        growth = np.exp(full_months * log_growth)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            before_last = np.where(rate > 0, balance * growth - paid_monthly * (growth - 1) / rate, balance - paid_monthly * full_months)
+        due = np.maximum(before_last, 0) * (1 + rate)
+        last_payment = np.where(months > 0, np.minimum(paid_monthly, due), 0)
+        new_balance = np.where(months > 0, due - last_payment, balance)
+        interest_paid += paid_monthly * full_months + last_payment - (balance - new_balance)
+        full_discount_minus_one = np.expm1(full_months * log_discount)
+        full_discount = full_discount_minus_one + 1
+        with np.errstate(invalid='ignore'):
+            annuity = np.where(discount_rate == 0, full_months, annuity_scale * -full_discount_minus_one)
+        pv_payments += deal_discount * (paid_monthly * annuity + last_payment * full_discount * monthly_discount)
+        balance = new_balance
+    # the outstanding balance is repaid from the sale; it is 0 if the term ended first, up to rounding
+    balance = np.maximum(balance, 0)
+    pv_payments += balance * np.power(1 + discount_rate, -np.maximum(years_until_sell, 0))
+    return {'pv_payments': pv_payments, 'balance_at_sale': balance, 'interest_paid': interest_paid,
+            'fees_paid': fees_paid, 'first_payment': first_payment}
+
+def _roll_forward_months(principal, mortgage_rate, term_years, years_until_sell, discount_rate, fixed_years, initial_rate,
+                  remortgage_fee, monthly_overpayment):
+    term_months = np.rint(term_years * 12)
+    fixed_months = np.rint(fixed_years * 12)
+    # months of repayments before the mortgage is cleared or the property is sold
+    end_month = np.minimum(term_months, np.maximum(np.rint(years_until_sell * 12), 0))
+    rate = mortgage_rate / 12
+    first_rate = np.where(np.isnan(initial_rate), mortgage_rate, initial_rate) / 12
+    monthly_discount = np.power(1 + discount_rate, -1 / 12)
+
+    balance = principal.copy()
+    payment = monthly_payment(balance, first_rate, term_months)
+    first_payment = payment.copy()
+    overpayment = monthly_overpayment.copy()
+    pv_payments = np.zeros(balance.shape)
+    interest_paid = np.zeros(balance.shape)
+    fees_paid = np.zeros(balance.shape)
+    discount = np.ones(balance.shape)
+    current_rate = first_rate.copy()
+    scalar_fixed = fixed_months.size == 0 or np.all(fixed_months == fixed_months.flat[0])
+    # rather than masking every month, the simulations that reach the end of their repayments are frozen (no
+    # interest, no payments) once, at that month
+    end_months = set(np.unique(end_month).tolist())
+    interest = np.empty(balance.shape)
+    paid = np.empty(balance.shape)
+    for month in range(int(end_month.max(initial=0))):
+        if month in end_months:
+            stopped = end_month == month
+            current_rate[stopped] = 0
+            payment = np.where(stopped, 0, payment)
+            overpayment[stopped] = 0
+        if month > 0:
+            if scalar_fixed:
+                remortgage = fixed_months.flat[0] > 0 and month % fixed_months.flat[0] == 0
+            else:
+                remortgage = (fixed_months > 0) & (month % np.maximum(fixed_months, 1) == 0)
+            if np.any(remortgage):
+                # a mortgage cleared by overpayments is not remortgaged
+                remortgage = remortgage & (month < end_month) & (balance > 0)
+                current_rate = np.where(remortgage, rate, current_rate)
+                payment = np.where(remortgage, monthly_payment(balance, rate, term_months - month), payment)
+                fee = np.where(remortgage, remortgage_fee, 0)
+                fees_paid += fee
+                # fees are paid at the start of the month, payments at the end
+                pv_payments += fee * discount
+        discount *= monthly_discount
+        np.multiply(balance, current_rate, out=interest)
+        interest_paid += interest
+        balance += interest
+        np.add(payment, overpayment, out=paid)
+        np.minimum(paid, balance, out=paid)
+        balance -= paid
+        paid *= discount
+        pv_payments += paid
+    # the outstanding balance is repaid from the sale; it is 0 if the term ended first, up to rounding
+    balance = np.maximum(balance, 0)
+    pv_payments += balance * np.power(1 + discount_rate, -np.maximum(years_until_sell, 0))
+    return {'pv_payments': pv_payments, 'balance_at_sale': balance, 'interest_paid': interest_paid,
+            'fees_paid': fees_paid, 'first_payment': first_payment}
@@ -0,0 +1,120 @@
+"""
+Break-even values of one model input, solved for every Monte Carlo sample at once.
+
+For each sample the root of buying_fv - renting_fv in the chosen input is found by a vectorized Illinois
+(modified regula falsi) iteration: every step evaluates the model once for all the samples that have not
+converged yet, so 10^5 samples take a handful of batched evaluations instead of 10^5 scalar solves.
+"""
+import copy
+
+import numpy as np
+
+from core.sampling import PARAM_NAMES
+
+# default search brackets
+BREAKEVEN_BRACKETS = {'property_price_growth_annual': (-0.15, 0.25),
+                      'RENTAL_YIELD': (0.001, 0.25),
+                      'investment_return_annual': (-0.15, 0.35),
+                      'rent_increase': (-0.15, 0.25),
+                      'mortgage_interest_annual': (0.001, 0.3)}
+
+def _fv_difference(model, samples, target, values, index, adjust_for_inflation_bool):
+    for name in PARAM_NAMES:
+        setattr(model, name, samples[name][index])
+    setattr(model, target, values)
+    model.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
+    difference = np.broadcast_to(model.buying_fv - model.renting_fv, values.shape)
+    # the annuity formulas are 0/0 where the growth rate equals the discount rate, step just off the singularity
+    singular = np.isnan(difference)
+    if singular.any():
+        nudged = np.where(singular, values + 1e-9, values)
+        setattr(model, target, nudged)
+        model.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
+        difference = np.broadcast_to(model.buying_fv - model.renting_fv, values.shape)
+    return np.array(difference, dtype=float)
+
+def solve_breakeven(model, samples, target, bracket = None, method = 'illinois', xtol = 1e-7, max_iter = 100,
+                    adjust_for_inflation_bool = False, chunk_size = 65536):
+    """
+    Value of one model input at which buying_fv equals renting_fv, for each sample of the uncertain parameters.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters. It is copied, not modified.
+    samples (dict): One array per name in PARAM_NAMES, e.g. the output of core.simulation.run_simulation.
+    target (str): Numeric model input to solve for, e.g. 'property_price_growth_annual', 'RENTAL_YIELD'
+        (the break-even rent as a share of the house price) or 'investment_return_annual'. If it is one
+        of PARAM_NAMES its sampled values are replaced by the solution.
+    bracket (tuple, optional): (low, high) search interval, defaults to BREAKEVEN_BRACKETS[target].
+    method (str): 'illinois' (superlinear) or 'bisect' (one bit per iteration, for badly behaved targets).
+    xtol (float): Absolute tolerance on the break-even value.
+    max_iter (int): Maximum iterations.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    chunk_size (int): Samples solved together, as in Buy_or_Rent_Model.run_batch.
+
+    Returns:
+    dict: 'values' (NaN where buying_fv - renting_fv does not change sign within the bracket), 'converged'
+    (bool per sample) and 'iterations' (the most iterations any chunk needed).
+    """
+    if target not in model.INPUT_PARAMS:
+        raise ValueError(f"{target} is not a model input")
+    if method not in ('illinois', 'bisect'):
+        raise ValueError(f"Unknown method {method}, expected 'illinois' or 'bisect'")
+    low, high = bracket if bracket is not None else BREAKEVEN_BRACKETS[target]
+    model = copy.deepcopy(model)
+    samples = {name: np.asarray(samples[name], dtype=float) for name in PARAM_NAMES}
+    n = samples[PARAM_NAMES[0]].size
+    values = np.full(n, np.nan)
+    converged = np.zeros(n, dtype=bool)
+    iterations = 0
+    for start in range(0, n, chunk_size):
+        chunk = np.arange(start, min(start + chunk_size, n))
+        chunk_samples = {name: sample[chunk] for name, sample in samples.items()}
+        chunk_values, chunk_converged, chunk_iterations = _solve_chunk(model, chunk_samples, target, low, high, method,
+                                                                       xtol, max_iter, adjust_for_inflation_bool)
+        values[chunk] = chunk_values
+        converged[chunk] = chunk_converged
+        iterations = max(iterations, chunk_iterations)
+    return {'values': values, 'converged': converged, 'iterations': iterations}
+
+def _solve_chunk(model, samples, target, low, high, method, xtol, max_iter, adjust_for_inflation_bool):
+    n = samples[PARAM_NAMES[0]].size
+    everything = np.arange(n)
+    a = np.full(n, float(low))
+    b = np.full(n, float(high))
+    f_a = _fv_difference(model, samples, target, a, everything, adjust_for_inflation_bool)
+    f_b = _fv_difference(model, samples, target, b, everything, adjust_for_inflation_bool)
+    values = np.full(n, np.nan)
+    values[f_a == 0] = low
+    values[f_b == 0] = high
+    converged = (f_a == 0) | (f_b == 0)
+    active = (np.sign(f_a) * np.sign(f_b) < 0)
+    # which end of the bracket moved last: +1 for a, -1 for b, 0 at the start
+    side = np.zeros(n, dtype=np.int8)
+    previous = np.full(n, np.inf)
+    iterations = 0
+    while active.any() and iterations < max_iter:
+        iterations += 1
+        index = np.flatnonzero(active)
+        a_i, b_i, f_a_i, f_b_i = a[index], b[index], f_a[index], f_b[index]
+        if method == 'bisect':
+            x = 0.5 * (a_i + b_i)
+        else:
+            x = b_i - f_b_i * (b_i - a_i) / (f_b_i - f_a_i)
+        f_x = _fv_difference(model, samples, target, x, index, adjust_for_inflation_bool)
+
+        same_as_b = np.sign(f_x) == np.sign(f_b_i)
+        # Illinois step: halve the function value at the end that has stayed put twice, so it stops sticking
+        f_a[index] = np.where(same_as_b & (side[index] == -1), 0.5 * f_a_i, f_a_i)
+        f_b[index] = np.where(~same_as_b & (side[index] == 1), 0.5 * f_b_i, f_b_i)
+        b[index] = np.where(same_as_b, x, b_i)
+        f_b[index] = np.where(same_as_b, f_x, f_b[index])
+        a[index] = np.where(same_as_b, a_i, x)
+        f_a[index] = np.where(same_as_b, f_a[index], f_x)
+        side[index] = np.where(same_as_b, -1, 1)
+
+        done = (f_x == 0) | (np.abs(b[index] - a[index]) <= xtol) | (np.abs(x - previous[index]) <= xtol)
+        previous[index] = x
+        values[index] = x
+        converged[index[done]] = True
+        active[index[done]] = False
+    return values, converged, iterations
@@ -0,0 +1,205 @@
+"""
+Content-addressed result cache shared by app reruns.
+
+Keys are sha256 digests of a canonicalized parameter set (see make_key), so the same scenario always maps to
+the same key regardless of dict order or whether a number arrived as a python float or a numpy scalar.
+There are two tiers: a bounded in-process LRU and an optional on-disk directory that several server
+workers can share. Values must be picklable to be stored on disk.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_MISSING = object()
+
+def canonicalize(obj):
+    """
+    Convert parameters to a JSON-serializable form that is identical for equal parameter sets.
+    """
+    if isinstance(obj, dict):
+        return {str(key): canonicalize(value) for key, value in sorted(obj.items(), key=lambda item: str(item[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [canonicalize(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        return {'__ndarray__': hashlib.sha256(array.tobytes()).hexdigest(), 'dtype': array.dtype.str, 'shape': list(array.shape)}
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    if isinstance(obj, (int, np.integer)):
+        return int(obj)
+    if isinstance(obj, (float, np.floating)):
+        # repr round-trips exactly, so 0.1 and np.float64(0.1) give the same key
+        return repr(float(obj))
+    if obj is None or isinstance(obj, str):
+        return obj
+    if hasattr(obj, 'to_dict'):
+        # core.distributions objects
+        return {'__type__': type(obj).__name__, **canonicalize(obj.to_dict())}
+    raise TypeError(f'Cannot build a cache key from {type(obj).__name__}')
+
+def make_key(namespace, **params):
+    """
+    Build a cache key from a namespace (what is being cached) and the parameters it depends on, including the seed.
+    """
+    payload = json.dumps({'namespace': namespace, 'params': canonicalize(params)}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def estimate_size(value, _seen = None):
+    """
+    Rough size of a cached value in bytes. Numpy arrays and pandas objects are counted exactly, containers and
+    objects with attributes (e.g. a Buy_or_Rent_Model holding per-sample arrays) by their contents, anything else
+    by sys.getsizeof. An object reachable more than once is counted once.
+    """
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if type(value).__module__.startswith('pandas') and hasattr(value, 'memory_usage'):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in value)
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        return sys.getsizeof(value) + estimate_size(vars(value), seen)
+    return sys.getsizeof(value)
+
+class ResultCache():
+    def __init__(self, max_entries = 256, max_bytes = 512 * 2**20, disk_dir = None) -> None:
+        """
+        Args:
+        max_entries (int): Maximum number of values kept in memory.
+        max_bytes (int): Approximate memory bound for the in-process tier.
+        disk_dir (str, optional): Directory for the shared on-disk tier. Disabled if None.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_errors': 0}
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.pkl')
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return _MISSING
+        except Exception:
+            # a truncated or incompatible file is treated as a miss and overwritten later
+            self.counters['disk_errors'] += 1
+            return _MISSING
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # atomic, so other workers never see a partially written file
+            os.replace(tmp_path, path)
+        except Exception:
+            self.counters['disk_errors'] += 1
+
+    def _put_memory(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+                self._entries.move_to_end(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.counters['evictions'] += 1
+
+    def get(self, key, default = None):
+        """
+        Look a key up in memory, then on disk. Disk hits are promoted to the memory tier.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._entries[key]
+        if self.disk_dir is not None:
+            value = self._read_disk(key)
+            if value is not _MISSING:
+                self.counters['disk_hits'] += 1
+                self._put_memory(key, value)
+                return value
+        self.counters['misses'] += 1
+        return default
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+        if self.disk_dir is not None:
+            self._write_disk(key, value)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, calling compute() and storing its result on a miss.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Hit/miss/eviction counters plus the current size of the memory tier.
+        """
+        stats = dict(self.counters)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['entries'] = len(self._entries)
+        stats['memory_bytes'] = self._bytes
+        return stats
+
+def cached_call(cache, key, compute):
+    """
+    cache.get_or_compute(key, compute), or just compute() when caching is off (cache is None).
+    """
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(key, compute)
+
+_default_cache = None
+
+def get_default_cache():
+    """
+    Process-wide cache, configured from the environment:
+    BUY_OR_RENT_CACHE_ENTRIES, BUY_OR_RENT_CACHE_MB and BUY_OR_RENT_CACHE_DIR (enables the shared disk tier).
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache(max_entries=int(os.environ.get('BUY_OR_RENT_CACHE_ENTRIES', 256)),
+                                     max_bytes=int(float(os.environ.get('BUY_OR_RENT_CACHE_MB', 512)) * 2**20),
+                                     disk_dir=os.environ.get('BUY_OR_RENT_CACHE_DIR') or None)
+    return _default_cache
@@ -0,0 +1,55 @@
+"""
+Measure the cold-start import time of the core package in fresh interpreters.
+
+    python -m core.coldstart [--runs 5]
+
+Exits with status 1 if the best run is over core.IMPORT_TIME_BUDGET or if a heavy library got imported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['streamlit', 'matplotlib', 'seaborn', 'scipy', 'pandas']
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import core
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'heavy': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+def measure_import_time(runs = 5):
+    """
+    Import core in `runs` fresh interpreters.
+
+    Returns:
+    tuple: (best time in seconds, list of heavy modules that were imported).
+    """
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    heavy = set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', _PROBE], cwd=src_dir, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        times.append(result['seconds'])
+        heavy.update(result['heavy'])
+    return min(times), sorted(heavy)
+
+def main():
+    from core import IMPORT_TIME_BUDGET
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    seconds, heavy = measure_import_time(args.runs)
+    print(f'import core: {seconds*1000:.0f} ms (budget {IMPORT_TIME_BUDGET*1000:.0f} ms)')
+    if heavy:
+        print(f'heavy modules imported: {", ".join(heavy)}')
+    if seconds > IMPORT_TIME_BUDGET or heavy:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
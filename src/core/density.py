@@ -0,0 +1,126 @@
+"""
+Binned kernel density estimates.
+
+Samples are linearly binned onto a regular grid once and the bin counts are convolved with a Gaussian kernel
+by FFT, so the cost is O(n + grid log grid) instead of the O(n * grid) of evaluating every kernel at every grid
+point. The bandwidth follows Scott's rule, the same default as seaborn's kdeplot (scipy.stats.gaussian_kde).
+"""
+import numpy as np
+
+from core.stats import RunningMoments
+
+def scott_factor(n_samples, n_dims = 1):
+    return n_samples ** (-1.0 / (n_dims + 4))
+
+def _linear_bin(values, lower, step, gridsize):
+    # share each sample between its two neighbouring grid points in proportion to its distance to them
+    position = (values - lower) / step
+    index = np.clip(np.floor(position).astype(np.intp), 0, gridsize - 2)
+    weight_upper = np.clip(position - index, 0.0, 1.0)
+    return index, weight_upper
+
+def _fft_convolve(counts, kernel):
+    # linear (not circular) convolution, `kernel` is centred and has odd length along every axis
+    shape = [n + k - 1 for n, k in zip(counts.shape, kernel.shape)]
+    fft_shape = [int(2 ** np.ceil(np.log2(n))) for n in shape]
+    axes = list(range(counts.ndim))
+    result = np.fft.irfftn(np.fft.rfftn(counts, fft_shape) * np.fft.rfftn(kernel, fft_shape), fft_shape, axes=axes)
+    centre = tuple(slice(k // 2, k // 2 + n) for n, k in zip(counts.shape, kernel.shape))
+    return np.maximum(result[centre], 0.0)
+
+def _chunks(samples, chunk_size):
+    # slices of a memory-mapped array are only read from disk when used
+    for start in range(0, samples.size, chunk_size):
+        yield np.asarray(samples[start:start + chunk_size], dtype=float)
+
+def kde_1d(samples, gridsize = 512, bw_adjust = 1.0, cut = 3, chunk_size = 2**22):
+    """
+    Gaussian kernel density estimate of a 1-D sample on a regular grid.
+
+    Args:
+    samples (list or numpy.ndarray): Input values, may be a memory-mapped array larger than RAM.
+    gridsize (int): Number of grid points.
+    bw_adjust (float): Multiplier on the Scott's rule bandwidth, as in seaborn.
+    cut (float): How many bandwidths the grid extends past the extreme samples, as in seaborn.
+    chunk_size (int): Samples processed at a time, which bounds the temporary memory.
+
+    Returns:
+    tuple: (grid, density) arrays of length gridsize. The density integrates to 1 over the grid.
+    """
+    samples = np.asarray(samples).ravel()
+    moments = RunningMoments()
+    lower = np.inf
+    upper = -np.inf
+    for chunk in _chunks(samples, chunk_size):
+        moments.update(chunk)
+        lower = min(lower, chunk.min())
+        upper = max(upper, chunk.max())
+    bandwidth = np.sqrt(moments.m2 / moments.count) * scott_factor(samples.size) * bw_adjust
+    if bandwidth == 0:
+        # a single repeated value, draw it as a narrow spike
+        bandwidth = max(abs(float(samples[0])) * 1e-3, 1e-3)
+    lower -= cut * bandwidth
+    upper += cut * bandwidth
+    grid, step = np.linspace(lower, upper, gridsize, retstep=True)
+    counts = np.zeros(gridsize)
+    for chunk in _chunks(samples, chunk_size):
+        index, weight_upper = _linear_bin(chunk, lower, step, gridsize)
+        counts += np.bincount(index, 1 - weight_upper, gridsize) + np.bincount(index + 1, weight_upper, gridsize)
+    offsets = np.arange(-(gridsize - 1), gridsize) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (np.sqrt(2 * np.pi) * bandwidth)
+    density = _fft_convolve(counts, kernel) / samples.size
+    return grid, density
+
+def kde_2d(x, y, gridsize = 128, bw_adjust = 1.0, cut = 3):
+    """
+    Gaussian kernel density estimate of paired samples on a regular 2-D grid.
+
+    The kernel covariance is the sample covariance scaled by Scott's factor, like scipy.stats.gaussian_kde.
+
+    Returns:
+    tuple: (x_grid, y_grid, density) with density of shape (gridsize, gridsize), indexed [y, x] for contour plots.
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    covariance = np.cov(x, y) * (scott_factor(x.size, 2) * bw_adjust) ** 2
+    # guard against a constant feature, which would make the kernel singular
+    scale = np.maximum(np.abs([x.mean(), y.mean()]) * 1e-6, 1e-12)
+    covariance = covariance + np.diag(np.where(np.diag(covariance) > 0, 0.0, scale ** 2))
+    bandwidth = np.sqrt(np.diag(covariance))
+    x_grid, x_step = np.linspace(x.min() - cut * bandwidth[0], x.max() + cut * bandwidth[0], gridsize, retstep=True)
+    y_grid, y_step = np.linspace(y.min() - cut * bandwidth[1], y.max() + cut * bandwidth[1], gridsize, retstep=True)
+    x_index, x_weight = _linear_bin(x, x_grid[0], x_step, gridsize)
+    y_index, y_weight = _linear_bin(y, y_grid[0], y_step, gridsize)
+    counts = np.zeros(gridsize * gridsize)
+    for y_offset, y_w in ((0, 1 - y_weight), (1, y_weight)):
+        for x_offset, x_w in ((0, 1 - x_weight), (1, x_weight)):
+            counts += np.bincount((y_index + y_offset) * gridsize + x_index + x_offset, y_w * x_w, gridsize * gridsize)
+    counts = counts.reshape(gridsize, gridsize)
+    # the kernel only needs to reach as far as it is non-negligible
+    half_width = [min(gridsize - 1, int(np.ceil(4 * bandwidth[1] / y_step))),
+                  min(gridsize - 1, int(np.ceil(4 * bandwidth[0] / x_step)))]
+    y_offsets = np.arange(-half_width[0], half_width[0] + 1) * y_step
+    x_offsets = np.arange(-half_width[1], half_width[1] + 1) * x_step
+    dx, dy = np.meshgrid(x_offsets, y_offsets)
+    precision = np.linalg.inv(covariance)
+    quadratic = precision[0, 0] * dx**2 + 2 * precision[0, 1] * dx * dy + precision[1, 1] * dy**2
+    kernel = np.exp(-0.5 * quadratic) / (2 * np.pi * np.sqrt(np.linalg.det(covariance)))
+    density = _fft_convolve(counts, kernel) / x.size
+    return x_grid, y_grid, density
+
+def split_at_zero(grid, density):
+    """
+    Split a density curve into its parts at or above and at or below zero, interpolating the value at zero
+    so both shaded areas meet exactly.
+
+    Returns:
+    tuple: ((grid, density) for values >= 0, (grid, density) for values <= 0). Either part may be empty.
+    """
+    if grid[0] < 0 < grid[-1]:
+        density_at_zero = np.interp(0.0, grid, density)
+        insert_at = np.searchsorted(grid, 0.0)
+        grid = np.insert(grid, insert_at, 0.0)
+        density = np.insert(density, insert_at, density_at_zero)
+    above = grid >= 0
+    below = grid <= 0
+    return (grid[above], density[above]), (grid[below], density[below])
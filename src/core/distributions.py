@@ -0,0 +1,375 @@
+"""
+Distributions of the uncertain parameters.
+
+Each distribution draws any number of samples straight from a numpy Generator, into a preallocated array if
+one is given, and has an analytic pdf, cdf and inverse cdf (ppf): the ppf maps Latin hypercube and quasi-random
+points to samples (see core.sampling.uniform_to_parameters) and the pdf draws the sidebar plots. Empirical wraps
+a pool of values, so pools and distributions can be used interchangeably (see core.sampling.draw_samples).
+
+The normal cdf and its inverse come from scipy.special, imported when first needed.
+"""
+import numpy as np
+
+def _ndtr(x):
+    from scipy.special import ndtr
+    return ndtr(x)
+
+def _ndtri(q):
+    from scipy.special import ndtri
+    return ndtri(q)
+
+def _normal_pdf(z):
+    return np.exp(-0.5 * np.square(z)) / np.sqrt(2 * np.pi)
+
+def _generator(rng):
+    # like core.sampling.sample_uniform, a generator seeded from the global state so np.random.seed still applies
+    if rng is None:
+        return np.random.default_rng(np.random.randint(2**31))
+    return rng
+
+class Distribution():
+    """
+    Base class: subclasses implement _fill, pdf, cdf, ppf and to_dict.
+    """
+    dtype = np.dtype(float)
+
+    def sample(self, rng = None, size = None, out = None):
+        """
+        Draw samples.
+
+        Args:
+        rng (numpy.random.Generator, optional): Defaults to a generator seeded from the global numpy random state.
+        size (int or tuple, optional): Number (or shape) of samples, if out is not given.
+        out (numpy.ndarray, optional): Array to fill, of this distribution's dtype.
+
+        Returns:
+        numpy.ndarray: out, or a new array of the given size.
+        """
+        if out is None:
+            out = np.empty(1 if size is None else size, dtype=self.dtype)
+        self._fill(_generator(rng), out)
+        return out
+
+    def _fill(self, rng, out):
+        # inverse transform sampling, overridden where numpy has a faster direct sampler
+        rng.random(out=out)
+        out[...] = self.ppf(out)
+
+    @property
+    def median(self):
+        return float(self.ppf(0.5))
+
+    def plot_range(self, coverage = 0.999):
+        """
+        (low, high) covering the central `coverage` of the probability, for plots.
+        """
+        tail = (1 - coverage) / 2
+        return float(self.ppf(tail)), float(self.ppf(1 - tail))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{key}={value!r}' for key, value in self.to_dict().items())})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and repr(self) == repr(other)
+
+    def __hash__(self):
+        return hash(repr(self))
+
+class Normal(Distribution):
+    """
+    Normal distribution. With std <= 0 it is the constant mean.
+    """
+    def __init__(self, mean, std) -> None:
+        self.mean = float(mean)
+        self.std = float(std)
+
+    def _fill(self, rng, out):
+        if self.std <= 0:
+            out.fill(self.mean)
+            return
+        rng.standard_normal(out=out)
+        out *= self.std
+        out += self.mean
+
+    def pdf(self, x):
+        return _normal_pdf((np.asarray(x, dtype=float) - self.mean) / self.std) / self.std
+
+    def cdf(self, x):
+        if self.std <= 0:
+            return (np.asarray(x, dtype=float) >= self.mean).astype(float)
+        return _ndtr((np.asarray(x, dtype=float) - self.mean) / self.std)
+
+    def ppf(self, q):
+        if self.std <= 0:
+            return np.full(np.shape(q), self.mean)[()]
+        return self.mean + self.std * _ndtri(q)
+
+    @property
+    def median(self):
+        return self.mean
+
+    def to_dict(self):
+        return {'mean': self.mean, 'std': self.std}
+
+class TruncatedNormal(Distribution):
+    """
+    Normal distribution with mean and std, restricted to [lower, upper].
+    """
+    def __init__(self, mean, std, lower = -np.inf, upper = np.inf) -> None:
+        if not lower < upper or std <= 0:
+            raise ValueError('A truncated normal needs std > 0 and lower < upper')
+        self.loc = float(mean)
+        self.scale = float(std)
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self._cdf_lower, self._cdf_upper = _ndtr(np.array([self.lower - self.loc, self.upper - self.loc]) / self.scale)
+        if self._cdf_upper - self._cdf_lower < 1e-12:
+            raise ValueError(f'[{lower}, {upper}] is too far in the tail of a normal({mean}, {std})')
+
+    def pdf(self, x):
+        x = np.asarray(x, dtype=float)
+        density = _normal_pdf((x - self.loc) / self.scale) / self.scale / (self._cdf_upper - self._cdf_lower)
+        return np.where((x >= self.lower) & (x <= self.upper), density, 0.0)[()]
+
+    def cdf(self, x):
+        x = np.clip(np.asarray(x, dtype=float), self.lower, self.upper)
+        return (_ndtr((x - self.loc) / self.scale) - self._cdf_lower) / (self._cdf_upper - self._cdf_lower)
+
+    def ppf(self, q):
+        values = self.loc + self.scale * _ndtri(self._cdf_lower + np.asarray(q, dtype=float) * (self._cdf_upper - self._cdf_lower))
+        return np.clip(values, self.lower, self.upper)[()]
+
+    @property
+    def mean(self):
+        alpha, beta = (self.lower - self.loc) / self.scale, (self.upper - self.loc) / self.scale
+        return self.loc + self.scale * (_normal_pdf(alpha) - _normal_pdf(beta)) / (self._cdf_upper - self._cdf_lower)
+
+    def to_dict(self):
+        return {'mean': self.loc, 'std': self.scale, 'lower': self.lower, 'upper': self.upper}
+
+class LogNormal(Distribution):
+    """
+    loc plus a lognormal variable, parameterised by the mean and std of the result (so mean must exceed loc).
+    With loc=-1 a rate r is lognormal in 1 + r.
+    """
+    def __init__(self, mean, std, loc = 0.0) -> None:
+        if not mean > loc or std <= 0:
+            raise ValueError(f'A lognormal needs std > 0 and a mean above {loc}')
+        self.mean = float(mean)
+        self.std = float(std)
+        self.loc = float(loc)
+        self.sigma = np.sqrt(np.log1p((self.std / (self.mean - self.loc))**2))
+        self.mu = np.log(self.mean - self.loc) - self.sigma**2 / 2
+
+    def _fill(self, rng, out):
+        rng.standard_normal(out=out)
+        out *= self.sigma
+        out += self.mu
+        np.exp(out, out=out)
+        out += self.loc
+
+    def pdf(self, x):
+        shifted = np.asarray(x, dtype=float) - self.loc
+        positive = shifted > 0
+        safe = np.where(positive, shifted, 1.0)
+        return np.where(positive, _normal_pdf((np.log(safe) - self.mu) / self.sigma) / (safe * self.sigma), 0.0)[()]
+
+    def cdf(self, x):
+        shifted = np.asarray(x, dtype=float) - self.loc
+        return np.where(shifted > 0, _ndtr((np.log(np.maximum(shifted, 1e-300)) - self.mu) / self.sigma), 0.0)[()]
+
+    def ppf(self, q):
+        return self.loc + np.exp(self.mu + self.sigma * _ndtri(q))
+
+    def to_dict(self):
+        return {'mean': self.mean, 'std': self.std, 'loc': self.loc}
+
+class Triangular(Distribution):
+    """
+    Triangular distribution on [low, high] with its peak at mode.
+    """
+    def __init__(self, low, mode, high) -> None:
+        if not low <= mode <= high or not low < high:
+            raise ValueError('A triangular distribution needs low <= mode <= high and low < high')
+        self.low = float(low)
+        self.mode = float(mode)
+        self.high = float(high)
+
+    @classmethod
+    def symmetric(cls, mean, std):
+        """
+        The symmetric triangular distribution with the given mean and std (half-width std * sqrt(6)).
+        """
+        half_width = std * np.sqrt(6)
+        return cls(mean - half_width, mean, mean + half_width)
+
+    def pdf(self, x):
+        x = np.asarray(x, dtype=float)
+        a, c, b = self.low, self.mode, self.high
+        rising = 2 * (x - a) / ((b - a) * (c - a)) if c > a else np.zeros_like(x)
+        falling = 2 * (b - x) / ((b - a) * (b - c)) if b > c else np.zeros_like(x)
+        return np.select([(x < a) | (x > b), x < c], [0.0, rising], falling)[()]
+
+    def cdf(self, x):
+        x = np.clip(np.asarray(x, dtype=float), self.low, self.high)
+        a, c, b = self.low, self.mode, self.high
+        lower_part = (x - a)**2 / ((b - a) * (c - a)) if c > a else np.zeros_like(x)
+        upper_part = 1 - (b - x)**2 / ((b - a) * (b - c)) if b > c else np.ones_like(x)
+        return np.where(x <= c, lower_part, upper_part)[()]
+
+    def ppf(self, q):
+        q = np.asarray(q, dtype=float)
+        a, c, b = self.low, self.mode, self.high
+        split = (c - a) / (b - a)
+        return np.where(q < split, a + np.sqrt(q * (b - a) * (c - a)), b - np.sqrt((1 - q) * (b - a) * (b - c)))[()]
+
+    @property
+    def mean(self):
+        return (self.low + self.mode + self.high) / 3
+
+    def to_dict(self):
+        return {'low': self.low, 'mode': self.mode, 'high': self.high}
+
+class Empirical(Distribution):
+    """
+    Resampling with replacement from a pool of values; draws the same samples as Generator.choice(values, size).
+    The pdf is a histogram of the values.
+    """
+    def __init__(self, values) -> None:
+        self.values = np.asarray(values)
+        if self.values.size == 0:
+            raise ValueError('An empirical distribution needs at least one value')
+        self.dtype = self.values.dtype
+        self._sorted = np.sort(self.values.astype(float).ravel())
+        self._histogram = None
+
+    def sample(self, rng = None, size = None, out = None):
+        rng = _generator(rng)
+        shape = out.shape if out is not None else (1 if size is None else size)
+        return np.take(self.values, rng.integers(0, self.values.size, shape), out=out)
+
+    def pdf(self, x):
+        if self._histogram is None:
+            self._histogram = np.histogram(self._sorted, bins='auto', density=True)
+        density, edges = self._histogram
+        x = np.asarray(x, dtype=float)
+        bins = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, len(density) - 1)
+        return np.where((x >= edges[0]) & (x <= edges[-1]), density[bins], 0.0)[()]
+
+    def cdf(self, x):
+        return (np.searchsorted(self._sorted, np.asarray(x, dtype=float), side='right') / self._sorted.size)[()]
+
+    def ppf(self, q):
+        index = np.ceil(np.asarray(q, dtype=float) * self._sorted.size).astype(int) - 1
+        return self._sorted[np.clip(index, 0, self._sorted.size - 1)][()]
+
+    @property
+    def median(self):
+        return float(np.median(self.values))
+
+    @property
+    def mean(self):
+        return float(np.mean(self.values))
+
+    def plot_range(self, coverage = 0.999):
+        return float(self._sorted[0]), float(self._sorted[-1])
+
+    def to_dict(self):
+        return {'values': self.values}
+
+    def __repr__(self):
+        return f'Empirical(<{self.values.size} values>)'
+
+    def __eq__(self, other):
+        return type(self) is type(other) and np.array_equal(self.values, other.values)
+
+    def __hash__(self):
+        return hash(self.values.tobytes())
+
+class IntegerValued(Distribution):
+    """
+    A continuous distribution truncated towards zero to integers, as .astype(int) does (e.g. for years).
+    pdf is the probability mass at the integer part of x.
+    """
+    dtype = np.dtype(int)
+
+    def __init__(self, base) -> None:
+        self.base = base
+
+    def sample(self, rng = None, size = None, out = None):
+        values = self.base.sample(rng, size if out is None else out.shape)
+        if out is None:
+            return values.astype(int)
+        np.copyto(out, values, casting='unsafe')
+        return out
+
+    def cdf(self, x):
+        # trunc(Y) <= k is Y < k + 1 for k >= 0, and Y <= k for k < 0
+        k = np.floor(np.asarray(x, dtype=float))
+        return self.base.cdf(np.where(k >= 0, k + 1, k))
+
+    def pmf(self, k):
+        k = np.trunc(np.asarray(k, dtype=float))
+        return (self.cdf(k) - self.cdf(k - 1))[()]
+
+    pdf = pmf
+
+    def ppf(self, q):
+        return np.trunc(self.base.ppf(q)).astype(int)[()]
+
+    @property
+    def median(self):
+        return int(np.trunc(self.base.median))
+
+    @property
+    def mean(self):
+        low, high = self.plot_range(1 - 1e-9)
+        k = np.arange(low, high + 1)
+        return float(np.sum(k * self.pmf(k)))
+
+    def plot_range(self, coverage = 0.999):
+        low, high = self.base.plot_range(coverage)
+        return int(np.trunc(low)), int(np.trunc(high))
+
+    def to_dict(self):
+        return {'base': type(self.base).__name__, **self.base.to_dict()}
+
+    def __repr__(self):
+        return f'IntegerValued({self.base!r})'
+
+DISTRIBUTION_SHAPES = ['normal', 'truncated_normal', 'lognormal', 'triangular']
+
+def from_moments(shape, mean, std, as_int = False, lower = 0.0):
+    """
+    A distribution of the given shape with (approximately, for the truncated normal) the given mean and std.
+
+    Args:
+    shape (str): One of DISTRIBUTION_SHAPES. The truncated normal is cut at lower, and the lognormal is lower
+        plus a lognormal variable. Triangular is symmetric.
+    mean (float): Mean.
+    std (float): Standard deviation. If it is not positive the distribution is the constant mean, whatever the shape.
+    as_int (bool): Truncate to integers (see IntegerValued).
+    lower (float): Lower bound of the truncated normal and the lognormal.
+
+    Raises:
+    ValueError: For an unknown shape, or a lognormal with a mean at or below lower.
+    """
+    if shape not in DISTRIBUTION_SHAPES:
+        raise ValueError(f"shape must be one of {', '.join(DISTRIBUTION_SHAPES)}, got {shape!r}")
+    if std <= 0 or shape == 'normal':
+        distribution = Normal(mean, std)
+    elif shape == 'truncated_normal':
+        distribution = TruncatedNormal(mean, std, lower=lower)
+    elif shape == 'lognormal':
+        distribution = LogNormal(mean, std, loc=lower)
+    else:
+        distribution = Triangular.symmetric(mean, std)
+    return IntegerValued(distribution) if as_int else distribution
+
+def as_distribution(values):
+    """
+    A Distribution as is, or an Empirical distribution over a pool of values.
+    """
+    if isinstance(values, Distribution):
+        return values
+    return Empirical(values)
@@ -0,0 +1,258 @@
+"""
+Deduplicated evaluation of the model, with memoized annuity, discount and compounding factors.
+
+Every present and future value in the model is an amount times a factor of a rate, a number of years and a
+growth rate, and the sampled parameters often take few distinct values: years_until_sell is an integer,
+parameters with a zero sd are constant and samples resampled from small pools repeat the pool values. run_dedup
+groups the samples into their distinct (rent_increase, property_price_growth_annual, mortgage_interest_annual,
+investment_return_annual, years_until_sell) combinations, evaluates the model once per combination and gathers
+the results back to the samples.
+
+Grouping encodes each parameter array as integer codes (constant arrays and integer ranges directly, floats with
+np.unique only if a leading probe of the array repeats) and combines the codes into one mixed-radix key per
+sample, so it costs a few passes over the samples instead of a sort. When the combinations are expected to be
+mostly distinct, which is the case for continuous distributions, run_dedup falls back to model.run_batch without
+having sorted anything.
+
+The factors of the distinct combinations go through FactorTable, a bounded LRU memo keyed on the (rate, years,
+growth) tuples. The factors do not depend on the house price, the deposit or the salary, so reruns and sweeps
+over those reuse them.
+
+Results are those of Buy_or_Rent_Model.run_batch up to floating point rounding, as the present and future values
+are computed as amount * factor rather than with the combined formulas of core.finance.
+"""
+import copy
+from collections import OrderedDict
+
+import numpy as np
+
+from core.amortization import amortize
+from core.sampling import PARAM_NAMES
+from core.tax import capital_gains_tax, stamp_duty
+
+def compound_factor(rate, years):
+    return (1.0 + rate)**years
+
+def discount_factor(rate, years):
+    return (1.0 + rate)**(-1 * years)
+
+def annuity_pv_factor(rate, years, growth):
+    # core.finance.annuity_pv of a payment of 1
+    return (1 - (1 + growth)**years * (1 + rate)**(-1 * years)) / (rate - growth)
+
+def annuity_fv_factor(rate, years, growth):
+    # core.finance.annuity_fv of a payment of 1
+    return ((1 + rate)**years - (1 + growth)**years) / (rate - growth)
+
+class FactorTable():
+    """
+    Bounded LRU memo of factor values, keyed on (factor name, *argument values).
+
+    Args:
+    max_entries (int): Largest number of factor values kept.
+    max_lookups (int): Calls with more elements than this are computed directly, without the memo, as looking
+        up every element would cost more than the formula.
+    """
+    def __init__(self, max_entries = 2**16, max_lookups = 4096) -> None:
+        self.max_entries = max_entries
+        self.max_lookups = max_lookups
+        self.memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, function, *args):
+        """
+        function(*args) element-wise over the broadcast arguments, each element looked up in or added to the memo.
+        """
+        arrays = np.broadcast_arrays(*[np.asarray(arg, dtype=float) for arg in args])
+        shape = arrays[0].shape
+        if arrays[0].size > self.max_lookups:
+            return function(*args)
+        keys = list(zip(*[array.ravel().tolist() for array in arrays]))
+        name = function.__name__
+        values = np.empty(len(keys))
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.memo.get((name,) + key)
+            if value is None:
+                missing.append(i)
+            else:
+                self.memo.move_to_end((name,) + key)
+                values[i] = value
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            computed = np.broadcast_to(function(*[array.ravel()[missing] for array in arrays]), (len(missing),))
+            values[missing] = computed
+            for i, value in zip(missing, computed.tolist()):
+                self.memo[(name,) + keys[i]] = value
+            while len(self.memo) > self.max_entries:
+                self.memo.popitem(last=False)
+        return values.reshape(shape)[()]
+
+def _count_distinct(values, probe_size):
+    # number of distinct values (exact for constant and integer arrays, a lower bound from a leading probe of the
+    # other float arrays), cheap enough to decide whether grouping is worth it before sorting anything
+    if values.size and values[0] == values[-1] and values.min() == values.max():
+        return 1
+    if np.issubdtype(values.dtype, np.integer):
+        return int(values.max()) - int(values.min()) + 1
+    return np.unique(values[:probe_size]).size
+
+def _encode(values, n_distinct):
+    # (codes, distinct values)
+    if n_distinct == 1:
+        return np.zeros(values.size, dtype=np.intp), values[:1]
+    if np.issubdtype(values.dtype, np.integer):
+        low = int(values.min())
+        return values - low, np.arange(low, low + n_distinct, dtype=values.dtype)
+    distinct, codes = np.unique(values, return_inverse=True)
+    return codes, distinct
+
+def _expected_distinct(n, n_combinations):
+    # expected number of distinct keys among n uniform draws from n_combinations
+    return n_combinations * -np.expm1(-n / n_combinations)
+
+def group_samples(samples, max_distinct_fraction = 0.25, probe_size = 2048):
+    """
+    The distinct combinations of the sample values, if there are few enough.
+
+    Args:
+    samples (dict): One 1-d array per name in PARAM_NAMES, all of the same length.
+    max_distinct_fraction (float): Give up if the combinations are expected to exceed this fraction of the samples.
+    probe_size (int): Leading values of a float array counted before it is sorted.
+
+    Returns:
+    tuple or None: (dict of the distinct combinations, one array per name; index of each sample's combination).
+    """
+    n = samples[PARAM_NAMES[0]].size
+    counts = [_count_distinct(samples[name], probe_size) for name in PARAM_NAMES]
+    if _expected_distinct(n, float(np.prod(counts))) > max_distinct_fraction * n:
+        return None
+    encodings = [_encode(samples[name], count) for name, count in zip(PARAM_NAMES, counts)]
+    radices = [distinct.size for _, distinct in encodings]
+    n_combinations = float(np.prod(radices))
+    if _expected_distinct(n, n_combinations) > max_distinct_fraction * n or n_combinations >= 2**62:
+        return None
+    key = np.zeros(n, dtype=np.int64)
+    for (codes, _), radix in zip(encodings, radices):
+        key *= radix
+        key += codes
+    if n_combinations <= 4 * n:
+        present = np.flatnonzero(np.bincount(key, minlength=int(n_combinations)))
+        lookup = np.empty(int(n_combinations), dtype=np.intp)
+        lookup[present] = np.arange(present.size)
+        inverse = lookup[key]
+    else:
+        present, inverse = np.unique(key, return_inverse=True)
+    if present.size > max_distinct_fraction * n:
+        return None
+    combinations = {}
+    for name, (_, distinct), radix in reversed(list(zip(PARAM_NAMES, encodings, radices))):
+        combinations[name] = distinct[present % radix]
+        present = present // radix
+    return {name: combinations[name] for name in PARAM_NAMES}, inverse
+
+def sum_of_products(terms, constant = 0):
+    """
+    constant + the sum of amount * factor over the (amount, factor) terms.
+
+    When the amounts are per row (shape (rows, 1), or scalars) and the factors per column (shape (1, columns)), as
+    in a sweep of fixed inputs against shared samples, the sum is a single matrix product instead of a pass over
+    the rows x columns result per term.
+    """
+    amounts = [np.asarray(amount, dtype=float) for amount, _ in terms]
+    factors = [np.asarray(factor, dtype=float) for _, factor in terms]
+    rows = np.broadcast_shapes(*[amount.shape for amount in amounts])
+    if len(rows) == 2 and rows[1] == 1 and all(factor.ndim == 2 and factor.shape[0] == 1 for factor in factors):
+        return np.hstack([np.broadcast_to(amount, rows) for amount in amounts]) @ np.vstack(factors) + constant
+    return sum(amount * factor for amount, factor in zip(amounts, factors)) + constant
+
+def evaluate_factors(model, samples, adjust_for_inflation_bool = False, factor = None):
+    """
+    The model's results for the samples, computed as amounts times factors.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters. It is not modified.
+    samples (dict): One array per name in PARAM_NAMES.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    factor (callable, optional): Evaluates factor(function, *args), e.g. a FactorTable. Defaults to function(*args).
+
+    Returns:
+    dict: 'buying_npv', 'buying_fv' and 'renting_fv' arrays, one value per sample.
+    """
+    factor = factor if factor is not None else lambda function, *args: function(*args)
+    years = samples['years_until_sell']
+    rate = samples['investment_return_annual']
+    adjust_for_inflation = model.inflation if adjust_for_inflation_bool else model.adjust_for_inflation
+    stamp_duty_paid = stamp_duty(model.HOUSE_PRICE, model.TAX_YEAR, model.BUYER_TYPE) if model.STAMP_DUTY_BOL else 0
+    deposit = model.HOUSE_PRICE * model.DEPOSIT_MULT
+    mortgage_amount = model.HOUSE_PRICE * (1 - model.DEPOSIT_MULT)
+    discount = factor(discount_factor, rate, years)
+    # deflator is 1 when not adjusting for inflation
+    deflator = factor(compound_factor, adjust_for_inflation, years)
+    growth = factor(compound_factor, rate, years) / deflator
+    house_price_growth = factor(compound_factor, samples['property_price_growth_annual'], years)
+    ongoing_cost = model.HOUSE_PRICE * model.ONGOING_COST_MULT
+    rent = model.HOUSE_PRICE * model.RENTAL_YIELD
+    # the future house price net of the selling costs proportional to it
+    net_house_price = model.HOUSE_PRICE * (1 - model.SELLING_COST_MULT)
+
+    # every term is a fixed amount times a product of factors of the samples
+    npv_terms = [(net_house_price, house_price_growth * discount),
+                 (rent, factor(annuity_pv_factor, rate, years, samples['rent_increase'])),
+                 (-ongoing_cost, factor(annuity_pv_factor, rate, years, model.inflation))]
+    fv_terms = [(net_house_price, house_price_growth / deflator),
+                (rent, factor(annuity_fv_factor, rate, years, samples['rent_increase']) / deflator),
+                (-ongoing_cost, factor(annuity_fv_factor, rate, years, model.inflation) / deflator)]
+    if model.MORTGAGE_MODEL == 'monthly':
+        # the schedule is not a product of factors, but it is still rolled forward once per distinct combination
+        pv_mortgage_payments = amortize(mortgage_amount, samples['mortgage_interest_annual'], model.MORTGAGE_LENGTH,
+                                        years, rate, model.MORTGAGE_FIXED_YEARS, model.MORTGAGE_INITIAL_RATE, model.REMORTGAGE_FEE,
+                                        model.MONTHLY_OVERPAYMENT)['pv_payments']
+        npv_terms.append((-1, pv_mortgage_payments))
+        fv_terms.append((-1, pv_mortgage_payments * growth))
+    else:
+        # pv of the payments per unit borrowed; the model's annuity_fv over the term discounted back to the sale
+        # is the pv compounded to the sale
+        pv_mortgage_factor = factor(annuity_pv_factor, rate, model.MORTGAGE_LENGTH, 0) / factor(annuity_pv_factor, samples['mortgage_interest_annual'], model.MORTGAGE_LENGTH, 0)
+        npv_terms.append((-mortgage_amount, pv_mortgage_factor))
+        fv_terms.append((-mortgage_amount, pv_mortgage_factor * growth))
+    buying_npv = sum_of_products(npv_terms, -(deposit + model.BUYING_COST_FLAT + stamp_duty_paid))
+    buying_fv = sum_of_products(fv_terms)
+    if model.CGT_BOL:
+        cgt = capital_gains_tax(model.HOUSE_PRICE * (house_price_growth - 1), model.ANNUAL_SALARY, model.TAX_YEAR, asset='residential')
+        buying_npv = buying_npv - cgt * discount
+        buying_fv = buying_fv - cgt / deflator
+
+    total_investment = model.BUYING_COST_FLAT + stamp_duty_paid + deposit
+    total_investment_fv = total_investment * growth
+    cgt_investment = 0
+    if model.CGT_INVESTMENT_BOL:
+        cgt_investment = capital_gains_tax(total_investment_fv - total_investment, model.ANNUAL_SALARY, model.TAX_YEAR, asset='other')
+    return {'buying_npv': buying_npv, 'buying_fv': buying_fv, 'renting_fv': total_investment_fv - cgt_investment}
+
+def run_dedup(model, samples, adjust_for_inflation_bool = False, table = None, max_distinct_fraction = 0.25):
+    """
+    The equivalent of model.run_batch(**samples), evaluated once per distinct combination of the sample values.
+    Falls back to model.run_batch when the combinations are mostly distinct. The model is not modified.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters.
+    samples (dict): One array per name in PARAM_NAMES.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    table (FactorTable, optional): Memo of the factors, keep one across calls to reuse them.
+    max_distinct_fraction (float): See group_samples.
+
+    Returns:
+    dict: 'buying_npv', 'buying_fv' and 'renting_fv' arrays, one value per sample.
+    """
+    arrays = np.broadcast_arrays(*[np.asarray(samples[name]) for name in PARAM_NAMES])
+    shape = arrays[0].shape
+    grouped = group_samples({name: array.ravel() for name, array in zip(PARAM_NAMES, arrays)}, max_distinct_fraction) if shape else None
+    if grouped is None:
+        return copy.deepcopy(model).run_batch(*arrays, adjust_for_inflation_bool=adjust_for_inflation_bool)
+    combinations, inverse = grouped
+    table = table if table is not None else FactorTable()
+    results = evaluate_factors(model, combinations, adjust_for_inflation_bool, table)
+    return {key: np.take(value, inverse).reshape(shape) for key, value in results.items()}
@@ -0,0 +1,268 @@
+"""
+Incremental evaluation of the model as a dependency graph.
+
+Every derived quantity of Buy_or_Rent_Model.run_calculations is a node below: a function whose parameter names
+are the inputs or nodes it depends on. IncrementalModel keeps the value of every node between runs and, when
+some inputs change, recomputes only the nodes downstream of them. Changing the salary, for instance, only
+recomputes the two capital gains taxes and what is derived from them, and the inflation toggle only rescales
+the future values, instead of redoing the mortgage annuities and the present values of every sample.
+
+The graph computes exactly what run_calculations does (with the inflation adjustment applied as a division by
+(1 + inflation)^years, which is what the model's fv helpers do). Inputs are compared with the previous run by
+value, so a freshly drawn sample array that happens to be equal still counts as unchanged. Node values are
+never modified in place, so results handed out earlier stay valid after the next run. The price is memory:
+about 25 arrays of the sample count are kept per IncrementalModel.
+"""
+import inspect
+
+import numpy as np
+
+from core.amortization import amortize
+from core.finance import annuity_fv, annuity_payment, annuity_pv, fv_present_payment, pv_future_payment
+from core.sampling import PARAM_NAMES
+from core.tax import capital_gains_tax, stamp_duty
+
+NODES = {}
+
+def node(function):
+    NODES[function.__name__] = (function, list(inspect.signature(function).parameters))
+    return function
+
+@node
+def adjust_for_inflation(inflation, adjust_for_inflation_bool):
+    return inflation if adjust_for_inflation_bool else 0
+
+@node
+def inflation_deflator(adjust_for_inflation, years_until_sell):
+    return np.power(1.0 + adjust_for_inflation, years_until_sell)
+
+@node
+def discount_rate(investment_return_annual):
+    return investment_return_annual
+
+@node
+def DEPOSIT(HOUSE_PRICE, DEPOSIT_MULT):
+    return HOUSE_PRICE * DEPOSIT_MULT
+
+@node
+def monthly_rent(HOUSE_PRICE, RENTAL_YIELD):
+    return HOUSE_PRICE * RENTAL_YIELD / 12
+
+@node
+def STAMP_DUTY(HOUSE_PRICE, TAX_YEAR, BUYER_TYPE, STAMP_DUTY_BOL):
+    return stamp_duty(HOUSE_PRICE, TAX_YEAR, BUYER_TYPE) if STAMP_DUTY_BOL else 0
+
+@node
+def nominal_future_house_price(HOUSE_PRICE, property_price_growth_annual, years_until_sell):
+    return HOUSE_PRICE * (1 + property_price_growth_annual)**years_until_sell
+
+@node
+def CGT(nominal_future_house_price, HOUSE_PRICE, ANNUAL_SALARY, TAX_YEAR, CGT_BOL):
+    if not CGT_BOL:
+        return 0
+    return capital_gains_tax(nominal_future_house_price - HOUSE_PRICE, ANNUAL_SALARY, TAX_YEAR, asset='residential')
+
+@node
+def nominal_selling_cost(nominal_future_house_price, SELLING_COST_MULT, CGT):
+    return nominal_future_house_price * SELLING_COST_MULT + CGT
+
+@node
+def annual_mortgage_payment(HOUSE_PRICE, DEPOSIT_MULT, mortgage_interest_annual, MORTGAGE_LENGTH):
+    return annuity_payment(HOUSE_PRICE * (1 - DEPOSIT_MULT), mortgage_interest_annual, MORTGAGE_LENGTH, 0)
+
+@node
+def mortgage_schedule(HOUSE_PRICE, DEPOSIT_MULT, mortgage_interest_annual, MORTGAGE_LENGTH, years_until_sell, discount_rate, MORTGAGE_MODEL,
+                      MORTGAGE_FIXED_YEARS, MORTGAGE_INITIAL_RATE, REMORTGAGE_FEE, MONTHLY_OVERPAYMENT):
+    # None with the annual closed form, so the nodes below do not depend on the sale date through it
+    if MORTGAGE_MODEL != 'monthly':
+        return None
+    return amortize(HOUSE_PRICE * (1 - DEPOSIT_MULT), mortgage_interest_annual, MORTGAGE_LENGTH, years_until_sell, discount_rate,
+                    MORTGAGE_FIXED_YEARS, MORTGAGE_INITIAL_RATE, REMORTGAGE_FEE, MONTHLY_OVERPAYMENT)
+
+@node
+def pv_mortage_payments(annual_mortgage_payment, discount_rate, MORTGAGE_LENGTH, mortgage_schedule):
+    if mortgage_schedule is not None:
+        return mortgage_schedule['pv_payments']
+    return annuity_pv(annual_mortgage_payment, discount_rate, MORTGAGE_LENGTH, 0)
+
+@node
+def nominal_fv_mortgage_payments(annual_mortgage_payment, discount_rate, MORTGAGE_LENGTH, years_until_sell, mortgage_schedule):
+    if mortgage_schedule is not None:
+        return fv_present_payment(mortgage_schedule['pv_payments'], discount_rate, years_until_sell)
+    return pv_future_payment(annuity_fv(annual_mortgage_payment, discount_rate, MORTGAGE_LENGTH, 0), discount_rate, MORTGAGE_LENGTH - years_until_sell)
+
+@node
+def fv_mortgage_payments(nominal_fv_mortgage_payments, inflation_deflator):
+    return nominal_fv_mortgage_payments / inflation_deflator
+
+@node
+def pv_of_future_house_price(nominal_future_house_price, discount_rate, years_until_sell):
+    return pv_future_payment(nominal_future_house_price, discount_rate, years_until_sell)
+
+@node
+def pv_of_selling_cost(nominal_selling_cost, discount_rate, years_until_sell):
+    return pv_future_payment(nominal_selling_cost, discount_rate, years_until_sell)
+
+@node
+def pv_ongoing_cost(HOUSE_PRICE, ONGOING_COST_MULT, discount_rate, years_until_sell, inflation):
+    return annuity_pv(HOUSE_PRICE * ONGOING_COST_MULT, discount_rate, years_until_sell, inflation)
+
+@node
+def pv_rent_saved(HOUSE_PRICE, RENTAL_YIELD, discount_rate, years_until_sell, rent_increase):
+    return annuity_pv(HOUSE_PRICE * RENTAL_YIELD, discount_rate, years_until_sell, rent_increase)
+
+@node
+def buying_npv(pv_of_future_house_price, pv_rent_saved, pv_mortage_payments, pv_ongoing_cost, DEPOSIT, BUYING_COST_FLAT, STAMP_DUTY, pv_of_selling_cost):
+    return pv_of_future_house_price + pv_rent_saved - pv_mortage_payments - pv_ongoing_cost - DEPOSIT - BUYING_COST_FLAT - STAMP_DUTY - pv_of_selling_cost
+
+@node
+def future_house_price(nominal_future_house_price, adjust_for_inflation, inflation_deflator):
+    return nominal_future_house_price / inflation_deflator if adjust_for_inflation > 0 else nominal_future_house_price
+
+@node
+def SELLING_COST(nominal_selling_cost, adjust_for_inflation, inflation_deflator):
+    return nominal_selling_cost / inflation_deflator if adjust_for_inflation > 0 else nominal_selling_cost
+
+@node
+def nominal_fv_ongoing_cost(HOUSE_PRICE, ONGOING_COST_MULT, discount_rate, years_until_sell, inflation):
+    return annuity_fv(HOUSE_PRICE * ONGOING_COST_MULT, discount_rate, years_until_sell, inflation)
+
+@node
+def fv_ongoing_cost(nominal_fv_ongoing_cost, inflation_deflator):
+    return nominal_fv_ongoing_cost / inflation_deflator
+
+@node
+def nominal_rent_fv(HOUSE_PRICE, RENTAL_YIELD, discount_rate, years_until_sell, rent_increase):
+    return annuity_fv(HOUSE_PRICE * RENTAL_YIELD, discount_rate, years_until_sell, rent_increase)
+
+@node
+def rent_fv(nominal_rent_fv, inflation_deflator):
+    return nominal_rent_fv / inflation_deflator
+
+@node
+def buying_fv(future_house_price, rent_fv, SELLING_COST, fv_ongoing_cost, fv_mortgage_payments):
+    return future_house_price + rent_fv - SELLING_COST - fv_ongoing_cost - fv_mortgage_payments
+
+@node
+def total_investment(BUYING_COST_FLAT, STAMP_DUTY, DEPOSIT):
+    return BUYING_COST_FLAT + STAMP_DUTY + DEPOSIT
+
+@node
+def nominal_total_investment_fv(total_investment, discount_rate, years_until_sell):
+    return fv_present_payment(total_investment, discount_rate, years_until_sell)
+
+@node
+def total_investment_fv(nominal_total_investment_fv, inflation_deflator):
+    return nominal_total_investment_fv / inflation_deflator
+
+@node
+def cgt_investment(total_investment_fv, total_investment, ANNUAL_SALARY, TAX_YEAR, CGT_INVESTMENT_BOL):
+    if not CGT_INVESTMENT_BOL:
+        return 0
+    return capital_gains_tax(total_investment_fv - total_investment, ANNUAL_SALARY, TAX_YEAR, asset='other')
+
+@node
+def renting_fv(total_investment_fv, cgt_investment):
+    return total_investment_fv - cgt_investment
+
+def _topological_order(nodes):
+    order, visiting, done = [], set(), set()
+    def visit(name):
+        if name in done or name not in nodes:
+            return
+        if name in visiting:
+            raise ValueError(f'Cycle in the model graph at {name}')
+        visiting.add(name)
+        for dependency in nodes[name][1]:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+    for name in nodes:
+        visit(name)
+    return order
+
+ORDER = _topological_order(NODES)
+INPUTS = sorted({dependency for _, dependencies in NODES.values() for dependency in dependencies} - set(NODES))
+
+def _same(old, new):
+    if old is new:
+        return True
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return np.shape(old) == np.shape(new) and np.array_equal(old, new, equal_nan=np.asarray(old).dtype.kind == 'f')
+    # NaN stands for "not set" in some inputs (e.g. MORTGAGE_INITIAL_RATE)
+    return type(old) is type(new) and (old == new or (isinstance(old, float) and old != old and new != new))
+
+class IncrementalModel():
+    """
+    Node values of the model graph, kept between runs so a run only recomputes what its changed inputs affect.
+
+    Attributes:
+    recomputed (list): Nodes recomputed by the last run, in evaluation order.
+    """
+    def __init__(self) -> None:
+        self.values = {}
+        self.recomputed = []
+        self._samples_key = None
+        self._samples = None
+
+    def samples(self, key, draw):
+        """
+        The samples drawn for key, reusing those of the previous call if the key is the same.
+
+        Args:
+        key (str): Identifies the distributions, the sample count and the random stream (None never matches).
+        draw (callable): Draws the samples, a dict with one array per name in PARAM_NAMES.
+        """
+        if key is None or key != self._samples_key:
+            self._samples = draw()
+            self._samples_key = key
+        return self._samples
+
+    def evaluate(self, inputs):
+        """
+        Update the graph for new input values (any subset of INPUTS, the rest keep their previous values).
+
+        Returns:
+        dict: The value of every node.
+        """
+        changed = set()
+        for name, value in inputs.items():
+            if name not in self.values or not _same(self.values[name], value):
+                self.values[name] = value
+                changed.add(name)
+        missing = [name for name in INPUTS if name not in self.values]
+        if missing:
+            raise ValueError(f"Missing model inputs: {', '.join(missing)}")
+        self.recomputed = []
+        for name in ORDER:
+            function, dependencies = NODES[name]
+            if name in self.values and not changed.intersection(dependencies):
+                continue
+            had_value = name in self.values
+            previous = self.values.get(name)
+            self.values[name] = function(*[self.values[dependency] for dependency in dependencies])
+            # a node that returned the very same object as before (e.g. None, or 0 for a tax that is off) changes
+            # nothing downstream
+            if not had_value or self.values[name] is not previous:
+                changed.add(name)
+            self.recomputed.append(name)
+        return self.values
+
+    def run(self, model, samples, adjust_for_inflation_bool = False):
+        """
+        The equivalent of model.run_batch(**samples), recomputing only what changed since the previous run.
+
+        Args:
+        model (Buy_or_Rent_Model): Model holding the fixed parameters. It is not modified.
+        samples (dict): One array per name in PARAM_NAMES.
+        adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+
+        Returns:
+        dict: 'buying_npv', 'buying_fv' and 'renting_fv' arrays, one value per sample.
+        """
+        inputs = model.get_params(fixed_only=True)
+        inputs.update({name: samples[name] for name in PARAM_NAMES})
+        inputs['adjust_for_inflation_bool'] = adjust_for_inflation_bool
+        values = self.evaluate({name: value for name, value in inputs.items() if name in INPUTS})
+        return {key: np.broadcast_to(values[key], np.shape(samples[PARAM_NAMES[0]])) for key in ['buying_npv', 'buying_fv', 'renting_fv']}
@@ -0,0 +1,169 @@
+import numpy as np
+from core.tax import DEFAULT_TAX_YEAR, capital_gains_tax, stamp_duty
+from core.finance import annuity_pv, annuity_fv, annuity_payment, pv_future_payment, fv_present_payment
+from core.amortization import amortize
+
+class Buy_or_Rent_Model():
+    # attributes set by the user, as opposed to the ones derived by run_calculations
+    INPUT_PARAMS = ['HOUSE_PRICE', 'RENTAL_YIELD', 'DEPOSIT_MULT', 'MORTGAGE_LENGTH', 'MORTGAGE_MODEL', 'MORTGAGE_FIXED_YEARS',
+                    'MORTGAGE_INITIAL_RATE', 'REMORTGAGE_FEE', 'MONTHLY_OVERPAYMENT', 'BUYING_COST_FLAT', 'SELLING_COST_MULT',
+                    'ONGOING_COST_MULT', 'ANNUAL_SALARY', 'TAX_YEAR', 'BUYER_TYPE', 'CGT_BOL', 'CGT_INVESTMENT_BOL',
+                    'STAMP_DUTY_BOL', 'rent_increase', 'property_price_growth_annual', 'mortgage_interest_annual',
+                    'investment_return_annual', 'years_until_sell', 'inflation']
+
+    def __init__(self) -> None:
+        # PARAMS
+        # Fixed (in expectation)
+        self.HOUSE_PRICE = 800000 #including upfront repairs and renovations 
+        self.RENTAL_YIELD = 0.043 # assumed rent as a proportion of house price https://www.home.co.uk/company/press/rental_yield_heat_map_london_postcodes.pdf
+        self.DEPOSIT_MULT = 0.5
+        self.MORTGAGE_LENGTH = 30
+        self.MORTGAGE_MODEL = 'annual' # one annual annuity at one rate, or 'monthly' for core.amortization with the options below
+        self.MORTGAGE_FIXED_YEARS = 0 # length of each fixed-rate deal, remortgaged at the end of each; 0 for one deal over the term
+        self.MORTGAGE_INITIAL_RATE = np.nan # rate of the first deal, NaN for the simulated mortgage rate
+        self.REMORTGAGE_FEE = 0
+        self.MONTHLY_OVERPAYMENT = 0
+        self.BUYING_COST_FLAT = 3000 #https://www.movingcostscalculator.co.uk/calculator/
+        self.SELLING_COST_MULT = 0.02 #https://www.movingcostscalculator.co.uk/calculator/
+        self.ONGOING_COST_MULT = 0.006 # service charge + repairs, council tax and bills are omitted since they are the same whether buying or renting
+        self.ANNUAL_SALARY = 55000
+        self.TAX_YEAR = DEFAULT_TAX_YEAR # rates and allowances of core.tax
+        self.BUYER_TYPE = 'standard' # or 'first_time_buyer', 'additional', for stamp duty
+        self.CGT_BOL = True
+        self.CGT_INVESTMENT_BOL = False
+        self.STAMP_DUTY_BOL = True
+        # Probability distribution
+        self.rent_increase = 0.01325 # historical: https://www.ons.gov.uk/economy/inflationandpriceindices/bulletins/indexofprivatehousingrentalprices/april2023
+        self.property_price_growth_annual = 0.025 # historical average = 0.034 over the last 8 year, adjusted down due to end to abnormally low interest rates; source for historical data: https://www.statista.com/statistics/620414/monthly-house-price-index-in-london-england-uk/
+        self.mortgage_interest_annual = 0.05
+        self.investment_return_annual = 0.06
+        self.years_until_sell = 20
+        # financial modelling params
+        self.inflation = 0.02 #on ongoing costs, also for converting fv
+        self.adjust_for_inflation = 0
+
+    def get_params(self, fixed_only = False):
+        # fixed_only leaves out the uncertain parameters that simulations overwrite with samples
+        uncertain = ['rent_increase', 'property_price_growth_annual', 'mortgage_interest_annual', 'investment_return_annual', 'years_until_sell']
+        return {name: getattr(self, name) for name in self.INPUT_PARAMS if not (fixed_only and name in uncertain)}
+
+    def get_capital_gains_tax_property(self):
+        cgt = 0
+        if self.CGT_BOL:
+            taxable_gains = self.future_house_price - self.HOUSE_PRICE
+            cgt = capital_gains_tax(taxable_gains, self.ANNUAL_SALARY, self.TAX_YEAR, asset='residential')
+        return cgt
+    
+    def get_capital_gains_tax_investment(self):
+        cgt = 0
+        if self.CGT_INVESTMENT_BOL:
+            taxable_gains = self.total_investment_fv - self.total_investment
+            cgt = capital_gains_tax(taxable_gains, self.ANNUAL_SALARY, self.TAX_YEAR, asset='other')
+        return cgt
+
+    def run_calculations(self, adjust_for_inflation_bool = False):
+        self.future_house_price = self.HOUSE_PRICE * (1+self.property_price_growth_annual)**self.years_until_sell
+        self.CGT = self.get_capital_gains_tax_property()
+        self.SELLING_COST = self.future_house_price * self.SELLING_COST_MULT + self.CGT
+        if adjust_for_inflation_bool:
+            self.adjust_for_inflation = self.inflation
+            # self.SELLING_COST = self.SELLING_COST / float(1+self.adjust_for_inflation)**(self.years_until_sell)
+            # self.future_house_price = self.future_house_price / float(1+self.adjust_for_inflation)**(self.years_until_sell)
+        self.monthly_rent = self.HOUSE_PRICE * self.RENTAL_YIELD /12
+        if self.STAMP_DUTY_BOL:
+            self.STAMP_DUTY = stamp_duty(self.HOUSE_PRICE, self.TAX_YEAR, self.BUYER_TYPE)
+        else:
+            self.STAMP_DUTY = 0
+        self.discount_rate = self.investment_return_annual
+        self.DEPOSIT = self.HOUSE_PRICE * self.DEPOSIT_MULT
+        self.mortgage_calculations()
+        self.get_house_buying_npv()
+        self.get_house_buying_fv()
+        self.get_renting_fv()
+
+    def run_batch(self, rent_increase, property_price_growth_annual, mortgage_interest_annual, investment_return_annual, years_until_sell, adjust_for_inflation_bool = False, chunk_size = 65536):
+        """
+        Run the model for many samples of the uncertain parameters in vectorized passes.
+
+        Args:
+        rent_increase, property_price_growth_annual, mortgage_interest_annual,
+        investment_return_annual, years_until_sell (float or numpy.ndarray): Broadcastable samples.
+        adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+        chunk_size (int): Samples evaluated per pass. Chunks that fit in cache are faster than one huge pass.
+
+        Returns:
+        dict: 'buying_npv', 'buying_fv' and 'renting_fv' arrays, one value per sample.
+        After the call the per-sample model attributes hold the values of the last chunk.
+        """
+        samples = np.broadcast_arrays(np.asarray(rent_increase, dtype=float),
+                                      np.asarray(property_price_growth_annual, dtype=float),
+                                      np.asarray(mortgage_interest_annual, dtype=float),
+                                      np.asarray(investment_return_annual, dtype=float),
+                                      np.asarray(years_until_sell))
+        shape = samples[0].shape
+        samples = [sample.ravel() for sample in samples]
+        n = samples[0].size
+        results = {key: np.empty(n) for key in ['buying_npv', 'buying_fv', 'renting_fv']}
+        for start in range(0, n, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            self.rent_increase = samples[0][chunk]
+            self.property_price_growth_annual = samples[1][chunk]
+            self.mortgage_interest_annual = samples[2][chunk]
+            self.investment_return_annual = samples[3][chunk]
+            self.years_until_sell = samples[4][chunk]
+            self.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
+            results['buying_npv'][chunk] = self.buying_npv
+            results['buying_fv'][chunk] = self.buying_fv
+            results['renting_fv'][chunk] = self.renting_fv
+        return {key: value.reshape(shape) for key, value in results.items()}
+
+    def mortgage_calculations(self):
+        self.mortgage_amount = self.HOUSE_PRICE * (1 - self.DEPOSIT_MULT)
+        if self.MORTGAGE_MODEL == 'monthly':
+            self.monthly_mortgage_calculations()
+            return
+        self.annual_mortgage_payment = annuity_payment(self.mortgage_amount, self.mortgage_interest_annual,self.MORTGAGE_LENGTH,0)
+        self.pv_mortage_payments = annuity_pv(self.annual_mortgage_payment, self.discount_rate, self.MORTGAGE_LENGTH, 0)
+        self.fv_mortgage_payments = pv_future_payment(annuity_fv(self.annual_mortgage_payment, self.discount_rate, self.MORTGAGE_LENGTH, 0), self.discount_rate, self.MORTGAGE_LENGTH - self.years_until_sell)/ np.power(1.0+self.adjust_for_inflation, self.years_until_sell)#annuity_fv(self.annual_mortgage_payment, self.discount_rate, self.MORTGAGE_LENGTH, 0)
+
+    def monthly_mortgage_calculations(self):
+        # month by month, with the balance outstanding at the sale repaid from the sale proceeds
+        schedule = amortize(self.mortgage_amount, self.mortgage_interest_annual, self.MORTGAGE_LENGTH, self.years_until_sell, self.discount_rate,
+                            self.MORTGAGE_FIXED_YEARS, self.MORTGAGE_INITIAL_RATE, self.REMORTGAGE_FEE, self.MONTHLY_OVERPAYMENT)
+        self.annual_mortgage_payment = 12 * schedule['first_payment']
+        self.mortgage_balance_at_sale = schedule['balance_at_sale']
+        self.mortgage_interest_paid = schedule['interest_paid']
+        self.remortgage_fees_paid = schedule['fees_paid']
+        self.equity_at_sale = self.future_house_price - self.mortgage_balance_at_sale
+        self.pv_mortage_payments = schedule['pv_payments']
+        self.fv_mortgage_payments = fv_present_payment(self.pv_mortage_payments, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
+
+    def get_house_buying_npv(self):
+        self.pv_of_future_house_price = pv_future_payment(self.future_house_price, self.discount_rate, self.years_until_sell)
+        self.pv_of_selling_cost = pv_future_payment(self.SELLING_COST, self.discount_rate, self.years_until_sell)
+        self.pv_ongoing_cost = annuity_pv(self.HOUSE_PRICE * self.ONGOING_COST_MULT,self.discount_rate, self.years_until_sell, self.inflation)
+        # rent saved
+        self.pv_rent_saved = annuity_pv(self.HOUSE_PRICE*self.RENTAL_YIELD, self.discount_rate, self.years_until_sell, self.rent_increase)
+        # sum it up
+        self.buying_npv = self.pv_of_future_house_price + self.pv_rent_saved - self.pv_mortage_payments- self.pv_ongoing_cost - self.DEPOSIT  - self.BUYING_COST_FLAT - self.STAMP_DUTY - self.pv_of_selling_cost
+
+    def get_house_buying_fv(self): # not accounting for deposit,  immediate costs, and rent saved. ongoing costs and mortgage are rolled up and deducted from fv
+        if self.adjust_for_inflation > 0:
+            self.SELLING_COST = self.SELLING_COST / np.power(1.0+self.adjust_for_inflation, self.years_until_sell)
+            self.future_house_price = self.future_house_price / np.power(1.0+self.adjust_for_inflation, self.years_until_sell)
+        self.fv_ongoing_cost = annuity_fv(self.HOUSE_PRICE * self.ONGOING_COST_MULT,self.discount_rate, self.years_until_sell, self.inflation, adjust_for_inflation = self.adjust_for_inflation)
+        self.rent_fv = annuity_fv(self.HOUSE_PRICE*self.RENTAL_YIELD, self.discount_rate, self.years_until_sell, self.rent_increase, adjust_for_inflation = self.adjust_for_inflation)
+        self.buying_fv = self.future_house_price + self.rent_fv - self.SELLING_COST - self.fv_ongoing_cost -  self.fv_mortgage_payments
+        # self.buying_pv = self.pv_of_future_house_price + self.pv_rent_saved - self.pv_of_selling_cost - self.pv_ongoing_cost -  self.pv_mortage_payments
+        # self.buying_fv_inflation_adjusted = pv_future_payment(self.buying_fv, self.inflation, self.years_until_sell)
+
+    def get_renting_fv(self): # assumes that buying costs and stamp duty are invested, rent is rolled up and deducted
+        self.total_investment = self.BUYING_COST_FLAT + self.STAMP_DUTY + self.DEPOSIT
+        self.total_investment_fv = fv_present_payment(self.total_investment, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
+        # fv_buying_cost = fv_present_payment(self.BUYING_COST_FLAT, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
+        # fv_STAMP_DUTY = fv_present_payment(self.STAMP_DUTY, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
+        # deposit_fv = fv_present_payment(self.DEPOSIT, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
+        self.cgt_investment = self.get_capital_gains_tax_investment()
+        self.renting_fv = self.total_investment_fv - self.cgt_investment
+        # self.renting_pv = self.total_investment
+        # self.renting_fv_inflation_adjusted = pv_future_payment(self.renting_fv, self.inflation, self.years_until_sell)
@@ -0,0 +1,92 @@
+"""
+Financing optimizer: the deposit and mortgage length (and optionally the property price) that suit the
+assumptions best.
+
+Every candidate is evaluated by core.sweep against the same samples of the uncertain parameters (common random
+numbers), so the differences between candidates are differences in the decision, not in the random draws, and
+a few thousand samples rank them reliably. The whole grid is one vectorized sweep, not a rerun per candidate.
+
+Besides the optimum for the chosen objective, the result marks the frontier: the candidates that no other
+candidate beats on both the mean NPV and the probability that buying wins.
+"""
+import numpy as np
+
+from core.sweep import sweep
+
+OBJECTIVES = {'mean_npv': 'Mean NPV of buying',
+              'median_npv': 'Median NPV of buying',
+              'prob_buy_wins': 'Probability that buying wins',
+              'prob_buying_fv_higher': 'Probability that buying ends with more assets'}
+DEFAULT_DEPOSIT_MULTS = np.round(np.arange(0.05, 1.0, 0.05), 2)
+DEFAULT_MORTGAGE_LENGTHS = np.arange(15, 36, 5)
+
+def pareto_frontier(*objectives):
+    """
+    Whether each candidate is non-dominated: no other candidate is at least as good on every objective and
+    strictly better on one. All objectives are maximized.
+
+    Args:
+    *objectives (numpy.ndarray): One 1-D array per objective, one value per candidate.
+
+    Returns:
+    numpy.ndarray: Boolean mask over the candidates.
+    """
+    values = np.column_stack(objectives)
+    # candidates in decreasing order of the first objective (ties by the others): a candidate is dominated
+    # exactly when one sorted before it is at least as good on all the others
+    order = np.lexsort(tuple(-values[:, i] for i in reversed(range(values.shape[1]))))
+    on_frontier = np.zeros(len(values), dtype=bool)
+    kept = []
+    for i in order:
+        if not any(np.all(values[j] >= values[i]) for j in kept):
+            on_frontier[i] = True
+            kept.append(i)
+    return on_frontier
+
+def optimize_financing(model, samples, deposit_mults = None, mortgage_lengths = None, house_prices = None,
+                       objective = 'mean_npv', adjust_for_inflation_bool = False, memory_budget = 256 * 2**20, n_workers = 1):
+    """
+    Evaluate every combination of deposit, mortgage length and (optionally) property price against the same
+    samples, and rank them.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the other fixed parameters. It is copied, not modified.
+    samples (dict): One array per name in PARAM_NAMES, shared by every candidate.
+    deposit_mults (array-like, optional): Deposits to try, as fractions of the property price.
+        Defaults to DEFAULT_DEPOSIT_MULTS.
+    mortgage_lengths (array-like, optional): Mortgage lengths to try, in years. Defaults to DEFAULT_MORTGAGE_LENGTHS.
+    house_prices (array-like, optional): Property prices to try, e.g. up to a budget. Defaults to the model's.
+    objective (str): Key of OBJECTIVES to rank the candidates by.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    memory_budget (int): Approximate peak memory in bytes of the sweep.
+    n_workers (int): Processes of the sweep. The default grid is small enough that starting processes costs more
+        than it saves, None for the CPU count.
+
+    Returns:
+    dict: 'candidates', one array per input ('DEPOSIT_MULT', 'MORTGAGE_LENGTH', 'HOUSE_PRICE') and per
+    objective, ranked from best to worst, plus 'on_frontier' (bool per candidate, see pareto_frontier);
+    'best', the first candidate as a dict; and 'surfaces', the core.sweep result.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r}, expected one of {', '.join(OBJECTIVES)}")
+    grid = {'DEPOSIT_MULT': DEFAULT_DEPOSIT_MULTS if deposit_mults is None else np.asarray(deposit_mults, dtype=float),
+            'MORTGAGE_LENGTH': DEFAULT_MORTGAGE_LENGTHS if mortgage_lengths is None else np.asarray(mortgage_lengths),
+            'HOUSE_PRICE': np.atleast_1d(model.HOUSE_PRICE if house_prices is None else np.asarray(house_prices, dtype=float))}
+    for name, values in grid.items():
+        if values.ndim != 1 or values.size == 0:
+            raise ValueError(f"{name} needs a non-empty list of values")
+    if np.any((grid['DEPOSIT_MULT'] < 0) | (grid['DEPOSIT_MULT'] > 1)):
+        raise ValueError('Deposits must be between 0 and 1 of the property price')
+    if np.any(grid['MORTGAGE_LENGTH'] <= 0):
+        raise ValueError('Mortgage lengths must be positive')
+    surfaces = sweep(model, grid, samples, memory_budget = memory_budget, adjust_for_inflation_bool = adjust_for_inflation_bool,
+                     n_workers = n_workers)
+    mesh = np.meshgrid(*grid.values(), indexing='ij')
+    candidates = {name: values.ravel() for name, values in zip(grid, mesh)}
+    candidates.update({key: surfaces[key].ravel() for key in OBJECTIVES})
+    candidates['on_frontier'] = pareto_frontier(candidates['mean_npv'], candidates['prob_buy_wins'])
+    # best first; ties (e.g. a probability of 1 for several candidates) go to the higher mean NPV
+    ranking = np.lexsort((-candidates['mean_npv'], -candidates[objective]))
+    candidates = {key: values[ranking] for key, values in candidates.items()}
+    best = {key: values[0].item() for key, values in candidates.items()}
+    return {'candidates': candidates, 'best': best, 'surfaces': surfaces}
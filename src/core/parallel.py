@@ -0,0 +1,156 @@
+"""
+Multi-process Monte Carlo runs with reproducible, independent random streams.
+
+A run of n_samples is cut into shards of a fixed size. Every shard gets its own numpy Generator spawned from
+one SeedSequence, and the shard results are merged in shard order. The shards, and so the results, only depend
+on the seed, n_samples and shard_size, never on how many workers evaluated them.
+
+For overnight runs of 10^8 samples and more:
+
+    python -m core.parallel --samples 100000000 [--seed 123] [--workers 8] [--scenario scenario.json] [--save-dir DIR]
+
+prints the merged statistics as JSON. The scenario file holds core.scenario inputs, missing ones take the app
+defaults. With --save-dir every sample and output is also written to a core.store results directory, each
+worker writing its shards straight into the memory-mapped columns, so the run is never in RAM at once.
+"""
+import argparse
+import copy
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core.sampling import draw_samples, sample_dtype
+from core.stats import RunningMoments, StreamingStats
+from core.store import ResultsWriter, write_rows
+
+OUTPUTS = ['buying_npv', 'buying_fv', 'renting_fv']
+
+def shard_sizes(n_samples, shard_size):
+    n_shards = -(-n_samples // shard_size)
+    return [min(shard_size, n_samples - i * shard_size) for i in range(n_shards)]
+
+def _run_shard(model, pools, size, seed_sequence, adjust_for_inflation_bool, keep_samples, save_dir = None, start = 0):
+    rng = np.random.default_rng(seed_sequence)
+    samples = draw_samples(size, pools, rng)
+    results = model.run_batch(**samples, adjust_for_inflation_bool = adjust_for_inflation_bool)
+    if save_dir is not None:
+        write_rows(save_dir, start, dict(samples, **results))
+    shard = {'moments': {key: RunningMoments().update(results[key]) for key in OUTPUTS},
+             # the sketch gets its own stream so its compaction does not shift the samples
+             'npv_stats': StreamingStats(seed = seed_sequence.spawn(1)[0]).update(results['buying_npv']),
+             'n_buying_fv_higher': int(np.count_nonzero(results['buying_fv'] > results['renting_fv']))}
+    if keep_samples:
+        results.update(samples)
+        shard['results'] = results
+    return shard
+
+def run_parallel(model, pools, n_samples, seed, n_workers = None, shard_size = 10**6, adjust_for_inflation_bool = False, keep_samples = False,
+                 save_dir = None):
+    """
+    Monte Carlo run of the model sharded across a process pool.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters. It is copied, not modified.
+    pools (dict): Maps each name in core.sampling.PARAM_NAMES to its pool of values.
+    n_samples (int): Total number of scenarios.
+    seed (int or sequence of int): Entropy for the SeedSequence the shard generators are spawned from.
+    n_workers (int, optional): Worker processes, defaults to the CPU count. With 1 everything runs in this process.
+    shard_size (int): Samples per shard. Changing it changes the random streams, unlike n_workers.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    keep_samples (bool): Also return every sample. Leave off for very large runs.
+    save_dir (str, optional): Write every sample and output to this core.store results directory, with the run's
+        parameters and merged statistics in its metadata.
+
+    Returns:
+    dict: 'n_samples', 'moments' (output -> merged RunningMoments), 'npv_stats' (core.stats.StreamingStats of
+    the buying NPV, with its percentiles), 'prob_buy_better' (P(buying NPV > 0)), 'prob_buying_fv_higher',
+    and with keep_samples 'results', the same dict run_simulation returns.
+    """
+    sizes = shard_sizes(n_samples, shard_size)
+    starts = np.cumsum([0] + sizes[:-1]).tolist()
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(sizes))
+    n_workers = n_workers or os.cpu_count()
+    model = copy.deepcopy(model)
+    writer = None
+    if save_dir is not None:
+        columns = {name: sample_dtype(pool) for name, pool in pools.items()}
+        columns.update({key: float for key in OUTPUTS})
+        metadata = {'model': model.get_params(fixed_only=True), 'pools': pools, 'seed': seed, 'n_samples': n_samples,
+                    'shard_size': shard_size, 'adjust_for_inflation_bool': adjust_for_inflation_bool}
+        writer = ResultsWriter(save_dir, n_samples, columns, metadata)
+    args = [(model, pools, size, seed_sequence, adjust_for_inflation_bool, keep_samples, save_dir, start)
+            for size, seed_sequence, start in zip(sizes, seed_sequences, starts)]
+    # a failed run leaves the directory without metadata, as an unfinished one
+    if n_workers == 1 or len(sizes) == 1:
+        shards = [_run_shard(*shard_args) for shard_args in args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(sizes))) as executor:
+            # map returns the shards in submission order, so the merge below is deterministic
+            shards = list(executor.map(_run_shard, *zip(*args)))
+
+    moments = {key: RunningMoments() for key in OUTPUTS}
+    npv_stats = StreamingStats(seed = seed)
+    for shard in shards:
+        for key in OUTPUTS:
+            moments[key].merge(shard['moments'][key])
+        npv_stats.merge(shard['npv_stats'])
+    summary = {'n_samples': n_samples,
+               'moments': moments,
+               'npv_stats': npv_stats,
+               'prob_buy_better': npv_stats.prob_positive,
+               'prob_buying_fv_higher': sum(shard['n_buying_fv_higher'] for shard in shards) / n_samples}
+    if keep_samples:
+        summary['results'] = {key: np.concatenate([shard['results'][key] for shard in shards]) for key in shards[0]['results']}
+    if writer is not None:
+        writer.mark_written(n_samples)
+        writer.metadata['summary'] = summarize_run(summary, model.HOUSE_PRICE * model.DEPOSIT_MULT)
+        writer.close()
+    return summary
+
+def summarize_run(summary, capital_invested):
+    """
+    JSON-serializable headline numbers of a run_parallel summary: the probabilities, the NPV moments and the
+    approximate NPV percentiles (core.scenario.SUMMARY_PERCENTILES).
+    """
+    from core.scenario import SUMMARY_PERCENTILES
+
+    npv_stats = summary['npv_stats']
+    headline = {'n_samples': summary['n_samples'],
+                'prob_buy_better': float(summary['prob_buy_better']),
+                'prob_buying_fv_higher': float(summary['prob_buying_fv_higher'])}
+    headline.update({f'npv_{key}': float(value) for key, value in npv_stats.summary(capital_invested).items()})
+    quantiles = npv_stats.sketch.quantile(np.array(SUMMARY_PERCENTILES) / 100)
+    headline.update({f'npv_p{percentile}': float(value) for percentile, value in zip(SUMMARY_PERCENTILES, quantiles)})
+    headline.update({f'{key}_mean': float(moments.mean) for key, moments in summary['moments'].items() if key != 'buying_npv'})
+    return headline
+
+def main():
+    from core.scenario import build_model, make_distributions, resolve_scenario
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=float, default=10**8, help='Total samples, e.g. 1e8.')
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, the CPU count by default.')
+    parser.add_argument('--shard-size', type=int, default=10**6, help='Samples per shard; changes the random streams.')
+    parser.add_argument('--scenario', help='JSON file of core.scenario inputs, the app defaults by default.')
+    parser.add_argument('--save-dir', help='Also write every sample to this core.store results directory.')
+    args = parser.parse_args()
+
+    scenario = {}
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario = json.load(f)
+    try:
+        scenario = resolve_scenario(scenario)
+        model = build_model(scenario)
+        distributions = make_distributions(scenario)
+    except (ValueError, ArithmeticError) as error:
+        parser.error(str(error))
+    summary = run_parallel(model, distributions, int(args.samples), args.seed, args.workers, args.shard_size,
+                           adjust_for_inflation_bool = scenario['adjust_for_inflation_bool'], save_dir = args.save_dir)
+    print(json.dumps(summarize_run(summary, model.HOUSE_PRICE * model.DEPOSIT_MULT), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Path-dependent annual simulation with stochastic year-by-year rates.
+
+Instead of one constant rate per simulation and the closed-form annuities, each simulation follows its own path
+of mortgage rate, house price growth, rent growth and investment return, here mean-reverting AR(1) processes.
+The buy and rent portfolios are then rolled forward one year at a time over all simulations at once:
+
+- the mortgage is re-priced every year at that year's rate over the remaining term (a variable rate), and the
+  outstanding balance is repaid from the sale proceeds;
+- on the buying side, the rent saved minus the mortgage payment and the ongoing costs is invested (or, when
+  negative, funded) at that year's investment return;
+- on the renting side, the deposit, buying cost and stamp duty are invested at the same returns.
+
+With constant rates (a zero sd, and the mortgage rate equal to the investment return) the results are those of
+the closed-form model, with or without the inflation adjustment. run_path_simulation is the app's "Rate paths"
+engine.
+"""
+import numpy as np
+
+from core.distributions import as_distribution
+from core.simulation import run_at_median
+from core.tax import capital_gains_tax, stamp_duty
+
+PATH_RATES = ['mortgage_interest_annual', 'property_price_growth_annual', 'rent_increase', 'investment_return_annual']
+
+def simulate_ar1_paths(mean, sd, phi, n_sims, n_years, rng, dtype = np.float64, start = None):
+    """
+    Paths of a stationary AR(1) process: x_t = mean + phi * (x_{t-1} - mean) + e_t.
+
+    Args:
+    mean (float): Long-run mean.
+    sd (float): Stationary standard deviation, the innovations are scaled so that it stays constant over time.
+    phi (float): Persistence between 0 (independent years) and 1 (a constant rate per path).
+    n_sims (int): Number of paths.
+    n_years (int): Years per path.
+    rng (numpy.random.Generator): Random generator.
+    dtype (numpy dtype): float64, or float32 to halve the memory.
+    start (float, optional): Rate in the year before year 1. Drawn from the stationary distribution if None.
+
+    Returns:
+    numpy.ndarray: Array of shape (n_years, n_sims).
+    """
+    paths = np.empty((n_years, n_sims), dtype=dtype)
+    if start is None:
+        previous = mean + sd * rng.standard_normal(n_sims, dtype=dtype)
+    else:
+        previous = np.full(n_sims, start, dtype=dtype)
+    innovation_sd = sd * np.sqrt(1 - phi**2)
+    for t in range(n_years):
+        rng.standard_normal(n_sims, dtype=dtype, out=paths[t])
+        paths[t] *= innovation_sd
+        paths[t] += mean + phi * (previous - mean)
+        previous = paths[t]
+    return paths
+
+def run_paths(model, n_sims, processes, years_until_sell, rng = None, dtype = np.float64, adjust_for_inflation_bool = False, return_paths = False):
+    """
+    Simulate the buy and rent portfolios year by year along stochastic rate paths.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters (house price, deposit, costs, tax flags...).
+    n_sims (int): Number of simulated paths.
+    processes (dict): Maps each name in PATH_RATES to (mean, sd, phi), see simulate_ar1_paths.
+    years_until_sell (int or numpy.ndarray): Holding period, one value or one per path.
+    rng (numpy.random.Generator, optional): Random generator.
+    dtype (numpy dtype): float64, or float32 to halve the memory of the paths and the portfolio state.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money at model.inflation.
+    return_paths (bool): Also return the rate paths.
+
+    Returns:
+    dict: 'buying_npv', 'buying_fv', 'renting_fv', 'house_price_at_sale', 'mortgage_balance_at_sale' and
+    'years_until_sell', one value per path, plus 'paths' (name -> (n_years, n_sims) array) with return_paths.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    years_until_sell = np.broadcast_to(np.maximum(np.asarray(years_until_sell, dtype=int), 0), (n_sims,))
+    n_years = max(int(years_until_sell.max()), 1)
+    paths = {name: simulate_ar1_paths(*processes[name], n_sims, n_years, rng, dtype) for name in PATH_RATES}
+
+    stamp_duty_paid = stamp_duty(model.HOUSE_PRICE, model.TAX_YEAR, model.BUYER_TYPE) if model.STAMP_DUTY_BOL else 0
+    total_investment = model.BUYING_COST_FLAT + stamp_duty_paid + model.HOUSE_PRICE * model.DEPOSIT_MULT
+    house_value = np.full(n_sims, model.HOUSE_PRICE, dtype=dtype)
+    balance = np.full(n_sims, model.HOUSE_PRICE * (1 - model.DEPOSIT_MULT), dtype=dtype)
+    rent = np.full(n_sims, model.HOUSE_PRICE * model.RENTAL_YIELD, dtype=dtype)
+    ongoing_cost = model.HOUSE_PRICE * model.ONGOING_COST_MULT
+    buying_cash = np.zeros(n_sims, dtype=dtype)
+    renting_investment = np.full(n_sims, total_investment, dtype=dtype)
+    discount = np.ones(n_sims, dtype=dtype)
+    buying_pv_cash = np.zeros(n_sims, dtype=dtype)
+
+    at_sale = {key: np.empty(n_sims, dtype=dtype) for key in ['house_value', 'balance', 'buying_cash', 'renting_investment', 'discount', 'buying_pv_cash']}
+    def record_sales(year):
+        sold = years_until_sell == year
+        if sold.any():
+            for key, value in [('house_value', house_value), ('balance', balance), ('buying_cash', buying_cash),
+                               ('renting_investment', renting_investment), ('discount', discount), ('buying_pv_cash', buying_pv_cash)]:
+                at_sale[key][sold] = value[sold]
+
+    record_sales(0)
+    for t in range(n_years):
+        mortgage_rate = paths['mortgage_interest_annual'][t]
+        investment_return = paths['investment_return_annual'][t]
+        if t > 0:
+            rent *= 1 + paths['rent_increase'][t]
+        house_value *= 1 + paths['property_price_growth_annual'][t]
+        remaining_term = model.MORTGAGE_LENGTH - t
+        if remaining_term > 0:
+            payment = balance * mortgage_rate / (1 - (1 + mortgage_rate) ** -remaining_term)
+            balance *= 1 + mortgage_rate
+            balance -= payment
+        else:
+            payment = 0
+        net_cash_flow = rent - payment - ongoing_cost * (1 + model.inflation) ** t
+        buying_cash *= 1 + investment_return
+        buying_cash += net_cash_flow
+        renting_investment *= 1 + investment_return
+        discount /= 1 + investment_return
+        buying_pv_cash += discount * net_cash_flow
+        record_sales(t + 1)
+
+    house_value = at_sale['house_value']
+    # same order as the closed-form model: property CGT on the nominal gain, deducted before deflating the sale
+    # proceeds, while the investment is deflated first and taxed on its gain in today's money
+    inflation_factor = (1 + model.inflation) ** years_until_sell if adjust_for_inflation_bool else 1
+    cgt_property = 0
+    if model.CGT_BOL:
+        cgt_property = capital_gains_tax(house_value - model.HOUSE_PRICE, model.ANNUAL_SALARY, model.TAX_YEAR, asset='residential')
+    renting_investment = at_sale['renting_investment'] / inflation_factor
+    cgt_investment = 0
+    if model.CGT_INVESTMENT_BOL:
+        cgt_investment = capital_gains_tax(renting_investment - total_investment, model.ANNUAL_SALARY, model.TAX_YEAR, asset='other')
+    sale_proceeds = house_value - house_value * model.SELLING_COST_MULT - cgt_property - at_sale['balance']
+    buying_fv = (sale_proceeds + at_sale['buying_cash']) / inflation_factor
+    renting_fv = renting_investment - cgt_investment
+    buying_npv = at_sale['discount'] * sale_proceeds + at_sale['buying_pv_cash'] - total_investment
+    results = {'buying_npv': buying_npv,
+               'buying_fv': buying_fv,
+               'renting_fv': renting_fv,
+               'house_price_at_sale': house_value,
+               'mortgage_balance_at_sale': at_sale['balance'],
+               'years_until_sell': years_until_sell}
+    if return_paths:
+        results['paths'] = paths
+    return results
+
+def run_path_simulation(n_samples, model, pools, processes, adjust_for_inflation_bool = False, rng = None, dtype = np.float64):
+    """
+    Monte Carlo run along stochastic rate paths, returning the same results as core.simulation.run_simulation.
+
+    The holding period is drawn from pools['years_until_sell'] and the rates follow the AR(1) processes. Each rate
+    is reported as its average over the years until the sale, so the results can be shown and analysed like
+    those of the closed-form model. Afterwards the model is left evaluated at the median of each pool.
+
+    Args:
+    n_samples (int): Number of simulated paths.
+    model (Buy_or_Rent_Model): Model holding the fixed parameters.
+    pools (dict): Maps each name in PARAM_NAMES to its pool of values or its core.distributions.Distribution.
+    processes (dict): Maps each name in PATH_RATES to (mean, sd, phi), see simulate_ar1_paths.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    rng (numpy.random.Generator, optional): Random generator.
+    dtype (numpy dtype): float64, or float32 to halve the memory of the paths.
+
+    Returns:
+    dict: The results of run_paths plus the average of each rate in PATH_RATES, one array each.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    years_until_sell = as_distribution(pools['years_until_sell']).sample(rng, n_samples)
+    results = run_paths(model, n_samples, processes, years_until_sell, rng = rng, dtype = dtype,
+                        adjust_for_inflation_bool = adjust_for_inflation_bool, return_paths = True)
+    paths = results.pop('paths')
+    years_until_sell = results['years_until_sell']
+    held = np.arange(len(paths[PATH_RATES[0]]))[:, None] < years_until_sell
+    for name in PATH_RATES:
+        # a path sold in year 0 has no rates of its own, it reports its first year's
+        average = np.where(held, paths[name], 0).sum(axis=0) / np.maximum(years_until_sell, 1)
+        results[name] = np.where(years_until_sell > 0, average, paths[name][0])
+    run_at_median(model, pools, adjust_for_inflation_bool)
+    return results
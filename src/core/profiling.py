@@ -0,0 +1,147 @@
+"""
+Timing spans for finding where an app rerun spends its time.
+
+    with span('simulation'):
+        ...
+
+Spans nest, and each finished span records its duration and, with memory tracing on, the peak memory allocated
+above the level at its start (from tracemalloc). Finished spans are also logged as one JSON object per line on
+the 'buy_or_rent.profiling' logger, for aggregating across sessions.
+
+Profiling is off unless BUY_OR_RENT_PROFILE is set (BUY_OR_RENT_PROFILE_MEMORY=1 also traces memory, which
+slows numpy-heavy code noticeably). When it is off, span() returns a shared no-op context manager, so the
+instrumentation costs one ContextVar lookup per span.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import time
+import tracemalloc
+import uuid
+
+LOGGER_NAME = 'buy_or_rent.profiling'
+
+_NULL_SPAN = contextlib.nullcontext()
+_current = contextvars.ContextVar('buy_or_rent_profiler', default=None)
+
+class _Span():
+    def __init__(self, profiler, name) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.peak = 0
+
+    def __enter__(self):
+        stack = self.profiler._stack
+        self.path = '/'.join([span.name for span in stack] + [self.name])
+        if self.profiler.trace_memory:
+            self.memory_start, peak = tracemalloc.get_traced_memory()
+            # tracemalloc has a single peak, so hand what it has seen so far to the enclosing span before resetting it
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        stack = self.profiler._stack
+        stack.pop()
+        peak_memory = None
+        if self.profiler.trace_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_memory = self.peak - self.memory_start
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            tracemalloc.reset_peak()
+        self.profiler._record(self.path, self.start - self.profiler.started, duration, peak_memory)
+        return False
+
+class Profiler():
+    """
+    Collects the spans of one run (an app rerun, a batch job...).
+
+    Args:
+    enabled (bool): With False, span() is a no-op.
+    trace_memory (bool): Also record the peak memory of each span, starts tracemalloc if needed.
+    """
+    def __init__(self, enabled = True, trace_memory = False) -> None:
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.run_id = uuid.uuid4().hex
+        self.records = []
+        self.started = time.perf_counter()
+        self._stack = []
+        self._logger = logging.getLogger(LOGGER_NAME)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def _record(self, path, start, duration, peak_memory):
+        record = {'span': path, 'start': start, 'duration': duration, 'peak_memory': peak_memory}
+        self.records.append(record)
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(json.dumps({'event': 'span', 'run_id': self.run_id, **record}))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """
+        Spans aggregated by path, in the order they were first entered.
+
+        Returns:
+        list: One dict per path with 'span', 'count', 'total' and 'max' (seconds) and 'peak_memory' (bytes, or None).
+        """
+        rows = {}
+        for record in sorted(self.records, key=lambda record: record['start']):
+            row = rows.setdefault(record['span'], {'span': record['span'], 'count': 0, 'total': 0.0, 'max': 0.0, 'peak_memory': None})
+            row['count'] += 1
+            row['total'] += record['duration']
+            row['max'] = max(row['max'], record['duration'])
+            if record['peak_memory'] is not None:
+                row['peak_memory'] = max(row['peak_memory'] or 0, record['peak_memory'])
+        return list(rows.values())
+
+def start_profiling(enabled = None, trace_memory = None):
+    """
+    Start a new profiler for the current thread or task (one streamlit rerun), replacing the previous one.
+
+    Args:
+    enabled (bool, optional): Defaults to whether the BUY_OR_RENT_PROFILE environment variable is set.
+    trace_memory (bool, optional): Defaults to whether BUY_OR_RENT_PROFILE_MEMORY is set.
+
+    Returns:
+    Profiler: The new profiler.
+    """
+    if enabled is None:
+        enabled = os.environ.get('BUY_OR_RENT_PROFILE', '') not in ('', '0')
+    if trace_memory is None:
+        trace_memory = os.environ.get('BUY_OR_RENT_PROFILE_MEMORY', '') not in ('', '0')
+    profiler = Profiler(enabled, trace_memory)
+    logger = logging.getLogger(LOGGER_NAME)
+    if enabled and not logger.handlers:
+        # bare JSON lines, ready for a log shipper
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    _current.set(profiler)
+    return profiler
+
+def span(name):
+    """
+    Time a block with the profiler of the current thread or task, if one is running and enabled.
+    """
+    profiler = _current.get()
+    if profiler is None or not profiler.enabled:
+        return _NULL_SPAN
+    return _Span(profiler, name)
@@ -0,0 +1,149 @@
+import numpy as np
+
+from core.distributions import Distribution
+
+PARAM_NAMES = ['rent_increase', 'property_price_growth_annual', 'mortgage_interest_annual', 'investment_return_annual', 'years_until_sell']
+
+def get_rng(rng=None):
+    """
+    Return the generator to draw from. Falls back to the global numpy random state so that np.random.seed still applies.
+    """
+    if rng is None:
+        return np.random
+    return rng
+
+def sample_param_distribution(mean, std, samples, as_int = False, rng = None):
+    """
+    Draw a pool of normally distributed values for an uncertain parameter.
+
+    Args:
+    mean (float): Mean of the distribution.
+    std (float): Standard deviation. If it is not positive the pool is just the mean.
+    samples (int): Number of values to draw.
+    as_int (bool): Truncate the values to integers (e.g. for years).
+    rng (numpy.random.Generator, optional): Random generator, defaults to the global numpy random state.
+
+    Returns:
+    numpy.ndarray: The sampled pool.
+    """
+    if std <= 0:
+        return np.array([mean])
+    s = get_rng(rng).normal(mean, std, samples)
+    if as_int:
+        s = s.astype(int)
+    return s
+
+def draw_samples(n_samples, pools, rng = None, out = None):
+    """
+    Draw samples of every parameter, resampling pools with replacement and sampling distributions directly.
+
+    Args:
+    n_samples (int): Number of scenarios to draw.
+    pools (dict): Maps each name in PARAM_NAMES to its pool of values or its core.distributions.Distribution.
+    rng (numpy.random.Generator, optional): Random generator, defaults to the global numpy random state.
+    out (dict, optional): Preallocated arrays of n_samples values to draw into, one per name in PARAM_NAMES.
+
+    Returns:
+    dict: One array of n_samples values per parameter (the arrays of out, if given).
+    """
+    samples = {}
+    for name in PARAM_NAMES:
+        target = out[name] if out is not None else None
+        if isinstance(pools[name], Distribution):
+            samples[name] = pools[name].sample(rng, n_samples, out=target)
+        elif target is not None:
+            target[...] = get_rng(rng).choice(pools[name], n_samples)
+            samples[name] = target
+        else:
+            samples[name] = get_rng(rng).choice(pools[name], n_samples)
+    return samples
+
+def sample_dtype(pool):
+    """
+    dtype of the samples drawn from a pool or a distribution.
+    """
+    return pool.dtype if isinstance(pool, Distribution) else np.asarray(pool).dtype
+
+SAMPLING_METHODS = ['random', 'lhs', 'sobol', 'halton']
+
+def sample_uniform(n_samples, n_dims, method = 'random', rng = None):
+    """
+    Points in the unit hypercube, from a pseudo-random, Latin hypercube or scrambled Sobol/Halton design.
+
+    Args:
+    n_samples (int): Number of points. Sobol points are best balanced when this is a power of 2.
+    n_dims (int): Number of dimensions.
+    method (str): One of SAMPLING_METHODS.
+    rng (numpy.random.Generator, optional): Drives the draws and the scrambling.
+
+    Returns:
+    numpy.ndarray: Array of shape (n_samples, n_dims) with values in (0, 1).
+    """
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"method must be one of {SAMPLING_METHODS}")
+    if method == 'random':
+        u = get_rng(rng).random((n_samples, n_dims))
+    else:
+        import warnings
+        from scipy.stats import qmc
+
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2**31))
+        if method == 'lhs':
+            sampler = qmc.LatinHypercube(n_dims, seed=rng)
+        elif method == 'sobol':
+            sampler = qmc.Sobol(n_dims, scramble=True, seed=rng)
+        else:
+            sampler = qmc.Halton(n_dims, scramble=True, seed=rng)
+        with warnings.catch_warnings():
+            # Sobol warns when n_samples is not a power of 2, the points are still valid
+            warnings.simplefilter('ignore', UserWarning)
+            u = sampler.random(n_samples)
+    # the inverse normal CDF is infinite at exactly 0 or 1
+    return np.clip(u, 1e-12, 1 - 1e-12)
+
+def sample_parameters(n_samples, specs, method = 'random', antithetic = False, rng = None):
+    """
+    Sample the uncertain parameters directly from their distributions by the inverse CDF.
+
+    Args:
+    n_samples (int): Number of scenarios.
+    specs (dict): Maps each name in PARAM_NAMES to a core.distributions.Distribution, or to a (mean, std, as_int)
+        normal spec as passed to sample_param_distribution.
+    method (str): One of SAMPLING_METHODS.
+    antithetic (bool): Pair every point u with 1 - u, which mirrors each draw around the median (the mean of a
+        normal).
+    rng (numpy.random.Generator, optional): Random generator, defaults to the global numpy random state.
+
+    Returns:
+    dict: One array of n_samples values per parameter.
+    """
+    if antithetic:
+        u = sample_uniform(-(-n_samples // 2), len(PARAM_NAMES), method, rng)
+        u = np.concatenate([u, 1 - u])[:n_samples]
+    else:
+        u = sample_uniform(n_samples, len(PARAM_NAMES), method, rng)
+    return uniform_to_parameters(u, specs)
+
+def uniform_to_parameters(u, specs):
+    """
+    Map points in the unit hypercube, one column per name in PARAM_NAMES, to parameter values by the inverse CDF:
+    of the normal distribution for (mean, std, as_int) specs, of the distribution itself for Distribution specs.
+
+    Returns:
+    dict: One array per parameter.
+    """
+    from scipy.special import ndtri
+
+    samples = {}
+    for i, name in enumerate(PARAM_NAMES):
+        if isinstance(specs[name], Distribution):
+            samples[name] = specs[name].ppf(u[:, i])
+            continue
+        mean, std, as_int = specs[name]
+        if std <= 0:
+            values = np.full(len(u), float(mean))
+        else:
+            values = mean + std * ndtri(u[:, i])
+        samples[name] = values.astype(int) if as_int else values
+    return samples
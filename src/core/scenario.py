@@ -0,0 +1,231 @@
+"""
+Scenarios: the user-facing inputs of the app (prices and amounts in £, tax flags, the mean and sd of each
+uncertain parameter and the shape of their distributions) and their mapping onto Buy_or_Rent_Model, shared by
+app.py and the batch runner.
+"""
+import copy
+
+import numpy as np
+
+from core.amortization import MORTGAGE_MODELS
+from core.model import Buy_or_Rent_Model
+from core.distributions import DISTRIBUTION_SHAPES, from_moments
+from core.sampling import PARAM_NAMES, draw_samples
+from core.tax import BUYER_TYPES, DEFAULT_TAX_YEAR, TAX_YEARS
+
+# the app defaults; the amounts that scale with the house price are filled in by resolve_scenario
+SCENARIO_DEFAULTS = {'house_price': 300000,
+                     'mortgage_length': 30,
+                     'mortgage_model': 'annual',
+                     'mortgage_fixed_years': 0,
+                     'mortgage_initial_rate': None,
+                     'remortgage_fee': 0,
+                     'monthly_overpayment': 0,
+                     'stamp_duty_bol': False,
+                     'cgt_bol': False,
+                     'cgt_investment_bol': False,
+                     'tax_year': DEFAULT_TAX_YEAR,
+                     'buyer_type': 'standard',
+                     'buying_cost': 3000,
+                     'annual_income': 20000,
+                     'inflation': 0.02,
+                     'adjust_for_inflation_bool': False,
+                     'mortgage_interest_annual_mean': 0.055,
+                     'mortgage_interest_annual_std': 0.012,
+                     'property_price_growth_annual_mean': 0.03,
+                     'property_price_growth_annual_std': 0.01,
+                     'rent_increase_mean': 0.02,
+                     'rent_increase_std': 0.01,
+                     'investment_return_annual_mean': 0.06,
+                     'investment_return_annual_std': 0.02,
+                     'years_until_sell_mean': 15,
+                     'years_until_sell_std': 5,
+                     'distribution': 'normal'}
+PRICE_SCALED_DEFAULTS = {'monthly_rent': lambda house_price: int(house_price*0.043/12),
+                         'deposit': lambda house_price: int(0.4*house_price),
+                         'ongoing_cost': lambda house_price: int(house_price*0.006),
+                         'selling_cost': lambda house_price: int(house_price*0.02)}
+# inputs that switch branches of the model (inflation does once it is adjusted for) or select tax tables, so
+# scenarios can only be evaluated together if they agree on them
+FLAG_INPUTS = ['stamp_duty_bol', 'cgt_bol', 'cgt_investment_bol', 'adjust_for_inflation_bool']
+BRANCH_INPUTS = FLAG_INPUTS + ['inflation', 'tax_year', 'buyer_type', 'mortgage_model']
+# inputs that are names rather than numbers, with their allowed values
+CHOICE_INPUTS = {'tax_year': TAX_YEARS, 'buyer_type': BUYER_TYPES, 'distribution': DISTRIBUTION_SHAPES, 'mortgage_model': MORTGAGE_MODELS}
+SUMMARY_PERCENTILES = [10, 25, 50, 75, 90]
+
+def resolve_scenario(scenario):
+    """
+    Fill in the missing inputs of a scenario with the app defaults.
+
+    Raises:
+    ValueError: For unknown keys, so a typo in an input file does not silently fall back to a default, for
+        values that are not finite numbers or flags (or one of the CHOICE_INPUTS values), for a house price that
+        is not above 0 and for a mortgage shorter than a year.
+    """
+    known = set(SCENARIO_DEFAULTS) | set(PRICE_SCALED_DEFAULTS) | {'id'}
+    unknown = set(scenario) - known
+    if unknown:
+        raise ValueError(f"Unknown scenario inputs: {', '.join(sorted(unknown))}")
+    for key, value in scenario.items():
+        if key in CHOICE_INPUTS:
+            if value is not None and value not in CHOICE_INPUTS[key]:
+                raise ValueError(f"{key} must be one of {', '.join(CHOICE_INPUTS[key])}, got {value!r}")
+        elif key != 'id' and value is not None and not isinstance(value, (bool, int, float, np.number)):
+            raise ValueError(f"{key} must be a number, got {value!r}")
+        elif key != 'id' and value is not None and not np.isfinite(value):
+            raise ValueError(f"{key} must be a finite number, got {value!r}")
+    resolved = dict(SCENARIO_DEFAULTS)
+    resolved.update({key: value for key, value in scenario.items() if value is not None})
+    # the other amounts are converted to proportions of it
+    if not resolved['house_price'] > 0:
+        raise ValueError(f"house_price must be above 0, got {resolved['house_price']!r}")
+    if not resolved['mortgage_length'] >= 1:
+        raise ValueError(f"mortgage_length must be at least 1 year, got {resolved['mortgage_length']!r}")
+    for key, default in PRICE_SCALED_DEFAULTS.items():
+        if resolved.get(key) is None:
+            resolved[key] = default(resolved['house_price'])
+    return resolved
+
+def build_model(scenario):
+    """
+    Buy_or_Rent_Model for a resolved scenario. Rent, deposit and costs are entered in £ and converted to the
+    model's proportions of the house price.
+    """
+    house_price = scenario['house_price']
+    model = Buy_or_Rent_Model()
+    model.HOUSE_PRICE = house_price
+    model.DEPOSIT_MULT = scenario['deposit']/house_price
+    model.RENTAL_YIELD = (12 * scenario['monthly_rent'])/ house_price
+    model.MORTGAGE_LENGTH = scenario['mortgage_length']
+    model.MORTGAGE_MODEL = scenario['mortgage_model']
+    model.MORTGAGE_FIXED_YEARS = scenario['mortgage_fixed_years']
+    # no initial rate means the first deal is at the simulated rate too
+    model.MORTGAGE_INITIAL_RATE = np.nan if scenario['mortgage_initial_rate'] is None else scenario['mortgage_initial_rate']
+    model.REMORTGAGE_FEE = scenario['remortgage_fee']
+    model.MONTHLY_OVERPAYMENT = scenario['monthly_overpayment']
+    model.ANNUAL_SALARY = scenario['annual_income']
+    model.ONGOING_COST_MULT = scenario['ongoing_cost']/house_price
+    model.BUYING_COST_FLAT = scenario['buying_cost']
+    model.SELLING_COST_MULT = scenario['selling_cost']/house_price
+    model.STAMP_DUTY_BOL = scenario['stamp_duty_bol']
+    model.CGT_BOL = scenario['cgt_bol']
+    model.CGT_INVESTMENT_BOL = scenario['cgt_investment_bol']
+    model.TAX_YEAR = scenario['tax_year']
+    model.BUYER_TYPE = scenario['buyer_type']
+    model.inflation = scenario['inflation']
+    return model
+
+def param_specs(scenario):
+    """
+    (mean, sd, integer-valued) of each uncertain parameter, the specs core.sampling.sample_parameters takes.
+    """
+    return {name: (scenario[f'{name}_mean'], scenario[f'{name}_std'], name == 'years_until_sell') for name in PARAM_NAMES}
+
+def make_distributions(scenario):
+    """
+    The distributions of the uncertain parameters, of the scenario's shape, as the app sidebar builds them.
+
+    Raises:
+    ValueError: For a lognormal with a mean at or below 0.
+    """
+    return {name: from_moments(scenario['distribution'], mean, std, as_int) for name, (mean, std, as_int) in param_specs(scenario).items()}
+
+def summarize_scenario(results, typical_buying_fv, typical_renting_fv, capital_invested):
+    """
+    The headline numbers of a scenario: the verdict of the typical (median) scenario, as in the app, and the
+    distribution of the buying NPV over the samples.
+
+    Returns:
+    dict: 'verdict' ('buy' or 'rent'), 'prob_buy_better', 'prob_buying_fv_higher', 'npv_mean', 'npv_p10' ... 'npv_p90',
+    'typical_buying_fv' and 'typical_renting_fv'.
+    """
+    buying_npv = results['buying_npv']
+    summary = {'verdict': 'buy' if typical_buying_fv > typical_renting_fv else 'rent',
+               'prob_buy_better': float(np.mean(buying_npv > 0)),
+               'prob_buying_fv_higher': float(np.mean(results['buying_fv'] > results['renting_fv'])),
+               'npv_mean': float(np.mean(buying_npv)),
+               'npv_mean_pct': float(np.mean(buying_npv)/capital_invested*100)}
+    summary.update({f'npv_p{percentile}': float(value) for percentile, value in zip(SUMMARY_PERCENTILES, np.percentile(buying_npv, SUMMARY_PERCENTILES))})
+    summary.update({'typical_buying_fv': float(typical_buying_fv), 'typical_renting_fv': float(typical_renting_fv)})
+    return summary
+
+def _prepare_job(scenario, n_samples, seed):
+    # (model, samples) of a job: the samples the app would draw plus one row at the medians for the verdict
+    model = build_model(scenario)
+    distributions = make_distributions(scenario)
+    samples = draw_samples(n_samples, distributions, np.random.default_rng(seed))
+    # the typical scenario, as core.simulation.run_at_median evaluates it
+    typical = {name: distributions[name].median for name in PARAM_NAMES}
+    typical['years_until_sell'] = int(typical['years_until_sell'])
+    return model, {name: np.append(samples[name], typical[name]) for name in PARAM_NAMES}
+
+def _evaluate_group(prepared, adjust_for_inflation_bool):
+    # summaries of prepared jobs that agree on the BRANCH_INPUTS, in a single pass of the model
+    fixed_inputs = [name for name in Buy_or_Rent_Model.INPUT_PARAMS
+                    if name not in PARAM_NAMES and not name.endswith('_BOL') and name not in ('inflation', 'TAX_YEAR', 'BUYER_TYPE', 'MORTGAGE_MODEL')]
+    models = [scenario_model for scenario_model, _ in prepared]
+    sizes = [len(samples[PARAM_NAMES[0]]) for _, samples in prepared]
+    # a copy, so the models are left as built if the group has to be evaluated again job by job
+    model = copy.copy(models[0])
+    for name in fixed_inputs:
+        setattr(model, name, np.repeat([getattr(scenario_model, name) for scenario_model in models], sizes))
+    for name in PARAM_NAMES:
+        setattr(model, name, np.concatenate([samples[name] for _, samples in prepared]))
+    model.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
+    outputs = {key: np.broadcast_to(getattr(model, key), (sum(sizes),)) for key in ['buying_npv', 'buying_fv', 'renting_fv']}
+    summaries = []
+    start = 0
+    for scenario_model, size in zip(models, sizes):
+        end = start + size - 1
+        results = {key: values[start:end] for key, values in outputs.items()}
+        summaries.append(summarize_scenario(results, outputs['buying_fv'][end], outputs['renting_fv'][end],
+                                            scenario_model.HOUSE_PRICE * scenario_model.DEPOSIT_MULT))
+        start = end + 1
+    return summaries
+
+def _evaluate_alone(prepared, adjust_for_inflation_bool):
+    try:
+        return _evaluate_group([prepared], adjust_for_inflation_bool)[0]
+    except Exception as error:
+        return error
+
+def evaluate_scenarios(jobs):
+    """
+    Monte Carlo summaries of many scenarios, with one vectorized model evaluation per combination of the flags
+    and inflation (BRANCH_INPUTS).
+
+    Every scenario gets the samples the app would draw for it (draw_samples from make_distributions, with a
+    generator seeded with its seed) plus one row at the medians for the verdict, and the fixed inputs are
+    repeated along its rows, so the model evaluates all the scenarios of a group in a single pass.
+
+    A scenario that fails (e.g. a lognormal with a negative mean, or a house price of 0) does not fail the others:
+    its slot holds the exception instead, and if the failure only shows in the pass over its group, the jobs of
+    that group are evaluated again one by one.
+
+    Args:
+    jobs (list): (scenario, n_samples, seed) tuples, with scenarios from resolve_scenario.
+
+    Returns:
+    list: summarize_scenario dicts, or the exception raised by a failed scenario, in the order of jobs.
+    """
+    summaries = [None] * len(jobs)
+    groups = {}
+    for i, (scenario, n_samples, seed) in enumerate(jobs):
+        try:
+            prepared = _prepare_job(scenario, n_samples, seed)
+        except Exception as error:
+            summaries[i] = error
+            continue
+        groups.setdefault(tuple(scenario[name] for name in BRANCH_INPUTS), []).append((i, prepared))
+    for branch, members in groups.items():
+        adjust_for_inflation_bool = bool(branch[BRANCH_INPUTS.index('adjust_for_inflation_bool')])
+        try:
+            group_summaries = _evaluate_group([prepared for _, prepared in members], adjust_for_inflation_bool)
+        except Exception as error:
+            if len(members) == 1:
+                group_summaries = [error]
+            else:
+                group_summaries = [_evaluate_alone(prepared, adjust_for_inflation_bool) for _, prepared in members]
+        for (i, _), summary in zip(members, group_summaries):
+            summaries[i] = summary
+    return summaries
@@ -0,0 +1,79 @@
+"""
+Variance-based global sensitivity analysis (Sobol indices) of the model outputs.
+
+The first-order index of a parameter is the share of the output variance explained by that parameter alone,
+the total-order index also counts its interactions with the other parameters. Both are estimated from a
+Saltelli design: two independent sample matrices A and B plus, for every parameter i, the matrix AB_i that is
+A with column i taken from B. All N * (d + 2) rows are evaluated in one batch.
+"""
+import copy
+
+import numpy as np
+
+from core.sampling import PARAM_NAMES, sample_uniform, uniform_to_parameters
+
+SENSITIVITY_OUTPUTS = ['buying_npv', 'fv_difference']
+
+def _estimate_indices(f_a, f_b, f_ab, variance):
+    # Saltelli (2010) estimator for first order, Jansen (1999) for total order
+    first_order = np.mean(f_b * (f_ab - f_a), axis=-1) / variance
+    total_order = 0.5 * np.mean((f_a - f_ab)**2, axis=-1) / variance
+    return first_order, total_order
+
+def sobol_indices(model, specs, n_base = 2**13, n_bootstrap = 200, confidence = 0.95, method = 'sobol',
+                  adjust_for_inflation_bool = False, rng = None):
+    """
+    First- and total-order Sobol indices of the buying NPV and of buying_fv - renting_fv.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the fixed parameters. It is copied, not modified.
+    specs (dict): Maps each name in PARAM_NAMES to a core.distributions.Distribution, as the app and
+        core.scenario.make_distributions build them, or to a (mean, std, as_int) normal spec. The design is mapped
+        through their inverse CDFs (core.sampling.uniform_to_parameters).
+    n_base (int): Rows N of each base matrix; the model is evaluated N * (len(PARAM_NAMES) + 2) times.
+    n_bootstrap (int): Bootstrap resamples for the confidence intervals.
+    confidence (float): Confidence level of the intervals.
+    method (str): Design of the base matrices, see core.sampling.SAMPLING_METHODS.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    rng (numpy.random.Generator, optional): Random generator for the design and the bootstrap.
+
+    Returns:
+    dict: For each output in SENSITIVITY_OUTPUTS a dict with 'first_order' and 'total_order' (one value per
+    name in PARAM_NAMES) and 'first_order_ci' and 'total_order_ci' (arrays of shape (len(PARAM_NAMES), 2)).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    n_params = len(PARAM_NAMES)
+    u = sample_uniform(n_base, 2 * n_params, method, rng)
+    u_a, u_b = u[:, :n_params], u[:, n_params:]
+    u_ab = np.repeat(u_a[np.newaxis], n_params, axis=0)
+    for i in range(n_params):
+        u_ab[i, :, i] = u_b[:, i]
+    design = np.concatenate([u_a, u_b, u_ab.reshape(-1, n_params)])
+
+    results = copy.deepcopy(model).run_batch(**uniform_to_parameters(design, specs), adjust_for_inflation_bool = adjust_for_inflation_bool)
+    outputs = {'buying_npv': results['buying_npv'],
+               'fv_difference': results['buying_fv'] - results['renting_fv']}
+
+    bootstrap = rng.integers(0, n_base, (n_bootstrap, n_base))
+    tail = (1 - confidence) / 2 * 100
+    indices = {}
+    for name, values in outputs.items():
+        f_a = values[:n_base]
+        f_b = values[n_base:2 * n_base]
+        f_ab = values[2 * n_base:].reshape(n_params, n_base)
+        variance = np.var(np.concatenate([f_a, f_b]))
+        first_order, total_order = _estimate_indices(f_a, f_b, f_ab, variance)
+        first_order_ci = np.empty((n_params, 2))
+        total_order_ci = np.empty((n_params, 2))
+        boot_a = f_a[bootstrap]
+        boot_b = f_b[bootstrap]
+        boot_variance = np.var(np.concatenate([boot_a, boot_b], axis=1), axis=1)
+        for i in range(n_params):
+            boot_first, boot_total = _estimate_indices(boot_a, boot_b, f_ab[i][bootstrap], boot_variance)
+            first_order_ci[i] = np.percentile(boot_first, [tail, 100 - tail])
+            total_order_ci[i] = np.percentile(boot_total, [tail, 100 - tail])
+        indices[name] = {'first_order': first_order,
+                         'total_order': total_order,
+                         'first_order_ci': first_order_ci,
+                         'total_order_ci': total_order_ci}
+    return indices
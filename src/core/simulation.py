@@ -0,0 +1,60 @@
+import numpy as np
+from core.cache import make_key
+from core.distributions import as_distribution
+from core.factors import run_dedup
+from core.sampling import PARAM_NAMES, draw_samples, sample_parameters
+
+def run_simulation(n_samples, model, pools, adjust_for_inflation_bool = False, rng = None, sampling = None, incremental = None, factors = None):
+    """
+    Monte Carlo run of the model over the parameter pools.
+
+    Samples are drawn from the pools with replacement (or from the distributions) and evaluated in one batch.
+    Afterwards the model is left evaluated at the median of each pool, which is what the app shows as the
+    "typical" breakdown.
+
+    Args:
+    n_samples (int): Number of scenarios to simulate.
+    model (Buy_or_Rent_Model): Model holding the fixed parameters.
+    pools (dict): Maps each name in PARAM_NAMES to its pool of values or its core.distributions.Distribution.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    rng (numpy.random.Generator, optional): Random generator, defaults to the global numpy random state.
+    sampling (dict, optional): Keyword arguments for core.sampling.sample_parameters ('specs', 'method',
+        'antithetic'). If given, samples are drawn from the distributions instead of resampled from the pools.
+    incremental (core.graph.IncrementalModel, optional): Keeps the samples and the intermediate results between
+        calls (e.g. app reruns), so a call only redraws and recomputes what its changed inputs affect. The samples
+        are only reused with a seeded generator, identified by its state.
+    factors (core.factors.FactorTable, optional): Evaluate the model once per distinct combination of the sampled
+        values, with the factors memoized in this table (see core.factors.run_dedup). Pays off when parameters
+        have a zero sd or few distinct values; continuous samples fall back to the plain batch evaluation.
+
+    Returns:
+    dict: The sampled parameters plus 'buying_npv', 'buying_fv' and 'renting_fv', one array each.
+    """
+    def draw():
+        if sampling is None:
+            return draw_samples(n_samples, pools, rng)
+        return sample_parameters(n_samples, rng = rng, **sampling)
+    if incremental is None and factors is not None:
+        samples = draw()
+        results = run_dedup(model, samples, adjust_for_inflation_bool = adjust_for_inflation_bool, table = factors)
+    elif incremental is None:
+        samples = draw()
+        results = model.run_batch(**samples, adjust_for_inflation_bool = adjust_for_inflation_bool)
+    else:
+        key = None
+        if isinstance(rng, np.random.Generator):
+            key = make_key('samples', pools=pools, n_samples=n_samples, sampling=sampling, rng_state=rng.bit_generator.state)
+        samples = incremental.samples(key, draw)
+        results = incremental.run(model, samples, adjust_for_inflation_bool = adjust_for_inflation_bool)
+    results.update(samples)
+    run_at_median(model, pools, adjust_for_inflation_bool)
+    return results
+
+def run_at_median(model, pools, adjust_for_inflation_bool = False):
+    """
+    Evaluate the model at the median of each parameter pool or distribution, the "typical" scenario shown in the app.
+    """
+    for name in PARAM_NAMES:
+        setattr(model, name, as_distribution(pools[name]).median)
+    model.years_until_sell = int(model.years_until_sell)
+    model.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
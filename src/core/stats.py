@@ -0,0 +1,268 @@
+import numpy as np
+
+def skew(arr):
+    """
+    Sample skewness (biased estimator, same as scipy.stats.skew with the default bias=True).
+    """
+    arr = np.asarray(arr, dtype=float)
+    deviations = arr - arr.mean()
+    m2 = np.mean(deviations**2)
+    m3 = np.mean(deviations**3)
+    if m2 == 0:
+        return np.nan
+    return m3 / m2**1.5
+
+def calculate_percentiles(arr, capital_invested):
+    """
+    Calculate the 10th, 25th, 50th (median), 75th, 90th, and the percentile of the value closest to 0 in an array.
+    Also, add a column that represents the values as a percentage of capital invested.
+
+    Args:
+    arr (list or numpy.ndarray): Input array.
+    capital_invested (float): The amount of capital invested.
+
+    Returns:
+    pandas.DataFrame: A DataFrame with percentiles and value as a percentage of capital invested.
+    """
+    import pandas as pd
+
+    if not isinstance(arr, (list, np.ndarray)):
+        raise ValueError("Input must be a list or numpy.ndarray")
+
+    arr = np.asarray(arr, dtype=float)
+    percentiles = [10, 25, 50, 75, 90]
+    percentile_values = np.percentile(arr, percentiles)
+
+    # Find the value closest to 0
+    closest_value = arr[np.argmin(np.abs(arr))]
+
+    # Calculate the percentile of the closest value: its rank is the number of smaller values, no sort needed
+    index_of_closest = np.count_nonzero(arr < closest_value)
+    closest_percentile = (index_of_closest / (len(arr) - 1)) * 100
+
+    # Create the DataFrame with the "Value as % of Capital" column
+    data = {
+        'Percentile': percentiles + [closest_percentile],
+        'NPV': np.append(percentile_values, closest_value)
+    }
+
+    df = pd.DataFrame(data)
+    df['% return'] = (df['NPV'] / capital_invested) * 100
+
+    return df
+
+def summarize_npv(buying_npv, capital_invested):
+    """
+    Summary statistics of the buying NPV shown in the "Net Present Value Statistics" panel.
+
+    Returns:
+    dict: mean, std, skew (in £) and mean/std as % of the capital invested.
+    """
+    return RunningMoments().update(buying_npv).summary(capital_invested)
+
+class RunningMoments():
+    """
+    Running count, mean, variance and skew, updated a batch at a time (Welford/Chan/Pébay) and mergeable across batches.
+    """
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=float).ravel()
+        if batch.size == 0:
+            return self
+        other = RunningMoments()
+        other.count = batch.size
+        other.mean = batch.mean()
+        deviations = batch - other.mean
+        other.m2 = np.sum(deviations**2)
+        other.m3 = np.sum(deviations**3)
+        return self.merge(other)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.m3 = (self.m3 + other.m3 + delta**3 * self.count * other.count * (self.count - other.count) / count**2
+                   + 3 * delta * (self.count * other.m2 - other.count * self.m2) / count)
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        return self.std / np.sqrt(self.count) if self.count > 0 else np.nan
+
+    @property
+    def skew(self):
+        # biased, like skew() above
+        return np.sqrt(self.count) * self.m3 / self.m2**1.5 if self.m2 > 0 else np.nan
+
+    def summary(self, capital_invested):
+        """
+        The dict summarize_npv returns, with the population standard deviation like np.std.
+        """
+        std = np.sqrt(self.m2 / self.count) if self.count > 0 else np.nan
+        return {'mean': self.mean,
+                'mean_pct': self.mean/capital_invested*100,
+                'std': std,
+                'std_pct': std/capital_invested*100,
+                'skew': self.skew}
+
+class QuantileSketch():
+    """
+    KLL quantile sketch: approximate quantiles of a stream in O(k) memory, mergeable across batches and workers.
+
+    Items live in levels, an item at level h standing for 2**h of the original values. When the sketch is over
+    capacity the lowest full level is sorted and every other item, from a random offset, is promoted to the next
+    level. Capacities shrink geometrically towards the lower levels, so the sketch holds at most about 3k items
+    however long the stream, and the rank error of a quantile shrinks like 1/k (about 0.5% with the default k=200).
+    """
+    def __init__(self, k = 200, seed = None) -> None:
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3)**depth)))
+
+    def _compress(self):
+        # lazy compaction: only halve the lowest full level, and only while the sketch as a whole is over capacity
+        while sum(items.size for items in self.levels) > sum(self._capacity(level) for level in range(len(self.levels))):
+            level = next(level for level, items in enumerate(self.levels) if items.size >= self._capacity(level))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # an odd item out stays behind, the rest are halved
+            leftover = items.size % 2
+            self.levels[level] = items[:leftover]
+            promoted = items[leftover + self._rng.integers(2)::2]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=float).ravel()
+        if batch.size == 0:
+            return self
+        self.count += batch.size
+        self.min = min(self.min, batch.min())
+        self.max = max(self.max, batch.max())
+        self.levels[0] = np.concatenate([self.levels[0], batch])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0**h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """
+        Approximate quantiles, q in [0, 1] (scalar or array). The minimum and maximum are exact.
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        items, cumulative_weights = self._weighted_items()
+        index = np.searchsorted(cumulative_weights, q * cumulative_weights[-1], side='left')
+        values = items[np.clip(index, 0, items.size - 1)]
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, values))[()]
+
+    def rank(self, value):
+        """
+        Approximate fraction of the values that are below value.
+        """
+        if self.count == 0:
+            return np.nan
+        items, cumulative_weights = self._weighted_items()
+        index = np.searchsorted(items, value, side='left')
+        return cumulative_weights[index - 1] / cumulative_weights[-1] if index > 0 else 0.0
+
+class StreamingStats():
+    """
+    Everything the app reports about the buying NPV, accumulated batch by batch in bounded memory:
+    moments, a quantile sketch, the count of positive values and the value closest to zero.
+    Mergeable, so chunks, adaptive batches or worker shards can each keep their own and combine them.
+    """
+    def __init__(self, k = 200, seed = None) -> None:
+        self.moments = RunningMoments()
+        self.sketch = QuantileSketch(k, seed)
+        self.n_positive = 0
+        self.closest_to_zero = np.nan
+
+    def _update_closest(self, value):
+        if np.isnan(self.closest_to_zero) or abs(value) < abs(self.closest_to_zero):
+            self.closest_to_zero = value
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=float).ravel()
+        if batch.size == 0:
+            return self
+        self.moments.update(batch)
+        self.sketch.update(batch)
+        self.n_positive += int(np.count_nonzero(batch > 0))
+        self._update_closest(batch[np.argmin(np.abs(batch))])
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        self.n_positive += other.n_positive
+        if not np.isnan(other.closest_to_zero):
+            self._update_closest(other.closest_to_zero)
+        return self
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    @property
+    def prob_positive(self):
+        return self.n_positive / self.count if self.count > 0 else np.nan
+
+    def summary(self, capital_invested):
+        """
+        Same as summarize_npv on all the values seen.
+        """
+        return self.moments.summary(capital_invested)
+
+    def percentiles(self, capital_invested):
+        """
+        Same DataFrame as calculate_percentiles on all the values seen, with approximate percentiles.
+        """
+        import pandas as pd
+
+        percentiles = [10, 25, 50, 75, 90]
+        closest_percentile = self.sketch.rank(self.closest_to_zero) * 100
+        df = pd.DataFrame({'Percentile': percentiles + [closest_percentile],
+                           'NPV': np.append(self.sketch.quantile(np.array(percentiles) / 100), self.closest_to_zero)})
+        df['% return'] = (df['NPV'] / capital_invested) * 100
+        return df
@@ -0,0 +1,199 @@
+"""
+Columnar storage of simulation results, for keeping large runs and analysing them offline.
+
+A saved run is a directory with one .npy file per column (the sampled parameters and the outputs) and a
+metadata.json with the row count, the column dtypes and the parameter set and seed the run came from.
+metadata.json is written last, so a directory without it is an unfinished run. The .npy files are reopened
+memory-mapped, zero-copy, and the statistics (summarize_results) and core.density.kde_1d work through them in
+chunks, so a run of 10^8 rows can be summarized and plotted without ever being in RAM at once.
+
+Runs are written by the app's "Export Samples" panel and by python -m core.parallel --save-dir, and reloaded with
+load_results, or summarized from the command line:
+
+    python -m core.store DIR [--column buying_npv]
+"""
+import argparse
+import copy
+import json
+import os
+
+import numpy as np
+
+from core.sampling import draw_samples, sample_dtype
+from core.stats import StreamingStats
+
+FORMAT_VERSION = 1
+METADATA_FILE = 'metadata.json'
+
+def _to_json(obj):
+    if isinstance(obj, dict):
+        return {str(key): _to_json(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        return [_to_json(value) for value in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, 'to_dict'):
+        return {'distribution': repr(obj), **_to_json(obj.to_dict())}
+    return obj
+
+class ResultsWriter():
+    """
+    Write a results directory a batch at a time, straight into memory-mapped .npy files.
+
+    Args:
+    path (str): Directory to write, created if needed. Columns already in it are overwritten.
+    n_rows (int): Total number of rows that will be appended.
+    columns (dict): Maps column names to numpy dtypes.
+    metadata (dict, optional): JSON-serializable description of the run (parameters, seed...).
+    """
+    def __init__(self, path, n_rows, columns, metadata = None) -> None:
+        from numpy.lib.format import open_memmap
+
+        self.path = path
+        self.n_rows = n_rows
+        self.metadata = metadata or {}
+        self.position = 0
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, METADATA_FILE)):
+            os.remove(os.path.join(path, METADATA_FILE))
+        self.arrays = {name: open_memmap(os.path.join(path, f'{name}.npy'), mode='w+', dtype=dtype, shape=(n_rows,))
+                       for name, dtype in columns.items()}
+
+    def append(self, batch):
+        size = len(next(iter(batch.values())))
+        if self.position + size > self.n_rows:
+            raise ValueError(f"Appending {size} rows would exceed the {self.n_rows} rows of {self.path}")
+        for name, array in self.arrays.items():
+            array[self.position:self.position + size] = batch[name]
+        self.position += size
+
+    def mark_written(self, size):
+        """
+        Count size rows written to the files with write_rows, e.g. by worker processes, as appended.
+        """
+        if self.position + size > self.n_rows:
+            raise ValueError(f"{size} more rows would exceed the {self.n_rows} rows of {self.path}")
+        self.position += size
+
+    def close(self):
+        if self.position != self.n_rows:
+            raise ValueError(f"{self.path} has {self.position} of {self.n_rows} rows")
+        for array in self.arrays.values():
+            array.flush()
+        description = {'format_version': FORMAT_VERSION,
+                       'n_rows': self.n_rows,
+                       'columns': {name: array.dtype.str for name, array in self.arrays.items()},
+                       'metadata': _to_json(self.metadata)}
+        temporary = os.path.join(self.path, METADATA_FILE + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(description, f, indent=2)
+        os.replace(temporary, os.path.join(self.path, METADATA_FILE))
+        self.arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # an interrupted run is left without metadata.json, so it cannot be mistaken for a complete one
+        if exc_type is None:
+            self.close()
+        return False
+
+def write_rows(path, start, batch):
+    """
+    Write a batch of rows at row start into the columns of a results directory a ResultsWriter has created and not
+    yet closed. The columns are memory-mapped files, so processes can each write their own rows without passing
+    them through the one that owns the writer; it then counts them with ResultsWriter.mark_written.
+    """
+    for name, values in batch.items():
+        column = np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r+')
+        column[start:start + len(values)] = values
+        column.flush()
+
+def save_results(path, results, metadata = None):
+    """
+    Save a dict of equal-length arrays (e.g. the output of core.simulation.run_simulation) to a results directory.
+    """
+    results = {name: np.asarray(values) for name, values in results.items()}
+    with ResultsWriter(path, len(next(iter(results.values()))), {name: values.dtype for name, values in results.items()}, metadata) as writer:
+        writer.append(results)
+
+def load_results(path, mmap = True):
+    """
+    Open a results directory.
+
+    Args:
+    path (str): Directory written by save_results or ResultsWriter.
+    mmap (bool): Memory-map the columns read-only instead of reading them into memory.
+
+    Returns:
+    tuple: (columns, metadata), columns mapping each name to a 1-D array.
+    """
+    metadata_path = os.path.join(path, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        raise FileNotFoundError(f"{path} is not a complete results directory (no {METADATA_FILE})")
+    with open(metadata_path) as f:
+        description = json.load(f)
+    if description['format_version'] > FORMAT_VERSION:
+        raise ValueError(f"{path} was written by a newer version (format {description['format_version']})")
+    columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+               for name in description['columns']}
+    return columns, description['metadata']
+
+def simulate_to_disk(path, model, pools, n_samples, seed, chunk_size = 10**6, adjust_for_inflation_bool = False):
+    """
+    Monte Carlo run written to a results directory chunk by chunk, so its size is only limited by the disk.
+
+    The samples depend on the seed and the chunk size, both stored in the metadata with the model parameters
+    and the pools. The model is copied, not modified.
+
+    Returns:
+    str: path.
+    """
+    rng = np.random.default_rng(seed)
+    model = copy.deepcopy(model)
+    columns = {name: sample_dtype(pool) for name, pool in pools.items()}
+    columns.update({'buying_npv': float, 'buying_fv': float, 'renting_fv': float})
+    metadata = {'model': model.get_params(fixed_only=True), 'pools': pools, 'seed': seed, 'n_samples': n_samples,
+                'chunk_size': chunk_size, 'adjust_for_inflation_bool': adjust_for_inflation_bool}
+    with ResultsWriter(path, n_samples, columns, metadata) as writer:
+        for start in range(0, n_samples, chunk_size):
+            samples = draw_samples(min(chunk_size, n_samples - start), pools, rng)
+            batch = model.run_batch(**samples, adjust_for_inflation_bool = adjust_for_inflation_bool)
+            batch.update(samples)
+            writer.append(batch)
+    return path
+
+def summarize_results(columns, column = 'buying_npv', chunk_size = 2**22, seed = 0):
+    """
+    Stream one column of a (memory-mapped) results set through core.stats.StreamingStats.
+
+    Returns:
+    StreamingStats: With .percentiles(capital) and .summary(capital) as calculate_percentiles and summarize_npv.
+    """
+    values = columns[column]
+    stats = StreamingStats(seed = seed)
+    for start in range(0, len(values), chunk_size):
+        stats.update(values[start:start + chunk_size])
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a saved results directory.')
+    parser.add_argument('path', help='Directory written by save_results, simulate_to_disk or core.parallel --save-dir.')
+    parser.add_argument('--column', default='buying_npv')
+    args = parser.parse_args()
+    try:
+        columns, metadata = load_results(args.path)
+    except (FileNotFoundError, ValueError) as error:
+        parser.error(str(error))
+    if args.column not in columns:
+        parser.error(f"{args.path} has no column {args.column!r}, only {', '.join(columns)}")
+    stats = summarize_results(columns, args.column)
+    quantiles = stats.sketch.quantile(np.array([0.1, 0.25, 0.5, 0.75, 0.9]))
+    summary = {'n_rows': len(columns[args.column]), 'columns': list(columns), 'column': args.column,
+               'mean': stats.moments.mean, 'std': stats.moments.std, 'prob_positive': stats.prob_positive}
+    summary.update({f'p{percentile}': value for percentile, value in zip([10, 25, 50, 75, 90], quantiles)})
+    print(json.dumps(_to_json({'summary': summary, 'metadata': metadata}), indent=2))
+
+if __name__ == '__main__':
+    main()
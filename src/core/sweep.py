@@ -0,0 +1,122 @@
+"""
+Scenario grid sweeps: evaluate a Cartesian grid of fixed model inputs against one set of Monte Carlo samples.
+
+Grid values vary along the first axis and samples along the second, so every cell sees the same samples
+(common random numbers). The model is evaluated as amounts times factors (core.factors.evaluate_factors): the
+discount, compounding and annuity factors depend only on the samples, and on a swept input such as the mortgage
+length only through its few distinct values, so they are computed once per sample and shared by all the cells,
+and each cell only scales and sums them. Cells are processed in chunks sized to keep peak memory within a budget,
+in parallel over the available cores.
+
+A 100 x 100 grid against 10^4 samples takes ~5s on one core (~10s with CGT on the property, which is not a
+product of factors), divided by the number of cores.
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core.factors import evaluate_factors
+from core.sampling import PARAM_NAMES
+
+# rough peak memory per (cell, sample) evaluation: the ~20 amounts and intermediate sums of evaluate_factors,
+# plus the temporaries of the largest expression
+BYTES_PER_EVALUATION = 512
+
+class _SharedFactors():
+    # factor(function, *args) for core.factors.evaluate_factors over (cells, 1) inputs and (1, samples) samples:
+    # each factor row is computed once per distinct value of its per-cell arguments. Rows of the samples alone
+    # (a dozen at most) are kept for the whole sweep, rows of per-cell values only for the chunk, so they stay
+    # within the rows x samples memory the chunk is sized for
+    def __init__(self, samples) -> None:
+        self.sample_names = {id(values): name for name, values in samples.items()}
+        self.rows = {}
+
+    def __call__(self, function, *args):
+        arrays = [np.asarray(arg) for arg in args]
+        per_cell = [i for i, array in enumerate(arrays) if array.ndim == 2 and array.shape == (array.size, 1)]
+        shared = [i for i in range(len(arrays)) if i not in per_cell]
+        # anything else than the samples, per-cell inputs and scalars is computed as is
+        if any(arrays[i].size > 1 and id(args[i]) not in self.sample_names for i in shared):
+            return function(*args)
+        shared_key = tuple(self.sample_names[id(args[i])] if arrays[i].size > 1 else arrays[i].item() for i in shared)
+        if not per_cell:
+            return self._row(function, arrays, shared_key, (), ())
+        distinct, inverse = np.unique(np.column_stack([arrays[i].ravel() for i in per_cell]), axis=0, return_inverse=True)
+        rows = np.concatenate([self._row(function, arrays, shared_key, per_cell, tuple(values.tolist())) for values in distinct])
+        return rows[inverse.ravel()]
+
+    def end_chunk(self):
+        self.rows = {key: row for key, row in self.rows.items() if not key[2]}
+
+    def _row(self, function, arrays, shared_key, per_cell, values):
+        key = (function.__name__, shared_key, values)
+        if key not in self.rows:
+            args = list(arrays)
+            for i, value in zip(per_cell, values):
+                args[i] = value
+            self.rows[key] = np.atleast_2d(function(*args))
+        return self.rows[key]
+
+def _sweep_chunk(model, samples, cells, adjust_for_inflation_bool, factors = None):
+    n_samples = len(samples[PARAM_NAMES[0]][0])
+    chunk_shape = (len(next(iter(cells.values()))), n_samples)
+    for name, values in cells.items():
+        setattr(model, name, values[:, np.newaxis])
+    factors = factors if factors is not None else _SharedFactors(samples)
+    results = evaluate_factors(model, samples, adjust_for_inflation_bool, factors)
+    factors.end_chunk()
+    buying_npv = np.broadcast_to(results['buying_npv'], chunk_shape)
+    return {'prob_buy_wins': np.mean(buying_npv > 0, axis=1),
+            'median_npv': np.median(buying_npv, axis=1),
+            'mean_npv': np.mean(buying_npv, axis=1),
+            'prob_buying_fv_higher': np.mean(np.broadcast_to(results['buying_fv'] > results['renting_fv'], chunk_shape), axis=1)}
+
+def sweep(model, grid, samples, memory_budget = 256 * 2**20, adjust_for_inflation_bool = False, n_workers = None):
+    """
+    Evaluate every combination of grid values against the same samples of the uncertain parameters.
+
+    Args:
+    model (Buy_or_Rent_Model): Model holding the other fixed parameters. It is copied, not modified.
+    grid (dict): Maps fixed numeric model inputs (e.g. 'HOUSE_PRICE', 'DEPOSIT_MULT', 'RENTAL_YIELD',
+        'MORTGAGE_LENGTH') to 1-D arrays of values to try.
+    samples (dict): One array per name in PARAM_NAMES, e.g. from core.sampling.draw_samples or sample_parameters.
+    memory_budget (int): Approximate peak memory in bytes, shared by all workers; sets how many cells are
+        evaluated at once.
+    adjust_for_inflation_bool (bool): Whether to convert future values to today's money.
+    n_workers (int, optional): Processes evaluating chunks in parallel, defaults to the CPU count. With 1
+        everything runs in this process.
+
+    Returns:
+    dict: 'axes' (the grid), and 'prob_buy_wins' (P(buying NPV > 0)), 'median_npv', 'mean_npv' and
+    'prob_buying_fv_higher' (P(buying_fv > renting_fv)) surfaces, each shaped like the grid.
+    """
+    for name, values in grid.items():
+        if name not in model.INPUT_PARAMS or name in PARAM_NAMES:
+            raise ValueError(f"{name} is not a fixed model input")
+        if np.asarray(values).dtype == bool:
+            raise ValueError(f"{name} is a flag, sweep the scenarios with and without it separately")
+    axes = {name: np.asarray(values) for name, values in grid.items()}
+    mesh = np.meshgrid(*axes.values(), indexing='ij')
+    shape = mesh[0].shape
+    cells = {name: values.ravel() for name, values in zip(axes, mesh)}
+    n_cells = mesh[0].size
+    n_workers = n_workers or os.cpu_count()
+    n_samples = len(samples[PARAM_NAMES[0]])
+    cells_per_chunk = int(max(1, memory_budget // (n_workers * n_samples * BYTES_PER_EVALUATION)))
+
+    model = copy.deepcopy(model)
+    samples = {name: np.asarray(samples[name])[np.newaxis, :] for name in PARAM_NAMES}
+    chunks = [{name: values[start:start + cells_per_chunk] for name, values in cells.items()}
+              for start in range(0, n_cells, cells_per_chunk)]
+    if n_workers == 1 or len(chunks) == 1:
+        factors = _SharedFactors(samples)
+        results = [_sweep_chunk(model, samples, chunk, adjust_for_inflation_bool, factors) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_sweep_chunk, [model] * len(chunks), [samples] * len(chunks), chunks,
+                                        [adjust_for_inflation_bool] * len(chunks)))
+    surfaces = {key: np.concatenate([result[key] for result in results]).reshape(shape) for key in results[0]}
+    surfaces['axes'] = axes
+    return surfaces
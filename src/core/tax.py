@@ -0,0 +1,131 @@
+"""
+UK Stamp Duty Land Tax and Capital Gains Tax from band tables, per tax year.
+
+Every tax is a progressive schedule, a list of (lower threshold, marginal rate) bands. TaxBands precomputes the
+tax due at each threshold, so the tax of any amount is one searchsorted for its band plus one multiply-add,
+element-wise over whole arrays of samples. Updating the rates for a new tax year means adding a table entry,
+not touching the calculations.
+
+The tables hold the rates in force in England and Northern Ireland at the start of each tax year (6 April, or
+1 April for SDLT), so mid-year changes show up in the following year: the September 2022 SDLT cut is in 2023/24,
+and the additional-property surcharge rising to 5% and the other-assets CGT rates rising to 18%/24% in October
+2024 are in 2025/26.
+"""
+import numpy as np
+
+class TaxBands():
+    """
+    A progressive schedule: rates[i] applies to the part of an amount between thresholds[i] and thresholds[i+1].
+
+    Args:
+    bands (list): (lower threshold, marginal rate) pairs, in increasing order of threshold, the first at 0.
+    """
+    def __init__(self, bands) -> None:
+        self.thresholds = np.array([threshold for threshold, _ in bands], dtype=float)
+        self.rates = np.array([rate for _, rate in bands], dtype=float)
+        if self.thresholds[0] != 0 or np.any(np.diff(self.thresholds) <= 0):
+            raise ValueError('Band thresholds must start at 0 and increase')
+        # tax due on an amount equal to each threshold
+        self.cumulative = np.concatenate([[0.0], np.cumsum(np.diff(self.thresholds) * self.rates[:-1])])
+
+    def tax(self, amount):
+        """
+        Tax due on amount (scalar or array), 0 for amounts at or below 0.
+        """
+        amount = np.maximum(np.asarray(amount, dtype=float), 0)
+        band = np.searchsorted(self.thresholds, amount, side='right') - 1
+        # in place, as this runs on every sample of a simulation
+        tax = amount - self.thresholds.take(band)
+        tax *= self.rates.take(band)
+        tax += self.cumulative.take(band)
+        return tax[()]
+
+    def shifted(self, surcharge):
+        """
+        The same bands with surcharge added to every rate.
+        """
+        return TaxBands([(threshold, rate + surcharge) for threshold, rate in zip(self.thresholds, self.rates)])
+
+_SDLT_2023 = TaxBands([(0, 0.0), (250000, 0.05), (925000, 0.10), (1500000, 0.12)])
+_SDLT_2025 = TaxBands([(0, 0.0), (125000, 0.02), (250000, 0.05), (925000, 0.10), (1500000, 0.12)])
+
+def _sdlt_table(standard, first_time_buyer, first_time_buyer_max_price, additional_surcharge):
+    return {'standard': standard,
+            'first_time_buyer': first_time_buyer,
+            'first_time_buyer_max_price': first_time_buyer_max_price,
+            'additional': standard.shifted(additional_surcharge)}
+
+# SDLT residential rates; first-time buyer relief applies up to first_time_buyer_max_price, above which the standard
+# rates apply to the whole price, and the additional-property surcharge is added to every band from a price of 40,000
+SDLT_TABLES = {'2022/23': _sdlt_table(_SDLT_2025, TaxBands([(0, 0.0), (300000, 0.05)]), 500000, 0.03),
+               '2023/24': _sdlt_table(_SDLT_2023, TaxBands([(0, 0.0), (425000, 0.05)]), 625000, 0.03),
+               '2024/25': _sdlt_table(_SDLT_2023, TaxBands([(0, 0.0), (425000, 0.05)]), 625000, 0.03),
+               '2025/26': _sdlt_table(_SDLT_2025, TaxBands([(0, 0.0), (300000, 0.05)]), 500000, 0.05)}
+ADDITIONAL_PROPERTY_MIN_PRICE = 40000
+
+# CGT: the annual exempt amount, the personal allowance (tapered by 1 for every 2 of income above the taper
+# threshold), the basic rate band, and (basic, higher) rates by kind of asset
+CGT_TABLES = {'2022/23': {'annual_exempt_amount': 12300, 'personal_allowance': 12570, 'basic_rate_band': 37700,
+                          'rates': {'residential': (0.18, 0.28), 'other': (0.10, 0.20)}},
+              '2023/24': {'annual_exempt_amount': 6000, 'personal_allowance': 12570, 'basic_rate_band': 37700,
+                          'rates': {'residential': (0.18, 0.28), 'other': (0.10, 0.20)}},
+              '2024/25': {'annual_exempt_amount': 3000, 'personal_allowance': 12570, 'basic_rate_band': 37700,
+                          'rates': {'residential': (0.18, 0.24), 'other': (0.10, 0.20)}},
+              '2025/26': {'annual_exempt_amount': 3000, 'personal_allowance': 12570, 'basic_rate_band': 37700,
+                          'rates': {'residential': (0.18, 0.24), 'other': (0.18, 0.24)}}}
+PERSONAL_ALLOWANCE_TAPER_THRESHOLD = 100000
+
+TAX_YEARS = sorted(SDLT_TABLES)
+DEFAULT_TAX_YEAR = '2023/24'
+BUYER_TYPES = ['standard', 'first_time_buyer', 'additional']
+
+def _table(tables, tax_year):
+    try:
+        return tables[tax_year]
+    except KeyError:
+        raise ValueError(f"Unknown tax year {tax_year!r}, expected one of {', '.join(TAX_YEARS)}") from None
+
+def stamp_duty(price, tax_year = DEFAULT_TAX_YEAR, buyer_type = 'standard'):
+    """
+    SDLT on a residential purchase, element-wise over price.
+
+    Args:
+    price (float or numpy.ndarray): Purchase price.
+    tax_year (str): Key of SDLT_TABLES, e.g. '2023/24'.
+    buyer_type (str): 'standard', 'first_time_buyer' (relief below the table's maximum price) or 'additional'
+        (a second home or buy-to-let, with the surcharge on every band).
+    """
+    table = _table(SDLT_TABLES, tax_year)
+    price = np.asarray(price, dtype=float)
+    if buyer_type == 'standard':
+        return table['standard'].tax(price)
+    if buyer_type == 'first_time_buyer':
+        return np.where(price <= table['first_time_buyer_max_price'], table['first_time_buyer'].tax(price), table['standard'].tax(price))[()]
+    if buyer_type == 'additional':
+        if np.all(price >= ADDITIONAL_PROPERTY_MIN_PRICE):
+            return table['additional'].tax(price)
+        return np.where(price >= ADDITIONAL_PROPERTY_MIN_PRICE, table['additional'].tax(price), table['standard'].tax(price))[()]
+    raise ValueError(f"Unknown buyer type {buyer_type!r}, expected one of {', '.join(BUYER_TYPES)}")
+
+def capital_gains_tax(gains, annual_income, tax_year = DEFAULT_TAX_YEAR, asset = 'residential'):
+    """
+    CGT on gains realised in one tax year, element-wise over gains and income.
+
+    The gains above the annual exempt amount are stacked on top of the taxable income: the part that falls in
+    the remaining basic rate band is taxed at the basic rate and the rest at the higher rate. Losses pay nothing.
+
+    Args:
+    gains (float or numpy.ndarray): Gain on disposal (sale price less purchase price).
+    annual_income (float or numpy.ndarray): Income in the year of the sale, before the personal allowance.
+    tax_year (str): Key of CGT_TABLES.
+    asset (str): 'residential' property or 'other' assets (investments).
+    """
+    table = _table(CGT_TABLES, tax_year)
+    basic_rate, higher_rate = table['rates'][asset]
+    bands = TaxBands([(0, basic_rate), (table['basic_rate_band'], higher_rate)])
+    annual_income = np.asarray(annual_income, dtype=float)
+    personal_allowance = np.maximum(table['personal_allowance'] - np.maximum(annual_income - PERSONAL_ALLOWANCE_TAPER_THRESHOLD, 0) / 2, 0)
+    taxable_income = np.maximum(annual_income - personal_allowance, 0)
+    taxable_gains = np.maximum(np.asarray(gains, dtype=float) - table['annual_exempt_amount'], 0)
+    # bands.tax on income alone is the income tax bands counted at CGT rates, and cancels out
+    return (bands.tax(taxable_income + taxable_gains) - bands.tax(taxable_income))[()]
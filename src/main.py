@@ -1,162 +1,109 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import numpy_financial as npf
-from scipy.stats import norm, skew
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
-import seaborn as sns
-from utils.general import calculate_percentiles, bin_continuous_features, get_param_distribution
-from utils.finance import get_stamp_duty_next_home, annuity_pv, annuity_fv, annuity_payment, pv_future_payment, fv_present_payment
+from core.adaptive import run_adaptive
+from core.breakeven import solve_breakeven
+from core.cache import cached_call, make_key
+from core.optimize import DEFAULT_DEPOSIT_MULTS, DEFAULT_MORTGAGE_LENGTHS, OBJECTIVES, optimize_financing
+from core.paths import run_path_simulation
+from core.sampling import PARAM_NAMES
+from core.sensitivity import sobol_indices
+from core.simulation import run_simulation
+from core.density import kde_1d, kde_2d, split_at_zero
+from core.profiling import span
+from core.stats import calculate_percentiles, summarize_npv
+from utils.general import get_pyplot, figure_to_png
 
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
-matplotlib.rcParams["axes.formatter.limits"] = (-99, 99)
 
 def format_with_commas(x, pos):
     return '{:,.0f}'.format(x)
 
-class Buy_or_Rent_Model():
-    def __init__(self) -> None:
-        # PARAMS
-        # Fixed (in expectation)
-        self.HOUSE_PRICE = 800000 #including upfront repairs and renovations 
-        self.RENTAL_YIELD = 0.043 # assumed rent as a proportion of house price https://www.home.co.uk/company/press/rental_yield_heat_map_london_postcodes.pdf
-        self.DEPOSIT_MULT = 0.5
-        self.MORTGAGE_LENGTH = 30
-        self.BUYING_COST_FLAT = 3000 #https://www.movingcostscalculator.co.uk/calculator/
-        self.SELLING_COST_MULT = 0.02 #https://www.movingcostscalculator.co.uk/calculator/
-        self.ONGOING_COST_MULT = 0.006 # service charge + repairs, council tax and bills are omitted since they are the same whether buying or renting
-        self.ANNUAL_SALARY = 55000
-        self.CGT_ALLOWANCE = 6000
-        self.PERSONAL_ALLOWANCE = 12570
-        self.CGT_BOL = True
-        self.CGT_INVESTMENT_BOL = False
-        self.STAMP_DUTY_BOL = True
-        # Probability distribution
-        self.rent_increase = 0.01325 # historical: https://www.ons.gov.uk/economy/inflationandpriceindices/bulletins/indexofprivatehousingrentalprices/april2023
-        self.property_price_growth_annual = 0.025 # historical average = 0.034 over the last 8 year, adjusted down due to end to abnormally low interest rates; source for historical data: https://www.statista.com/statistics/620414/monthly-house-price-index-in-london-england-uk/
-        self.mortgage_interest_annual = 0.05
-        self.investment_return_annual = 0.06
-        self.years_until_sell = 20
-        # financial modelling params
-        self.inflation = 0.02 #on ongoing costs, also for converting fv
-        self.adjust_for_inflation = 0
+def plot_kde_from_list(arrays, st, figsize=(7, 2), main_colors = ['green'], secondary_color = 'red', legends = None, title = 'Net Present Value Probability Distribution', xlabel = 'Net Present Value For Property Purchase', cache = None, cache_key = None):
+    """
+    Plot the distribution of each array, shading values below zero in secondary_color.
 
-    def get_capital_gains_tax_property(self):
-        cgt = 0
-        if self.CGT_BOL:
-            taxable_gains = self.future_house_price - self.HOUSE_PRICE
-            if self.ANNUAL_SALARY > 50271:
-                cgt = taxable_gains * 0.28
-            else:
-                taxable_income = self.ANNUAL_SALARY - self.PERSONAL_ALLOWANCE
-                if taxable_gains - self.CGT_ALLOWANCE + taxable_income <= 50270:
-                    cgt = (taxable_gains - self.CGT_ALLOWANCE) * 0.18
-                else:
-                    cgt += (50271 - taxable_income) * 0.18
-                    cgt += (taxable_gains - self.CGT_ALLOWANCE - 50271) * 0.28
-        return cgt
-    
-    def get_capital_gains_tax_investment(self):
-        cgt = 0
-        if self.CGT_INVESTMENT_BOL:
-            taxable_gains = self.total_investment_fv - self.total_investment
-            if self.ANNUAL_SALARY > 50271:
-                cgt = taxable_gains * 0.2
-            else:
-                taxable_income = self.ANNUAL_SALARY - self.PERSONAL_ALLOWANCE
-                if taxable_gains - self.CGT_ALLOWANCE + taxable_income <= 50270:
-                    cgt = (taxable_gains - self.CGT_ALLOWANCE) * 0.1
-                else:
-                    cgt += (50271 - taxable_income) * 0.1
-                    cgt += (taxable_gains - self.CGT_ALLOWANCE - 50271) * 0.2
-        return cgt
-
-    def run_calculations(self, adjust_for_inflation_bool = False):
-        self.future_house_price = self.HOUSE_PRICE * (1+self.property_price_growth_annual)**self.years_until_sell
-        self.CGT = self.get_capital_gains_tax_property()
-        self.SELLING_COST = self.future_house_price * self.SELLING_COST_MULT + self.CGT
-        if adjust_for_inflation_bool:
-            self.adjust_for_inflation = self.inflation
-            # self.SELLING_COST = self.SELLING_COST / float(1+self.adjust_for_inflation)**(self.years_until_sell)
-            # self.future_house_price = self.future_house_price / float(1+self.adjust_for_inflation)**(self.years_until_sell)
-        self.monthly_rent = self.HOUSE_PRICE * self.RENTAL_YIELD /12
-        if self.STAMP_DUTY_BOL:
-            self.STAMP_DUTY = get_stamp_duty_next_home(self.HOUSE_PRICE)
-        else:
-            self.STAMP_DUTY = 0
-        self.discount_rate = self.investment_return_annual
-        self.DEPOSIT = self.HOUSE_PRICE * self.DEPOSIT_MULT
-        self.mortgage_calculations()
-        self.get_house_buying_npv()
-        self.get_house_buying_fv()
-        self.get_renting_fv()
-
-    def mortgage_calculations(self):
-        self.mortgage_amount = self.HOUSE_PRICE * (1 - self.DEPOSIT_MULT)
-        self.annual_mortgage_payment = annuity_payment(self.mortgage_amount, self.mortgage_interest_annual,self.MORTGAGE_LENGTH,0)
-        self.pv_mortage_payments = annuity_pv(self.annual_mortgage_payment, self.discount_rate, self.MORTGAGE_LENGTH, 0)
-        self.fv_mortgage_payments = pv_future_payment(annuity_fv(self.annual_mortgage_payment, self.discount_rate, self.MORTGAGE_LENGTH, 0), self.discount_rate, self.MORTGAGE_LENGTH - self.years_until_sell)/ float(1+self.adjust_for_inflation)**(self.years_until_sell)#annuity_fv(self.annual_mortgage_payment, self.discount_rate, self.MORTGAGE_LENGTH, 0)
+    If cache and cache_key (a key identifying the data in arrays) are given, the rendered figure is served from cache.
+    """
+    if cache is not None and cache_key is not None:
+        key = make_key('kde_plot', data=cache_key, figsize=figsize, main_colors=main_colors, secondary_color=secondary_color,
+                       legends=legends, title=title, xlabel=xlabel)
+        png = cache.get_or_compute(key, lambda: figure_to_png(make_kde_figure(arrays, figsize, main_colors, secondary_color, legends, title, xlabel)))
+        st.image(png, use_column_width=True)
+    else:
+        st.pyplot(make_kde_figure(arrays, figsize, main_colors, secondary_color, legends, title, xlabel))
 
-    def get_house_buying_npv(self):
-        self.pv_of_future_house_price = pv_future_payment(self.future_house_price, self.discount_rate, self.years_until_sell)
-        self.pv_of_selling_cost = pv_future_payment(self.SELLING_COST, self.discount_rate, self.years_until_sell)
-        self.pv_ongoing_cost = annuity_pv(self.HOUSE_PRICE * self.ONGOING_COST_MULT,self.discount_rate, self.years_until_sell, self.inflation)
-        # rent saved
-        self.pv_rent_saved = annuity_pv(self.HOUSE_PRICE*self.RENTAL_YIELD, self.discount_rate, self.years_until_sell, self.rent_increase)
-        # sum it up
-        self.buying_npv = self.pv_of_future_house_price + self.pv_rent_saved - self.pv_mortage_payments- self.pv_ongoing_cost - self.DEPOSIT  - self.BUYING_COST_FLAT - self.STAMP_DUTY - self.pv_of_selling_cost
+def plot_density(ax, grid, density, color):
+    # filled curve in the style of seaborn's kdeplot(fill=True)
+    if len(grid) < 2:
+        return None
+    ax.plot(grid, density, color=color)
+    return ax.fill_between(grid, density, color=color, alpha=0.25, linewidth=0)
 
-    def get_house_buying_fv(self): # not accounting for deposit,  immediate costs, and rent saved. ongoing costs and mortgage are rolled up and deducted from fv
-        if self.adjust_for_inflation > 0:
-            self.SELLING_COST = self.SELLING_COST / float(1+self.adjust_for_inflation)**(self.years_until_sell)
-            self.future_house_price = self.future_house_price / float(1+self.adjust_for_inflation)**(self.years_until_sell)
-        self.fv_ongoing_cost = annuity_fv(self.HOUSE_PRICE * self.ONGOING_COST_MULT,self.discount_rate, self.years_until_sell, self.inflation, adjust_for_inflation = self.adjust_for_inflation)
-        self.rent_fv = annuity_fv(self.HOUSE_PRICE*self.RENTAL_YIELD, self.discount_rate, self.years_until_sell, self.rent_increase, adjust_for_inflation = self.adjust_for_inflation)
-        self.buying_fv = self.future_house_price + self.rent_fv - self.SELLING_COST - self.fv_ongoing_cost -  self.fv_mortgage_payments
-        # self.buying_pv = self.pv_of_future_house_price + self.pv_rent_saved - self.pv_of_selling_cost - self.pv_ongoing_cost -  self.pv_mortage_payments
-        # self.buying_fv_inflation_adjusted = pv_future_payment(self.buying_fv, self.inflation, self.years_until_sell)
-
-    def get_renting_fv(self): # assumes that buying costs and stamp duty are invested, rent is rolled up and deducted
-        self.total_investment = self.BUYING_COST_FLAT + self.STAMP_DUTY + self.DEPOSIT
-        self.total_investment_fv = fv_present_payment(self.total_investment, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
-        # fv_buying_cost = fv_present_payment(self.BUYING_COST_FLAT, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
-        # fv_STAMP_DUTY = fv_present_payment(self.STAMP_DUTY, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
-        # deposit_fv = fv_present_payment(self.DEPOSIT, self.discount_rate, self.years_until_sell, adjust_for_inflation = self.adjust_for_inflation)
-        self.cgt_investment = self.get_capital_gains_tax_investment()
-        self.renting_fv = self.total_investment_fv - self.cgt_investment
-        # self.renting_pv = self.total_investment
-        # self.renting_fv_inflation_adjusted = pv_future_payment(self.renting_fv, self.inflation, self.years_until_sell)
-
-def plot_kde_from_list(arrays, st, figsize=(7, 2), main_colors = ['green'], secondary_color = 'red', legends = None, title = 'Net Present Value Probability Distribution', xlabel = 'Net Present Value For Property Purchase'):
+def make_kde_figure(arrays, figsize, main_colors, secondary_color, legends, title, xlabel):
+    import matplotlib.ticker as mticker
+    plt = get_pyplot()
     fig, ax = plt.subplots(figsize=figsize)
     x_lower = []
     x_higher = []
+    handles = []
     for num, array in enumerate(arrays):
-        # Plot the entire KDE plot in one color
-        sns.kdeplot(data=array, ax=ax, color=main_colors[num-1], fill=True, bw_adjust = 2, label='Entire KDE', clip=(0, None))
+        # one density estimate per array, split at zero for the shading
+        grid, density = kde_1d(array, bw_adjust = 2)
+        (grid_above, density_above), (grid_below, density_below) = split_at_zero(grid, density)
+        # Plot the KDE at or above 0 in one color
+        handles.append(plot_density(ax, grid_above, density_above, main_colors[num-1]))
 
         # Plot the shaded area to the left of 0 in a different color
-        sns.kdeplot(data=array, ax=ax, color=secondary_color, fill=True, bw_adjust = 2, label='Shaded Area', clip=(None, 0))
+        handles.append(plot_density(ax, grid_below, density_below, secondary_color))
         # x_low_percentile = np.percentile(array, 0.001)
         # x_high_percentile = np.percentile(array, 99)
         x_mean = np.mean(array)
         x_std = np.std(array)
         x_lower.append(x_mean-3*x_std)
         x_higher.append(x_mean+3*x_std)
+    ax.set_ylim(bottom=0)
+    ax.set_ylabel('Density')
     
     # Set the axis limits based on the 95th percentile
     ax.xaxis.set_major_formatter(mticker.FuncFormatter(format_with_commas))
     ax.set_xlim(np.min(x_lower), np.max(x_higher))
     ax.set_xlabel(xlabel)
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
+    ax.tick_params(axis='x', labelrotation=45)
     ax.set_title(title)
     if legends:
-        plt.legend(labels=legends)
-    st.pyplot(fig)
+        # one label per array, or for a single array one label each for above and below zero
+        legend_handles = handles if len(arrays) == 1 else handles[::2]
+        ax.legend([handle for handle in legend_handles if handle is not None],
+                  [label for handle, label in zip(legend_handles, legends) if handle is not None])
+    plt.close(fig)
+    return fig
+
+
+def run_adaptive_with_progress(model, pools, adaptive, adjust_for_inflation_bool=False, rng=None):
+    """
+    Run core.adaptive.run_adaptive with the keyword arguments in `adaptive`, showing the estimate after every batch.
+
+    Returns:
+    tuple: (results, status), status the last progress snapshot without its results, for show_adaptive_status.
+    """
+    placeholder = st.empty()
+    for progress in run_adaptive(model, pools, adjust_for_inflation_bool = adjust_for_inflation_bool, rng = rng, **adaptive):
+        if not progress['done']:
+            placeholder.markdown(f"*{adaptive_status_text(progress)}, refining...*")
+    placeholder.empty()
+    return progress['results'], {key: value for key, value in progress.items() if key != 'results'}
+
+def adaptive_status_text(progress):
+    low, high = progress['prob_ci']
+    return f"Buying is better {progress['prob_buy_better']*100:.1f}% of the time (95% confidence interval {low*100:.1f}% to {high*100:.1f}%), from {progress['n_samples']:,} samples"
 
+def show_adaptive_status(status):
+    """
+    The confidence interval and stop reason of an adaptive run, drawn on every rerun, including from the cache.
+    """
+    reason = 'target precision reached' if status['converged'] else 'time or sample limit reached'
+    st.markdown(f"<span style='font-size: 12px; font-style: italic;'>{adaptive_status_text(status)} in {status['elapsed']:.1f}s ({reason}).</span>", unsafe_allow_html=True)
 
 def generate_combinations_and_calculate_npv(
         n_combinations,
@@ -165,51 +112,55 @@ def generate_combinations_and_calculate_npv(
         property_price_growth_annual_list=[0.026],
         rent_increase_list=[0.01325],
         investment_return_annual_list=[0.06],
-        years_until_sell_list=[20]
+        years_until_sell_list=[20],
+        adjust_for_inflation_bool=False,
+        seed=None,
+        cache=None,
+        adaptive=None,
+        sampling=None,
+        incremental=None,
+        processes=None
         ):
-        buying_npv_list = []
-        buying_fv_list = []
-        renting_fv_list = []
-        mortgage_interest_annual_list_chosen=[]
-        property_price_growth_annual_list_chosen=[]
-        rent_increase_list_chosen=[]
-        investment_return_annual_list_chosen=[]
-        years_until_sell_list_chosen=[]
-        adjust_for_inflation_bool = st.toggle('Adjust for inflation (2% a year)')
-        # use_present_value = st.toggle('Use present value instead of future value')
+        import pandas as pd
 
-        for n in range(n_combinations):
+        pools = {'mortgage_interest_annual': mortgage_interest_annual_list,
+                 'property_price_growth_annual': property_price_growth_annual_list,
+                 'rent_increase': rent_increase_list,
+                 'investment_return_annual': investment_return_annual_list,
+                 'years_until_sell': years_until_sell_list}
 
-                model.rent_increase = np.random.choice(rent_increase_list)
-                model.property_price_growth_annual = np.random.choice(property_price_growth_annual_list)
-                model.mortgage_interest_annual = np.random.choice(mortgage_interest_annual_list)
-                model.investment_return_annual = np.random.choice(investment_return_annual_list)
-                model.years_until_sell = np.random.choice(years_until_sell_list)
-                
-                model.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
-                buying_npv_list.append(model.buying_npv)
-                buying_fv_list.append(model.buying_fv)
-                renting_fv_list.append(model.renting_fv)
-                mortgage_interest_annual_list_chosen.append(model.mortgage_interest_annual)
-                property_price_growth_annual_list_chosen.append(model.property_price_growth_annual)
-                rent_increase_list_chosen.append(model.rent_increase)
-                investment_return_annual_list_chosen.append(model.investment_return_annual)
-                years_until_sell_list_chosen.append(model.years_until_sell)
-        model.rent_increase = np.median(rent_increase_list)
-        model.property_price_growth_annual =  np.median(property_price_growth_annual_list)
-        model.mortgage_interest_annual =  np.median(mortgage_interest_annual_list)
-        model.investment_return_annual =  np.median(investment_return_annual_list)
-        model.years_until_sell =  int(np.median(years_until_sell_list))
-        model.run_calculations(adjust_for_inflation_bool = adjust_for_inflation_bool)
+        def simulate():
+            rng = np.random.default_rng(seed) if seed is not None else None
+            adaptive_status = None
+            with span('run_model'):
+                if processes is not None:
+                    results = run_path_simulation(n_combinations, model, pools, processes, adjust_for_inflation_bool = adjust_for_inflation_bool, rng = rng)
+                elif adaptive is None:
+                    results = run_simulation(n_combinations, model, pools, adjust_for_inflation_bool = adjust_for_inflation_bool, rng = rng, sampling = sampling, incremental = incremental)
+                else:
+                    results, adaptive_status = run_adaptive_with_progress(model, pools, adaptive, adjust_for_inflation_bool = adjust_for_inflation_bool, rng = rng)
+            with span('percentile_stats'):
+                return results, model, calculate_percentiles(results['buying_npv'], model.DEPOSIT), summarize_npv(results['buying_npv'], model.DEPOSIT), adaptive_status
+        # results are only reproducible, and so cacheable, when they come from a seeded generator
+        if seed is None:
+            cache = None
+        simulation_key = make_key('simulation', model=model.get_params(), pools=pools, n_combinations=n_combinations,
+                                  adjust_for_inflation_bool=adjust_for_inflation_bool, seed=seed, adaptive=adaptive, sampling=sampling, processes=processes)
+        with span('simulate'):
+            cached = cache.get(simulation_key) if cache is not None else None
+            if cached is None:
+                cached = simulate()
+                # an adaptive run stopped by the time limit depends on the machine's speed, not just on the seed
+                if cache is not None and (cached[4] is None or cached[4]['converged']):
+                    cache.put(simulation_key, cached)
+            results, model, percentiles_df, npv_summary, adaptive_status = cached
+        if adaptive_status is not None:
+            show_adaptive_status(adaptive_status)
+        buying_npv_list = results['buying_npv']
+        buying_fv_list = results['buying_fv']
+        renting_fv_list = results['renting_fv']
 
-        results_dict = {'buying_npv':buying_npv_list,
-                        'mortgage_interest_annual':mortgage_interest_annual_list_chosen,
-                        'property_price_growth_annual':property_price_growth_annual_list_chosen,
-                        'rent_increase':rent_increase_list_chosen,
-                        'investment_return_annual':investment_return_annual_list_chosen,
-                        'years_until_sell':years_until_sell_list_chosen}
-        results_df = pd.DataFrame(results_dict)
-        percentiles_df = calculate_percentiles(buying_npv_list,model.DEPOSIT)
+        results_df = pd.DataFrame({key: results[key] for key in ['buying_npv', 'buying_fv', 'renting_fv'] + list(pools)})
         # st.write(f'Capital Invested: £{model.DEPOSIT:.2f}')
         # st.write(f'Assumed Monthly Rent: £{model.monthly_rent:.2f}')
         # st.write(f'NPV mean: £{np.mean(buying_npv_list):.2f}')
@@ -235,6 +186,8 @@ def generate_combinations_and_calculate_npv(
                 st.markdown(f" - Selling cost (including Capital Gains Tax): :red[ -£{model.SELLING_COST:,.0f}]",help= "Total expenses incurred when selling a property. These costs typically include real estate agent commissions, legal fees, advertising expenses, and any necessary repairs or renovations to prepare the property for sale.")
                 st.markdown(f" - Total maintenance and service costs: :red[ -£{model.fv_ongoing_cost:,.0f}]",help="Future value at the time of sale for the total cost associated with maintaining and servicing a property, including expenses such as property management fees, maintenance fees, and other related charges. Assumed to grow at inflation rate. Future value is determined by the discount rate, which is assumed to be equal to the investment return.")
                 st.markdown(f" - Total Mortgage Payments: :red[ -£{model.fv_mortgage_payments:,.0f}]", help="This is higher than the sum of all mortgage payments since the payments are converted to their future value at the time of sale. Future value is determined by the discount rate, which is assumed to be equal to the investment return.")
+                if model.MORTGAGE_MODEL == 'monthly':
+                    st.markdown(f"   - Including the mortgage balance repaid from the sale: £{model.mortgage_balance_at_sale:,.0f}", help=f"First monthly payment £{model.annual_mortgage_payment / 12:,.0f}; interest paid until the sale £{model.mortgage_interest_paid:,.0f}; remortgage fees £{model.remortgage_fees_paid:,.0f}. Amounts in money of the time they are paid.")
                 st.markdown(f" - Total Rent Saved (future value at time of sale): :green[£{model.rent_fv:,.0f}]", help="This is higher than the sum of all rent payments that would have been paid since the payments are converted to their future value at the time of sale. Future value is determined by the discount rate, which is assumed to be equal to the investment return.")
         
         with left_column:
@@ -250,21 +203,129 @@ def generate_combinations_and_calculate_npv(
                 else:
                     st.markdown(f" - Assumed Typical Capital Growth: :red[£{model.renting_fv - (model.DEPOSIT + model.BUYING_COST_FLAT + model.STAMP_DUTY):,.0f}]")
         st.write('---')
-        plot_kde_from_list([buying_fv_list,renting_fv_list], st, figsize=(7, 2), legends = ['Buying', 'Renting'],main_colors = ['orange', 'blue'], title = 'Future Asset Value Probability Distribution', xlabel = 'Asset Value')
-        plot_kde_from_list([buying_npv_list], st, legends = ['Buying is better', 'Renting is better'],main_colors = ['blue'], secondary_color = 'orange', title = 'Net Present Value Probability Distribution', xlabel = 'Net Present Value For Property Purchase')
+        with span('plot_fv'):
+            plot_kde_from_list([buying_fv_list,renting_fv_list], st, figsize=(7, 2), legends = ['Buying', 'Renting'],main_colors = ['orange', 'blue'], title = 'Future Asset Value Probability Distribution', xlabel = 'Asset Value', cache = cache, cache_key = simulation_key)
+        with span('plot_npv'):
+            plot_kde_from_list([buying_npv_list], st, legends = ['Buying is better', 'Renting is better'],main_colors = ['blue'], secondary_color = 'orange', title = 'Net Present Value Probability Distribution', xlabel = 'Net Present Value For Property Purchase', cache = cache, cache_key = simulation_key)
         st.markdown("<span style='font-size: 14px; font-style: italic;'>Net Present Value represents the net gain/loss that result in purchasing the property in present value. If it is positive, then it is financially better to buy a property. Present value is calculated using a future discount rate equal to your assumed investment return. This is equivalent to assuming that any amount you save on rent or mortgage will be invested. </span>", unsafe_allow_html=True)
         # st.write("### Net Present Value Statistics")
         with st.expander("### Net Present Value Statistics", expanded=False):
             st.write(f'- Buying is better {100-percentiles_df.loc[5,"Percentile"]:.0f}% of the time')
-            st.write(f"- Mean: £{np.mean(buying_npv_list):,.0f}")
-            st.write(f"- Mean (as % of deposit): {np.mean(buying_npv_list)/model.DEPOSIT*100:.0f}%")
-            st.write(f"- Standard Deviation: £{np.std(buying_npv_list):,.0f}")
-            st.write(f"- Standard Deviation (as % of deposit): {np.std(buying_npv_list)/model.DEPOSIT*100:.0f}%")
-            st.write(f"- Skew: {skew(buying_npv_list):.2f}")
+            st.write(f"- Mean: £{npv_summary['mean']:,.0f}")
+            st.write(f"- Mean (as % of deposit): {npv_summary['mean_pct']:.0f}%")
+            st.write(f"- Standard Deviation: £{npv_summary['std']:,.0f}")
+            st.write(f"- Standard Deviation (as % of deposit): {npv_summary['std_pct']:.0f}%")
+            st.write(f"- Skew: {npv_summary['skew']:.2f}")
         return percentiles_df, results_df
 
+def display_sensitivity_indices(model, specs, adjust_for_inflation_bool=False, seed=None, cache=None):
+    """
+    Show the first- and total-order Sobol indices of the buying NPV and of the buying minus renting future value.
+    """
+    import pandas as pd
+
+    labels = {'rent_increase': 'Rent increase',
+              'property_price_growth_annual': 'Property price growth',
+              'mortgage_interest_annual': 'Mortgage interest rate',
+              'investment_return_annual': 'Investment return',
+              'years_until_sell': 'Years until sale'}
+    rng = np.random.default_rng(seed) if seed is not None else None
+    key = make_key('sobol_indices', model=model.get_params(fixed_only=True), specs=specs, adjust_for_inflation_bool=adjust_for_inflation_bool, seed=seed)
+    indices = cached_call(cache if seed is not None else None, key,
+                          lambda: sobol_indices(model, specs, adjust_for_inflation_bool = adjust_for_inflation_bool, rng = rng))
+    st.markdown("<span style='font-size: 14px; font-style: italic;'>Share of the variation in the result explained by each assumption on its own (first order) and including its interactions with the other assumptions (total). Brackets show 95% confidence intervals.</span>", unsafe_allow_html=True)
+    for output, title in [('buying_npv', 'Net Present Value For Property Purchase'), ('fv_difference', 'Buying minus Renting Future Asset Value')]:
+        table = pd.DataFrame({
+            'First order': [f"{value:.0%} [{low:.0%}, {high:.0%}]" for value, (low, high) in zip(indices[output]['first_order'], indices[output]['first_order_ci'])],
+            'Total': [f"{value:.0%} [{low:.0%}, {high:.0%}]" for value, (low, high) in zip(indices[output]['total_order'], indices[output]['total_order_ci'])],
+        }, index=[labels[name] for name in PARAM_NAMES])
+        st.write(f"**{title}**")
+        st.table(table)
+
+def display_breakeven(model, results_df, adjust_for_inflation_bool=False, cache=None, max_samples=20000):
+    """
+    Show the distribution over the simulated scenarios of the break-even property growth, rent and investment return.
+    """
+    import pandas as pd
+
+    samples = {name: results_df[name].to_numpy()[:max_samples] for name in PARAM_NAMES}
+    targets = [('property_price_growth_annual', 'Property price growth', lambda values: [f"{value:.2%}" for value in values]),
+               ('RENTAL_YIELD', 'Monthly rent', lambda values: [f"£{value * model.HOUSE_PRICE / 12:,.0f}" for value in values]),
+               ('investment_return_annual', 'Investment return', lambda values: [f"{value:.2%}" for value in values])]
+    percentiles = [10, 25, 50, 75, 90]
+    rows = {}
+    found = {}
+    for target, label, formatter in targets:
+        key = make_key('breakeven', model=model.get_params(fixed_only=True), samples=samples, target=target, adjust_for_inflation_bool=adjust_for_inflation_bool)
+        values = cached_call(cache, key, lambda: solve_breakeven(model, samples, target, adjust_for_inflation_bool = adjust_for_inflation_bool)['values'])
+        found[label] = np.mean(~np.isnan(values))
+        rows[label] = formatter(np.nanpercentile(values, percentiles)) if found[label] > 0 else ['-'] * len(percentiles)
+    st.markdown("<span style='font-size: 14px; font-style: italic;'>For each simulated scenario, the value at which buying and renting end up with the same future asset value, all other assumptions unchanged. Above the break-even growth or rent buying comes out ahead; above the break-even investment return renting usually does.</span>", unsafe_allow_html=True)
+    table = pd.DataFrame.from_dict(rows, orient='index', columns=[f"{percentile}th percentile" for percentile in percentiles])
+    table['Scenarios with a break-even'] = [f"{share:.0%}" for share in found.values()]
+    st.table(table)
+
+def display_financing_optimizer(model, results_df, objective='mean_npv', house_prices=None, adjust_for_inflation_bool=False, cache=None, max_samples=20000, top=10):
+    """
+    Show the deposits and mortgage lengths (and property prices) that do best on the simulated scenarios, next to the current choice.
+    """
+    import pandas as pd
+
+    samples = {name: results_df[name].to_numpy()[:max_samples] for name in PARAM_NAMES}
+    # the current choice is evaluated on the same samples, so the comparison with it is exact
+    deposit_mults = np.union1d(DEFAULT_DEPOSIT_MULTS, [model.DEPOSIT_MULT])
+    mortgage_lengths = np.union1d(DEFAULT_MORTGAGE_LENGTHS, [model.MORTGAGE_LENGTH])
+    house_prices = np.union1d([model.HOUSE_PRICE], house_prices if house_prices is not None else [])
+    params = {name: value for name, value in model.get_params(fixed_only=True).items() if name not in ('DEPOSIT_MULT', 'MORTGAGE_LENGTH')}
+    key = make_key('financing_optimizer', model=params, samples=samples, deposit_mults=deposit_mults, mortgage_lengths=mortgage_lengths,
+                   house_prices=house_prices, objective=objective, adjust_for_inflation_bool=adjust_for_inflation_bool)
+    candidates = cached_call(cache, key, lambda: optimize_financing(model, samples, deposit_mults, mortgage_lengths, house_prices, objective = objective,
+                                                                    adjust_for_inflation_bool = adjust_for_inflation_bool)['candidates'])
+    current = np.flatnonzero((candidates['DEPOSIT_MULT'] == model.DEPOSIT_MULT) & (candidates['MORTGAGE_LENGTH'] == model.MORTGAGE_LENGTH)
+                             & (candidates['HOUSE_PRICE'] == model.HOUSE_PRICE))[0]
+    st.markdown(f"<span style='font-size: 14px; font-style: italic;'>Every combination below is run on the same {len(samples[PARAM_NAMES[0]]):,} simulated scenarios, so the differences come from the choice alone. Ranked by {OBJECTIVES[objective].lower()}; frontier choices are those no other choice beats on both the mean NPV and the probability that buying wins.</span>", unsafe_allow_html=True)
+    if current == 0:
+        st.write("Your current deposit and mortgage length are already the best of those tried.")
+    else:
+        st.write(f"Your current choice ranks {current + 1} of {len(candidates['DEPOSIT_MULT'])}. The best is a deposit of £{candidates['DEPOSIT_MULT'][0] * candidates['HOUSE_PRICE'][0]:,.0f} ({candidates['DEPOSIT_MULT'][0]:.0%}) over {candidates['MORTGAGE_LENGTH'][0]} years, with a mean NPV of £{candidates['mean_npv'][0]:,.0f} (£{candidates['mean_npv'][0] - candidates['mean_npv'][current]:+,.0f}) and buying winning in {candidates['prob_buy_wins'][0]:.0%} of scenarios ({candidates['prob_buy_wins'][0] - candidates['prob_buy_wins'][current]:+.0%}).")
+    rows = list(range(min(top, len(candidates['DEPOSIT_MULT']))))
+    if current not in rows:
+        rows.append(current)
+    table = pd.DataFrame({'Deposit': [f"£{candidates['DEPOSIT_MULT'][i] * candidates['HOUSE_PRICE'][i]:,.0f} ({candidates['DEPOSIT_MULT'][i]:.0%})" for i in rows],
+                          'Mortgage length': [f"{candidates['MORTGAGE_LENGTH'][i]} years" for i in rows],
+                          'Property price': [f"£{candidates['HOUSE_PRICE'][i]:,.0f}" for i in rows],
+                          'Mean NPV': [f"£{candidates['mean_npv'][i]:,.0f}" for i in rows],
+                          'Median NPV': [f"£{candidates['median_npv'][i]:,.0f}" for i in rows],
+                          'Buying wins': [f"{candidates['prob_buy_wins'][i]:.0%}" for i in rows],
+                          'Frontier': ['yes' if candidates['on_frontier'][i] else '' for i in rows]},
+                         index=[f"{i + 1}{' (current)' if i == current else ''}" for i in rows])
+    if len(house_prices) == 1:
+        table = table.drop(columns='Property price')
+    st.table(table)
+
+def display_export(results_df, scenario, seed=None, adjust_for_inflation_bool=False):
+    """
+    Save the full sample matrix of the current run (the sampled parameters and the outputs) as a core.store results
+    directory, to reload with core.store.load_results or summarize with python -m core.store.
+    """
+    import os
+    from core.store import save_results
+
+    st.markdown(f"<span style='font-size: 14px; font-style: italic;'>Writes the {len(results_df):,} simulated scenarios, one .npy file per column, with the inputs and the seed in metadata.json.</span>", unsafe_allow_html=True)
+    path = st.text_input('Directory:', value=os.path.join('runs', f'run_seed{seed}' if seed is not None else 'run'))
+    if st.button('Save samples'):
+        try:
+            save_results(path, {name: results_df[name].to_numpy() for name in results_df.columns},
+                         metadata={'scenario': scenario, 'seed': seed, 'adjust_for_inflation_bool': adjust_for_inflation_bool})
+        except OSError as error:
+            st.error(f"Could not save to {path}: {error}")
+        else:
+            st.success(f"Saved {len(results_df):,} rows to {os.path.abspath(path)}")
+
 def graph_kde_plots(results_df, FEATURES, num_cols = 2):
-    
+    import matplotlib.ticker as mticker
+    plt = get_pyplot()
+
     # Calculate the number of rows and columns needed for subplots
     num_features = len(FEATURES)
     
@@ -283,7 +344,9 @@ def graph_kde_plots(results_df, FEATURES, num_cols = 2):
         col = i % num_cols
         ax = axes[row, col]
         
-        sns.kdeplot(data=results_df, x=feature, y="buying_npv", bw_adjust = 2, ax=ax, fill=True)
+        x_grid, y_grid, density = kde_2d(results_df[feature], results_df['buying_npv'], bw_adjust = 2)
+        # like seaborn, leave the lowest 5% of the density unfilled
+        ax.contourf(x_grid, y_grid, density, levels=np.linspace(0.05 * density.max(), density.max(), 10), cmap='Blues')
         ax.set_title(f"{feature} vs. buying_npv")
         ax.set_ylabel("buying_npv")
         ax.set_xlabel(feature)
@@ -0,0 +1,294 @@
+"""
+Local JSON HTTP service for the model.
+
+    python src/service.py [--port 8000] [--window-ms 5] [--max-batch 64]
+
+    POST /simulate  {"scenario": {"house_price": 500000, ...}, "n_samples": 2000, "seed": 123}
+    GET  /health
+    GET  /stats
+
+A scenario uses the input names of core.scenario, missing inputs take the app defaults, and the response is the
+summary the batch runner writes (core.scenario.summarize_scenario). Requests that arrive within --window-ms of each
+other, or while the previous batch is still being evaluated, are merged into one vectorized evaluation
+(core.scenario.evaluate_scenarios), which is much cheaper than running the model once per request. Responses are
+cached on the canonical scenario, sample count and seed, and identical requests in flight share one evaluation.
+
+Only the standard library is used for the server (asyncio streams, HTTP/1.1 with keep-alive and Content-Length
+bodies), so it is meant for localhost, not for exposing to a network.
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.cache import ResultCache, make_key
+from core.scenario import build_model, evaluate_scenarios, make_distributions, resolve_scenario
+
+DEFAULT_SAMPLES = 10000
+DEFAULT_SEED = 123
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+MAX_BODY = 2**20
+
+class RequestError(ValueError):
+    def __init__(self, message, status = 400) -> None:
+        super().__init__(message)
+        self.status = status
+
+class MicroBatcher():
+    """
+    Merges concurrent simulation requests into batches for core.scenario.evaluate_scenarios.
+
+    A batch is started by the first queued request and closed after `window` seconds or `max_batch` requests,
+    whichever comes first. Batches are evaluated one at a time in a worker thread, so the event loop keeps
+    accepting (and queueing) requests meanwhile and the batches grow with the load.
+
+    Args:
+    window (float): Seconds to wait for more requests after the first one of a batch.
+    max_batch (int): Maximum number of requests evaluated together.
+    max_batch_samples (int): Maximum total samples of a batch, bounding its memory.
+    cache (ResultCache, optional): Summaries of earlier requests. Disabled if None.
+    """
+    def __init__(self, window = 0.005, max_batch = 64, max_batch_samples = 2 * 10**6, cache = None) -> None:
+        self.window = window
+        self.max_batch = max_batch
+        self.max_batch_samples = max_batch_samples
+        self.cache = cache
+        self.counters = {'requests': 0, 'cache_hits': 0, 'inflight_hits': 0, 'batches': 0, 'batched_requests': 0,
+                         'evaluation_seconds': 0.0}
+        self._queue = None
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='simulate')
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=True)
+
+    async def simulate(self, scenario, n_samples, seed):
+        """
+        Summary of a resolved scenario, from the cache, from an identical request in flight or from the next batch.
+        """
+        self.counters['requests'] += 1
+        key = make_key('service_simulate', scenario=scenario, n_samples=n_samples, seed=seed)
+        if self.cache is not None:
+            summary = self.cache.get(key)
+            if summary is not None:
+                self.counters['cache_hits'] += 1
+                return summary
+        if key in self._inflight:
+            self.counters['inflight_hits'] += 1
+            return await asyncio.shield(self._inflight[key])
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self._queue.put_nowait((key, (scenario, n_samples, seed), future))
+        return await asyncio.shield(future)
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        n_samples = batch[0][1][1]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            if self._queue.empty():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            batch.append(item)
+            n_samples += item[1][1]
+            if n_samples >= self.max_batch_samples:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            tic = time.perf_counter()
+            try:
+                summaries = await loop.run_in_executor(self._executor, evaluate_scenarios, [job for _, job, _ in batch])
+            except Exception as error:
+                for key, _, future in batch:
+                    self._inflight.pop(key, None)
+                    future.set_exception(error)
+                continue
+            self.counters['batches'] += 1
+            self.counters['batched_requests'] += len(batch)
+            self.counters['evaluation_seconds'] += time.perf_counter() - tic
+            for (key, _, future), summary in zip(batch, summaries):
+                self._inflight.pop(key, None)
+                # a failed scenario fails its own request only
+                if isinstance(summary, Exception):
+                    future.set_exception(summary)
+                    continue
+                if self.cache is not None:
+                    self.cache.put(key, summary)
+                future.set_result(summary)
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['mean_batch_size'] = stats['batched_requests'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+def parse_simulate_request(body, max_samples):
+    """
+    (scenario, n_samples, seed) of a /simulate body, with the scenario resolved.
+
+    Raises:
+    RequestError: For malformed JSON and invalid inputs, including those the model or the distributions reject.
+    """
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError as error:
+        raise RequestError(f'Invalid JSON: {error}')
+    if not isinstance(payload, dict):
+        raise RequestError('The body must be a JSON object')
+    unknown = set(payload) - {'scenario', 'n_samples', 'seed'}
+    if unknown:
+        raise RequestError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    scenario = payload.get('scenario', {})
+    if not isinstance(scenario, dict):
+        raise RequestError('scenario must be a JSON object')
+    n_samples = payload.get('n_samples', DEFAULT_SAMPLES)
+    seed = payload.get('seed', DEFAULT_SEED)
+    if isinstance(n_samples, bool) or not isinstance(n_samples, int) or not 1 <= n_samples <= max_samples:
+        raise RequestError(f'n_samples must be an integer between 1 and {max_samples}')
+    if isinstance(seed, bool) or not isinstance(seed, int) or seed < 0:
+        raise RequestError('seed must be a non-negative integer')
+    scenario = {key: value for key, value in scenario.items() if key != 'id'}
+    try:
+        scenario = resolve_scenario(scenario)
+        # inputs the model cannot take (a house price of 0, a lognormal with a negative mean) are rejected here
+        # rather than failing in the batch
+        build_model(scenario)
+        make_distributions(scenario)
+    except (ValueError, ArithmeticError) as error:
+        raise RequestError(str(error))
+    return scenario, n_samples, seed
+
+class SimulationServer():
+    """
+    HTTP front end of a MicroBatcher.
+
+    Args:
+    batcher (MicroBatcher): Evaluates the simulations.
+    max_samples (int): Largest n_samples a request may ask for.
+    """
+    def __init__(self, batcher, max_samples = 10**6) -> None:
+        self.batcher = batcher
+        self.max_samples = max_samples
+        self.started = time.time()
+
+    async def route(self, method, path, body):
+        if path == '/simulate':
+            if method != 'POST':
+                raise RequestError('Use POST', 405)
+            scenario, n_samples, seed = parse_simulate_request(body, self.max_samples)
+            return await self.batcher.simulate(scenario, n_samples, seed)
+        if path == '/health':
+            if method != 'GET':
+                raise RequestError('Use GET', 405)
+            return {'status': 'ok'}
+        if path == '/stats':
+            if method != 'GET':
+                raise RequestError('Use GET', 405)
+            return dict(self.batcher.stats(), uptime=time.time() - self.started)
+        raise RequestError(f'No route {path}', 404)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+                length = int(headers.get('content-length', 0) or 0)
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': f'Bodies are limited to {MAX_BODY} bytes'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, response = 200, await self.route(method, path.split('?')[0], body)
+                except RequestError as error:
+                    status, response = error.status, {'error': str(error)}
+                except Exception as error:
+                    status, response = 500, {'error': f'{type(error).__name__}: {error}'}
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        try:
+            # NaN and infinity are not JSON, and strict clients reject them
+            body = json.dumps(payload, allow_nan=False).encode()
+        except ValueError:
+            status, body = 500, json.dumps({'error': 'The result is not a finite number'}).encode()
+        head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+async def serve(host = '127.0.0.1', port = 8000, window = 0.005, max_batch = 64, max_samples = 10**6, cache_entries = 4096):
+    batcher = MicroBatcher(window, max_batch, cache=ResultCache(max_entries=cache_entries) if cache_entries else None)
+    batcher.start()
+    server = SimulationServer(batcher, max_samples)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f'Serving on http://{host}:{port}', flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await batcher.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--window-ms', type=float, default=5.0, help='How long a batch waits for more requests.')
+    parser.add_argument('--max-batch', type=int, default=64, help='Maximum requests evaluated together.')
+    parser.add_argument('--max-samples', type=int, default=10**6, help='Largest n_samples a request may ask for.')
+    parser.add_argument('--cache-entries', type=int, default=4096, help='Cached responses, 0 disables the cache.')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.window_ms / 1000, args.max_batch, args.max_samples, args.cache_entries))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,23 @@
-import pandas as pd
 import numpy as np
-import seaborn as sns
-import pandas as pddef 
-import matplotlib.pyplot as plt
-import streamlit as st
-def calculate_percentiles(arr, capital_invested):
-    """
-    Calculate the 10th, 25th, 50th (median), 75th, 90th, and the percentile of the value closest to 0 in an array.
-    Also, add a column that represents the values as a percentage of capital invested.
+from core.cache import make_key
+from core.distributions import from_moments
+from core.profiling import span
 
-    Args:
-    arr (list or numpy.ndarray): Input array.
-    capital_invested (float): The amount of capital invested.
+def get_pyplot():
+    # matplotlib is only imported once something is actually plotted
+    import matplotlib
+    import matplotlib.pyplot as plt
+    matplotlib.rcParams["axes.formatter.limits"] = (-99, 99)
+    return plt
 
-    Returns:
-    pandas.DataFrame: A DataFrame with percentiles and value as a percentage of capital invested.
+def figure_to_png(fig):
     """
-    if not isinstance(arr, (list, np.ndarray)):
-        raise ValueError("Input must be a list or numpy.ndarray")
-
-    percentiles = [10, 25, 50, 75, 90]
-    percentile_values = np.percentile(arr, percentiles)
-
-    # Find the value closest to 0
-    closest_value = min(arr, key=lambda x: abs(x - 0))
-
-    # Calculate the percentile of the closest value
-    sorted_arr = np.sort(arr)
-    index_of_closest = np.where(sorted_arr == closest_value)[0][0]
-    closest_percentile = (index_of_closest / (len(sorted_arr) - 1)) * 100
-
-    # Create the DataFrame with the "Value as % of Capital" column
-    data = {
-        'Percentile': percentiles + [closest_percentile],
-        'NPV': np.append(percentile_values, closest_value)
-    }
-
-    df = pd.DataFrame(data)
-    df['% return'] = (df['NPV'] / capital_invested) * 100
-
-    return df
+    Render a matplotlib figure the way st.pyplot does, so the image can be cached instead of the figure.
+    """
+    import io
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', dpi=200)
+    return buffer.getvalue()
 
 def bin_continuous_features(df, bin_config):
     """
@@ -56,6 +34,7 @@ def bin_continuous_features(df, bin_config):
     - df: pandas DataFrame
         The DataFrame with binned features added as new columns.
     """
+    import pandas as pd
 
     for feature, bins in bin_config.items():
         # Create a new column with the binned values
@@ -63,16 +42,44 @@ def bin_continuous_features(df, bin_config):
 
     return df
 
-def get_param_distribution(mean, std, samples, bins,plot=True, as_int = False, title =''):
-    if std <=0:
-        return [mean]
-    s = np.random.normal(mean, std, samples)
-    if plot:
-        fig, ax = plt.subplots(figsize=(4, 1.7))
-        # plt.hist(s, bins, density=False)
-        sns.kdeplot(s,bw_adjust=5)
-        plt.title(title)
-        st.sidebar.pyplot(fig)
-    if as_int:
-        s=s.astype(int) 
-    return s
\ No newline at end of file
+def get_param_distribution(mean, std, shape = 'normal', as_int = False, plot = True, title = '', cache = None):
+    """
+    Build the distribution of an uncertain parameter (see core.distributions.from_moments) and plot it in the sidebar.
+
+    The plot is drawn from the analytic density (the probability mass, for integer parameters), so it only depends
+    on the distribution and the rendered image can be served from cache (a core.cache.ResultCache) on reruns.
+    A shape that does not fit the mean (a lognormal needs a positive mean) falls back to the normal distribution.
+    """
+    try:
+        distribution = from_moments(shape, mean, std, as_int)
+    except ValueError as error:
+        if plot:
+            import streamlit as st
+            st.sidebar.warning(f'{error}: using a normal distribution instead.')
+        distribution = from_moments('normal', mean, std, as_int)
+    if plot and std > 0:
+        import streamlit as st
+
+        def make_plot():
+            plt = get_pyplot()
+            fig, ax = plt.subplots(figsize=(4, 1.7))
+            low, high = distribution.plot_range()
+            if as_int:
+                values = np.arange(low, high + 1)
+                ax.bar(values, distribution.pmf(values), width=0.8)
+                ax.set_ylabel('Probability')
+            else:
+                x = np.linspace(low, high, 200)
+                ax.plot(x, distribution.pdf(x))
+                ax.set_ylabel('Density')
+            ax.set_ylim(bottom=0)
+            ax.set_title(title)
+            plt.close(fig)
+            return fig
+        with span('param_plot'):
+            if cache is not None:
+                png = cache.get_or_compute(make_key('param_plot', title=title, distribution=distribution), lambda: figure_to_png(make_plot()))
+                st.sidebar.image(png, use_column_width=True)
+            else:
+                st.sidebar.pyplot(make_plot())
+    return distribution